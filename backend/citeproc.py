@@ -14,18 +14,24 @@ from datetime import datetime
 from datetime import timedelta
 
 from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 
 from backend.doiprefixes import free_doi_prefixes
 from backend.pubtype_translations import CITEPROC_PUBTYPE_TRANSLATION
+from backend.utils import prefetch_in_background
 from backend.utils import request_retry
 from backend.utils import utf8_truncate
+from dissemin.settings import redis_client
 from papers.baremodels import BareName
 from papers.baremodels import BareOaiRecord
 from papers.baremodels import BarePaper
 from papers.doi import doi_to_crossref_identifier
 from papers.doi import doi_to_url
 from papers.doi import to_doi
+from papers.doicache import doi_cache
+from papers.httppool import get_session
+from papers.httppool import map_concurrently
 from papers.models import OaiSource
 from papers.models import OaiRecord
 from papers.models import Paper
@@ -104,6 +110,47 @@ class Citeproc():
         :returns: Paper object
         :raises: CiteprocError
         """
+        bare_paper = cls.to_bare_paper(data)
+
+        paper = Paper.from_bare(bare_paper)
+        paper.update_index()
+        return paper
+
+
+    @classmethod
+    def to_papers(cls, items):
+        """
+        Batched version of :meth:`to_paper`: converts a list of citeproc
+        metadata into papers, saving them with a fixed number of queries
+        for most of them. Invalid items are logged and skipped.
+        :param items: list of citeproc metadata
+        :returns: list of Paper objects (only the ones that were saved)
+        """
+        bare_papers = []
+        for item in items:
+            try:
+                bare_papers.append(cls.to_bare_paper(item))
+            except CiteprocError as e:
+                logger.debug(e)
+                logger.debug(item)
+            except ValueError as e:
+                logger.debug(e)
+                logger.debug(item)
+
+        papers = [p for p in Paper.from_bare_batch(bare_papers) if p is not None]
+        Paper.update_index_batch(papers)
+        return papers
+
+
+    @classmethod
+    def to_bare_paper(cls, data):
+        """
+        Converts citeproc metadata into a bare paper, with its OaiRecord.
+        This does not touch the papers in the database.
+        :param data: citeproc metadata
+        :returns: BarePaper object
+        :raises: CiteprocError
+        """
         if not isinstance(data, dict):
             raise CiteprocError('Invalid metadaformat, expecting dict')
         bare_paper_data = cls._get_paper_data(data)
@@ -114,9 +161,7 @@ class Citeproc():
         bare_paper.add_oairecord(bare_oairecord)
         bare_paper.update_availability()
 
-        paper = Paper.from_bare(bare_paper)
-        paper.update_index()
-        return paper
+        return bare_paper
 
 
     @staticmethod
@@ -459,11 +504,19 @@ class CrossRef(Citeproc):
     batch_length = 30
     emit_status_every = 10
     rows = 500
+    # Save each page of results in bulk rather than paper by paper
+    bulk_ingest = True
+    # Number of pages downloaded in advance while a page is saved, 0 disables prefetching
+    prefetch_pages = 2
+    # Redis set of the days fetched by a backfill that are not yet covered by last_update
+    ledger_key = 'crossref-days-done'
 
     @classmethod
-    def _fetch_day(cls, day):
+    def _fetch_pages(cls, day):
         """
-        Fetches a whole day from CrossRef
+        Follows the cursor of CrossRef for a given day
+        :param day: day to fetch
+        :returns: generator of tuples (total results, items of the page)
         """
         filters = {
             'from-update-date' : day.isoformat(),
@@ -482,8 +535,6 @@ class CrossRef(Citeproc):
         s = requests.Session()
         cursor = '*'
         total_results = 0
-        loop_runs = 0
-        new_papers = 0
         while cursor:
             params['cursor'] = cursor
             r = request_retry(
@@ -499,7 +550,28 @@ class CrossRef(Citeproc):
             cursor = jpath('message/next-cursor', r.json())
             items = jpath('message/items', r.json(), [])
             if len(items) == 0:
-                cursor = False
+                return
+            yield total_results, items
+
+    _prefetch = staticmethod(prefetch_in_background)
+
+    @classmethod
+    def _fetch_day(cls, day):
+        """
+        Fetches a whole day from CrossRef
+        """
+        pages = cls._fetch_pages(day)
+        if cls.prefetch_pages > 0:
+            pages = cls._prefetch(pages, cls.prefetch_pages)
+
+        total_results = 0
+        loop_runs = 0
+        new_papers = 0
+        for total_results, items in pages:
+            # Days can be saved in parallel: Paper.from_bare_batch saves again
+            # the papers that another day created in the meantime
+            if cls.bulk_ingest:
+                new_papers += len(cls.to_papers(items))
             else:
                 for item in items:
                     try:
@@ -558,10 +630,78 @@ class CrossRef(Citeproc):
                 logger.exception(e)
                 break
             else:
+                # A backfill may have moved last_update further in the meantime, so we go through the ledger
+                update_date = cls.record_day(update_date.date()) + timedelta(days=1)
+
+    @classmethod
+    def _days_done(cls):
+        """
+        :returns: set of days that have been fetched, but are not yet covered by last_update
+        """
+        return {date.fromisoformat(day.decode()) for day in redis_client.smembers(cls.ledger_key)}
+
+    @classmethod
+    def days_to_fetch(cls, until=None):
+        """
+        Lists the days after the last update that still need to be fetched
+        :param until: last day to fetch, defaults to yesterday
+        :returns: list of dates
+        """
+        if until is None:
+            until = date.today() - timedelta(days=1)
+        source = OaiSource.objects.get(identifier='crossref')
+        done = cls._days_done()
+        day = (source.last_update + timedelta(days=1)).date()
+        days = []
+        while day <= until:
+            if day not in done:
+                days.append(day)
+            day += timedelta(days=1)
+        return days
+
+    @classmethod
+    def fetch_backfill_day(cls, day):
+        """
+        Fetches a single day of a backfill. The days of a backfill can be fetched in any order and in parallel.
+        Once the day is fetched, it is recorded in the ledger and last_update is advanced as far as possible.
+        :param day: date to fetch
+        """
+        cls._fetch_day(day)
+        cls.record_day(day)
+
+    @classmethod
+    def record_day(cls, day):
+        """
+        Records a fetched day in the ledger and advances last_update as far as possible.
+        :param day: date that has been fetched
+        :returns: the new last_update
+        """
+        redis_client.sadd(cls.ledger_key, day.isoformat())
+        return cls.advance_last_update()
+
+    @classmethod
+    def advance_last_update(cls):
+        """
+        Moves last_update of CrossRef over all days of the ledger that directly follow it.
+        A day is only passed if all days before it have been fetched, so last_update never moves back.
+        The passed days leave the ledger once the new last_update is committed.
+        :returns: the new last_update
+        """
+        with transaction.atomic():
+            # We lock the source, so that concurrent tasks do not overwrite each other
+            source = OaiSource.objects.no_cache().select_for_update().get(identifier='crossref')
+            done = cls._days_done()
+            update_date = source.last_update + timedelta(days=1)
+            while update_date.date() in done:
                 source.last_update = update_date
-                source.save()
-                logger.info("Updated up to {}".format(update_date))
                 update_date += timedelta(days=1)
+            source.save()
+            # This includes days that were fetched again after last_update passed them
+            passed = [day.isoformat() for day in done if day <= source.last_update.date()]
+            if passed:
+                transaction.on_commit(lambda: redis_client.srem(cls.ledger_key, *passed))
+        logger.info("Updated up to {}".format(source.last_update))
+        return source.last_update
 
     @staticmethod
     def _filter_dois_by_comma(dois):
@@ -589,33 +729,13 @@ class CrossRef(Citeproc):
         # We filter DOIs with comma, we do not batch them, but return them as `None`
         dois_to_fetch = cls._filter_dois_by_comma(dois)
 
-        headers = {
-            'User-Agent' : settings.CROSSREF_USER_AGENT
-        }
-        url = 'https://api.crossref.org/works'
-        s = requests.Session()
-
-        while len(dois_to_fetch):
-            dois_batch = dois_to_fetch[:cls.batch_length]
-            dois_to_fetch = dois_to_fetch[cls.batch_length:]
-            params = {
-                'filter' : ','.join(['doi:{}'.format(doi) for doi in dois_batch]),
-                'mailto' : settings.CROSSREF_MAILTO,
-                'rows' : cls.batch_length,
-            }
-            try:
-                r = request_retry(
-                    url,
-                    params=params,
-                    headers=headers,
-                    session=s,
-                    retries=0, # There is probably a user waiting
-                )
-            except requests.exceptions.RequestException as e:
-                # We skip the DOIs since we could not reach
-                logger.info(e)
-                continue
-            items = jpath('message/items', r.json(), [])
+        batches = [
+            dois_to_fetch[i:i+cls.batch_length]
+            for i in range(0, len(dois_to_fetch), cls.batch_length)
+        ]
+        # The batches are downloaded concurrently, but the papers are
+        # created in this thread
+        for items in map_concurrently(cls._fetch_batch_items, batches):
             for item in items:
                 try:
                     p = cls.to_paper(item)
@@ -629,6 +749,36 @@ class CrossRef(Citeproc):
         return p
 
 
+    @classmethod
+    def _fetch_batch_items(cls, dois):
+        """
+        Fetches the metadata of at most `batch_length` DOIs
+        :param dois: list of DOIs
+        :returns: the list of items returned by CrossRef, empty if it could not be reached
+        """
+        headers = {
+            'User-Agent' : settings.CROSSREF_USER_AGENT
+        }
+        url = 'https://api.crossref.org/works'
+        params = {
+            'filter' : ','.join(['doi:{}'.format(doi) for doi in dois]),
+            'mailto' : settings.CROSSREF_MAILTO,
+            'rows' : cls.batch_length,
+        }
+        try:
+            r = request_retry(
+                url,
+                params=params,
+                headers=headers,
+                session=get_session(),
+                retries=0, # There is probably a user waiting
+            )
+        except requests.exceptions.RequestException as e:
+            # We skip the DOIs since we could not reach
+            logger.info(e)
+            return []
+        return jpath('message/items', r.json(), [])
+
     @staticmethod
     def remove_unapproved_characters(doi):
         """
@@ -660,14 +810,21 @@ class DOIResolver(Citeproc):
         :param doi: DOI to check
         :returns: True/False
         """
-        try:
-            return OaiRecord.objects.select_related('about').get(
-                doi=doi,
-                source__identifier='crossref',
-                last_update__gte=timezone.now() - settings.DOI_OUTDATED_DURATION
-            )
-        except OaiRecord.DoesNotExist:
+        records = OaiRecord.objects.select_related('about').filter(
+            doi=doi,
+            source__identifier='crossref',
+            last_update__gte=timezone.now() - settings.DOI_OUTDATED_DURATION
+        )
+        # If we know the paper of the DOI, we only look at its records
+        paper_id = doi_cache.get(doi)
+        if paper_id is not None:
+            records = records.filter(about_id=paper_id)
+        record = records.first()
+        if record is None:
             return None
+        # The paper will most likely be looked up by DOI again
+        doi_cache.set(doi, record.about_id)
+        return record
 
 
     @classmethod
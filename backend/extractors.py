@@ -63,16 +63,25 @@ class RegexExtractor(URLExtractor):
         """
         super(RegexExtractor, self).__init__()
         self.mappings = mappings
+        # When several values match, the last mapping wins, and for a given
+        # mapping, the last value wins: trying the mappings and the values
+        # in reverse order, the first match decides the URL of a resource type.
+        self.ranked_mappings = list(reversed(mappings))
 
     def _urls(self):
-
         urls = dict()
-        for (field, regex, resource_type, skeleton) in self.mappings:
-            for val in self.metadata[field]:
+        metadata = self.metadata
+        for (field, regex, resource_type, skeleton) in self.ranked_mappings:
+            if resource_type in urls:
+                continue
+            values = metadata[field]
+            if not values:
+                continue
+            for val in reversed(values):
                 val = val.strip()
-                match = regex.match(val)
-                if match:
+                if regex.match(val):
                     urls[resource_type] = regex.sub(skeleton, val)
+                    break
         return urls
 
 
@@ -126,8 +135,8 @@ class BaseExtractor(RegexExtractor):
             urls['splash'] = pmc_url
             urls['pdf'] = pmc_url
 
-        # Special case for DOIs
-        if urls.get('splash'):
+        # Special case for DOIs (they all start with '10.')
+        if urls.get('splash') and '10.' in urls['splash']:
             doi = to_doi(urls.get('splash'))
             if doi:
                 doi_prefix = doi.split('/')[0]
@@ -33,19 +33,79 @@ importing this module and running the function manually.
 from bulk_update.helper import bulk_update
 
 from papers.models import Name
+from papers.models import OaiRecord
 from papers.models import Paper
 from papers.models import Researcher
 from datetime import datetime
+from django.db import connections
+from django.db.models import Max
+from django.db.models import Min
 from elasticsearch.helpers import bulk
 from elasticsearch.exceptions import ConnectionTimeout
 from time import sleep
 import haystack
 from haystack.exceptions import SkipDocument
 from haystack.constants import ID
+import json
 import logging
+import os
+from multiprocessing import Pool
 
 logger = logging.getLogger('dissemin.' + __name__)
 
+def _get_search_backend(model):
+    """
+    :returns: the Haystack backend and the index of the model
+    """
+    using_backends = haystack.connection_router.for_write()
+    if len(using_backends) != 1:
+        raise ValueError("Don't know what search index to use")
+    engine = haystack.connections[using_backends[0]]
+    backend = engine.get_backend()
+    index = engine.get_unified_index().get_index(model)
+    return backend, index
+
+def _prepare_documents(backend, index, objs):
+    """
+    Converts instances to documents for the search engine
+    """
+    prefetched = getattr(index, 'prefetched', None)
+    if prefetched is not None:
+        with prefetched(objs):
+            return _prepare_each_document(backend, index, objs)
+    return _prepare_each_document(backend, index, objs)
+
+def _prepare_each_document(backend, index, objs):
+    prepped_docs = []
+    for obj in objs:
+        try:
+            prepped_data = index.full_prepare(obj)
+            final_data = {}
+
+            # Convert the data to make sure it's happy.
+            for key, value in list(prepped_data.items()):
+                final_data[key] = backend._from_python(value)
+            final_data['_id'] = final_data[ID]
+
+            prepped_docs.append(final_data)
+        except SkipDocument:
+            continue
+    return prepped_docs
+
+def _send_documents(backend, prepped_docs):
+    """
+    Sends documents to the search engine in bulk, retrying on timeouts
+    """
+    documents_sent = False
+    while not documents_sent:
+        try:
+            bulk(backend.conn, prepped_docs, index=backend.index_name, doc_type='modelresult')
+            documents_sent = True
+        except ConnectionTimeout as e:
+            logger.warning(e)
+            logger.info('retrying')
+            sleep(30)
+
 def update_index_for_model(model, batch_size=256, batches_per_commit=10, firstpk=0):
     """
     More efficient update of the search index for large models such as
@@ -56,12 +116,7 @@ def update_index_for_model(model, batch_size=256, batches_per_commit=10, firstpk
                     should commit to the search engine
     :param firstpk: the instance to start with.
     """
-    using_backends = haystack.connection_router.for_write()
-    if len(using_backends) != 1:
-        raise ValueError("Don't know what search index to use")
-    engine = haystack.connections[using_backends[0]]
-    backend = engine.get_backend()
-    index = engine.get_unified_index().get_index(model)
+    backend, index = _get_search_backend(model)
 
     qs = model.objects.order_by('pk')
     lastpk_object = list(model.objects.order_by('-pk')[:1])
@@ -80,32 +135,13 @@ def update_index_for_model(model, batch_size=256, batches_per_commit=10, firstpk
     while firstpk < lastpk:
         batch_number += 1
 
-        prepped_docs = []
-        for obj in qs.filter(pk__gt=firstpk)[:batch_size]:
-            firstpk = obj.pk
+        objs = list(qs.filter(pk__gt=firstpk)[:batch_size])
+        if not objs:
+            break
+        firstpk = objs[-1].pk
 
-            try:
-                prepped_data = index.full_prepare(obj)
-                final_data = {}
-
-                # Convert the data to make sure it's happy.
-                for key, value in list(prepped_data.items()):
-                    final_data[key] = backend._from_python(value)
-                final_data['_id'] = final_data[ID]
-
-                prepped_docs.append(final_data)
-            except SkipDocument:
-                continue
-
-        documents_sent = False
-        while not documents_sent:
-            try:
-                bulk(backend.conn, prepped_docs, index=backend.index_name, doc_type='modelresult')
-                documents_sent = True
-            except ConnectionTimeout as e:
-                logger.warning(e)
-                logger.info('retrying')
-                sleep(30)
+        prepped_docs = _prepare_documents(backend, index, objs)
+        _send_documents(backend, prepped_docs)
 
         indexed += len(prepped_docs)
         if batch_number % batches_per_commit == 0:
@@ -118,6 +154,109 @@ def update_index_for_model(model, batch_size=256, batches_per_commit=10, firstpk
             starttime = curtime
             indexed = 0
 
+def _init_reindex_worker():
+    """
+    Gives its own connections to the database and to the search engine
+    to a worker process of :func:`update_index_parallel`
+    """
+    connections.close_all()
+    for using in haystack.connection_router.for_write():
+        haystack.connections.reload(using)
+
+def _reindex_range(kwargs):
+    """
+    Indexes the instances of a model in a range of primary keys.
+
+    :param kwargs: dict with keys model, start, end (included), batch_size and checkpoint
+    :returns: the number of documents sent
+    """
+    backend, index = _get_search_backend(kwargs['model'])
+
+    firstpk = kwargs['start']
+    end = kwargs['end']
+    checkpoint = kwargs['checkpoint']
+    if checkpoint and os.path.exists(checkpoint):
+        with open(checkpoint, 'r') as f:
+            firstpk = max(firstpk, int(f.read().strip() or 0))
+
+    qs = kwargs['model'].objects.filter(pk__lte=end).order_by('pk')
+    indexed = 0
+    sent = 0
+    starttime = datetime.utcnow()
+    while firstpk < end:
+        objs = list(qs.filter(pk__gt=firstpk)[:kwargs['batch_size']])
+        if not objs:
+            break
+        firstpk = objs[-1].pk
+
+        prepped_docs = _prepare_documents(backend, index, objs)
+        _send_documents(backend, prepped_docs)
+        if checkpoint:
+            with open(checkpoint, 'w') as f:
+                f.write(str(firstpk))
+
+        indexed += len(prepped_docs)
+        sent += len(prepped_docs)
+        if indexed >= 5000:
+            curtime = datetime.utcnow()
+            rate = int(indexed / (curtime-starttime).total_seconds())
+            logger.info("%d obj/s, %d / %d" % (rate, firstpk, end))
+            starttime = curtime
+            indexed = 0
+    return sent
+
+def update_index_parallel(model, processes=4, batch_size=1000, checkpoint_dir=None):
+    """
+    Rebuilds the search index for a large model such as Paper, with several
+    worker processes. The range of primary keys is split in one contiguous
+    range per process. Related objects are prefetched for each batch when the
+    index supports it (see :meth:`papers.search_indexes.PaperIndex.prefetched`).
+
+    :param processes: the number of worker processes
+    :param batch_size: the number of instances to retrieve for each query
+    :param checkpoint_dir: a directory where the progress is stored. If it contains
+                    the progress of an interrupted run, the indexing is resumed.
+    """
+    manifest = None
+    if checkpoint_dir:
+        manifest = os.path.join(checkpoint_dir, 'ranges.json')
+
+    if manifest and os.path.exists(manifest):
+        with open(manifest, 'r') as f:
+            ranges = json.load(f)
+        logger.info('Resuming indexing of {} ranges'.format(len(ranges)))
+    else:
+        bounds = model.objects.aggregate(first=Min('pk'), last=Max('pk'))
+        if bounds['first'] is None: # No object in the model
+            return
+        first, last = bounds['first'] - 1, bounds['last']
+        step = (last - first) // processes + 1
+        ranges = [(start, min(start + step, last)) for start in range(first, last, step)]
+        if manifest:
+            with open(manifest, 'w') as f:
+                json.dump(ranges, f)
+
+    tasks = [{
+        'model' : model,
+        'start' : start,
+        'end' : end,
+        'batch_size' : batch_size,
+        'checkpoint' : os.path.join(checkpoint_dir, 'range-{}-{}'.format(start, end)) if checkpoint_dir else None,
+        } for start, end in ranges]
+
+    starttime = datetime.utcnow()
+    if processes == 1:
+        sent = sum(map(_reindex_range, tasks))
+    else:
+        # The workers must not share the connection of this process
+        connections.close_all()
+        with Pool(processes=processes, initializer=_init_reindex_worker) as pool:
+            sent = sum(pool.imap_unordered(_reindex_range, tasks))
+    backend, _ = _get_search_backend(model)
+    backend.conn.indices.refresh(index=backend.index_name)
+    duration = (datetime.utcnow() - starttime).total_seconds()
+    logger.info("Indexed %d documents in %d s, %d obj/s" % (sent, duration, sent / max(duration, 1)))
+
 def enumerate_large_qs(queryset, key='pk', batch_size=256, lastval=None):
     """
     Enumerates a large queryset (milions of rows) efficiently
@@ -137,6 +276,24 @@ def enumerate_large_qs(queryset, key='pk', batch_size=256, lastval=None):
             lastval = getattr(elem, key)
             yield elem
 
+def populate_oairecord_url_keys(batch_size=1000):
+    """
+    Computes the normalized URLs of the OaiRecords saved before
+    these keys were introduced. Until this has run, duplicate detection
+    falls back on computing the keys of these records on the fly.
+    Run it with the `populate_url_keys` management command.
+    """
+    qs = OaiRecord.objects.filter(splash_key__isnull=True).only('pk', 'splash_url', 'pdf_url')
+    batch = []
+    for record in enumerate_large_qs(qs, batch_size=batch_size):
+        record.update_url_keys()
+        batch.append(record)
+        if len(batch) >= batch_size:
+            OaiRecord.objects.bulk_update(batch, ['splash_key', 'pdf_key'])
+            batch = []
+    if batch:
+        OaiRecord.objects.bulk_update(batch, ['splash_key', 'pdf_key'])
+
 def update_availability():
     for paper in enumerate_large_qs(Paper.objects.filter(oa_status='UNK')):
         paper.update_availability()
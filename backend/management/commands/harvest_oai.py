@@ -0,0 +1,55 @@
+import logging
+
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.utils import timezone
+
+from backend.oai import OaiPaperSource
+from backend.tasks import harvest_oai_window
+from papers.models import OaiHarvestWindow
+from papers.models import OaiSource
+
+logger = logging.getLogger('dissemin.' + __name__)
+
+
+class Command(BaseCommand):
+    help = 'Harvest an OAI source, resuming the previous harvest if it was interrupted.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='Identifier of the OAI source')
+        parser.add_argument('--from', dest='from_date', default=None, help='Harvest records modified after that date (ISO format). Defaults to the last update of the source.')
+        parser.add_argument('--until', default=None, help='Harvest records modified before that date (ISO format). Defaults to the end of the pending harvest, or to now.')
+        parser.add_argument('--metadata-prefix', default='base_dc', help='The metadata format to harvest')
+        parser.add_argument('--windows', type=int, default=1, help='Number of date windows the harvest is split into')
+        parser.add_argument('--background', action='store_true', help='Harvest the windows in parallel, with celery workers')
+
+    def parse_date(self, value):
+        if value is None:
+            return None
+        dt = datetime.fromisoformat(value)
+        if timezone.is_naive(dt):
+            dt = timezone.make_aware(dt, timezone.utc)
+        return dt
+
+    def handle(self, *args, **options):
+        try:
+            source = OaiSource.objects.get(identifier=options['source'])
+        except OaiSource.DoesNotExist:
+            raise CommandError('No OAI source with identifier {}'.format(options['source']))
+
+        from_date = self.parse_date(options['from_date']) or source.last_update
+        until = self.parse_date(options['until'])
+        try:
+            if options['background']:
+                windows = OaiHarvestWindow.plan(source, from_date, until,
+                    options['metadata_prefix'], nb_windows=options['windows'])
+                for window in windows:
+                    harvest_oai_window.delay(window=window.pk)
+                logger.info('{} windows sent to the workers'.format(len(windows)))
+            else:
+                OaiPaperSource(source).harvest(from_date, until,
+                    metadataPrefix=options['metadata_prefix'], nb_windows=options['windows'])
+        except ValueError as e:
+            raise CommandError(str(e))
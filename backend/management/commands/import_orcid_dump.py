@@ -0,0 +1,42 @@
+import logging
+
+from multiprocessing import Pool
+from multiprocessing import cpu_count
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from backend.orcid import bulk_import_shard
+
+logger = logging.getLogger('dissemin.' + __name__)
+
+
+class Command(BaseCommand):
+    help = 'Import a dump of ORCID profiles in JSON, split in shards that are imported in parallel.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='The directory containing the JSON profiles')
+        parser.add_argument('--processes', type=int, default=cpu_count(), help='Number of worker processes')
+        parser.add_argument('--shards', type=int, default=None, help='Number of shards, defaults to the number of processes')
+        parser.add_argument('--batch-size', type=int, default=100, help='Number of researchers saved at once')
+        parser.add_argument('--manifest-dir', default=None, help='Directory where the imported files are listed, so that the import can be resumed')
+        parser.add_argument('--no-papers', action='store_true', help='Only import the researchers, not their papers')
+        parser.add_argument('--use-doi', action='store_true', help='Fetch the metadata of papers with a DOI from CrossRef')
+
+    def handle(self, *args, **options):
+        nb_shards = options['shards'] or options['processes']
+        tasks = [{
+            'directory' : options['directory'],
+            'fetch_papers' : not options['no_papers'],
+            'use_doi' : options['use_doi'],
+            'shard' : shard,
+            'nb_shards' : nb_shards,
+            'manifest_dir' : options['manifest_dir'],
+            'batch_size' : options['batch_size'],
+        } for shard in range(nb_shards)]
+
+        # The workers must not share the connection of this process
+        connections.close_all()
+        with Pool(processes=options['processes']) as pool:
+            for shard in pool.imap_unordered(bulk_import_shard, tasks):
+                logger.info('Shard {} of {} imported'.format(shard + 1, nb_shards))
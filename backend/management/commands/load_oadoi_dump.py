@@ -0,0 +1,48 @@
+import logging
+import os
+
+from multiprocessing import Pool
+from multiprocessing import cpu_count
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from backend.oadoi import load_dump_shard
+
+logger = logging.getLogger('dissemin.' + __name__)
+
+
+class Command(BaseCommand):
+    help = 'Load an Unpaywall dump, split in shards by DOI that are loaded in parallel.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('filename', help='The gzipped JSONL dump')
+        parser.add_argument('--processes', type=int, default=cpu_count(), help='Number of worker processes')
+        parser.add_argument('--shards', type=int, default=None, help='Number of shards, defaults to the number of processes')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Number of records looked up at once')
+        parser.add_argument('--checkpoint-dir', default=None, help='Directory where the progress of each shard is stored, so that the import can be resumed')
+        parser.add_argument('--no-index', action='store_true', help='Do not update the search index')
+        parser.add_argument('--no-create', action='store_true', help='Do not create papers for unknown DOIs')
+
+    def handle(self, *args, **options):
+        nb_shards = options['shards'] or options['processes']
+        tasks = []
+        for shard in range(nb_shards):
+            checkpoint = None
+            if options['checkpoint_dir']:
+                checkpoint = os.path.join(options['checkpoint_dir'], 'oadoi-{}-of-{}.checkpoint'.format(shard, nb_shards))
+            tasks.append({
+                'filename' : options['filename'],
+                'update_index' : not options['no_index'],
+                'create_missing_dois' : not options['no_create'],
+                'checkpoint' : checkpoint,
+                'chunk_size' : options['chunk_size'],
+                'shard' : shard,
+                'nb_shards' : nb_shards,
+            })
+
+        # The workers must not share the connection of this process
+        connections.close_all()
+        with Pool(processes=options['processes']) as pool:
+            for shard in pool.imap_unordered(load_dump_shard, tasks):
+                logger.info('Shard {} of {} loaded'.format(shard + 1, nb_shards))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from backend.maintenance import populate_oairecord_url_keys
+
+
+class Command(BaseCommand):
+    help = 'Compute the normalized URLs of the OAI records saved before they were introduced. It can be interrupted and run again.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of records updated at once')
+
+    def handle(self, *args, **options):
+        populate_oairecord_url_keys(batch_size=options['batch_size'])
@@ -0,0 +1,27 @@
+import logging
+
+from multiprocessing import cpu_count
+
+from django.core.management.base import BaseCommand
+
+from backend.maintenance import update_index_parallel
+from papers.models import Paper
+
+logger = logging.getLogger('dissemin.' + __name__)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the search index of papers with several worker processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=cpu_count(), help='Number of worker processes')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of papers sent in each bulk request')
+        parser.add_argument('--checkpoint-dir', default=None, help='Directory where the progress of each worker is stored, so that the indexing can be resumed')
+
+    def handle(self, *args, **options):
+        update_index_parallel(
+            Paper,
+            processes=options['processes'],
+            batch_size=options['batch_size'],
+            checkpoint_dir=options['checkpoint_dir'],
+        )
@@ -4,7 +4,10 @@
 import gzip
 import json
 import logging
+import re
+import zlib
 from django.db import DataError
+from django.db import connections
 
 from papers.models import Paper
 from papers.models import OaiSource
@@ -12,12 +15,36 @@ from papers.baremodels import BareOaiRecord
 from papers.doi import doi_to_crossref_identifier
 from papers.doi import doi_to_url
 from papers.doi import to_doi
+from papers.doicache import doi_cache
 from backend.doiprefixes import free_doi_prefixes
 from papers.errors import MetadataSourceException
 from backend.utils import report_speed
 
 logger = logging.getLogger('dissemin.' + __name__)
 
+# Finds the DOI of a line of the dump without parsing the whole JSON
+doi_in_line_re = re.compile(rb'"doi"\s*:\s*"([^"]*)"')
+
+
+def doi_shard(doi, nb_shards):
+    """
+    Assigns a DOI to one of nb_shards shards. This does not depend on the process, unlike hash().
+    """
+    return zlib.crc32(doi.lower().encode('utf-8')) % nb_shards
+
+
+def load_dump_shard(kwargs):
+    """
+    Loads one shard of the dump. This is meant to run in a worker process,
+    so it opens its own database connection.
+    :param kwargs: arguments of OadoiAPI.load_dump
+    :returns: the shard loaded
+    """
+    connections.close_all()
+    OadoiAPI().load_dump(**kwargs)
+    return kwargs.get('shard')
+
+
 class OadoiAPI(object):
     """
     An interface to import an OAdoi dump into dissemin
@@ -47,29 +74,158 @@ class OadoiAPI(object):
                 if start_doi_seen:
                     yield record
 
+    @staticmethod
+    def _read_lines(filename, offset=0):
+        """
+        Enumerates the raw lines of the dump, starting at the given offset of the uncompressed dump.
+        :returns: generator of tuples (offset after the line, line)
+        """
+        with gzip.open(filename, 'r') as f:
+            if offset:
+                f.seek(offset)
+            for line in f:
+                yield f.tell(), line
+
+    @staticmethod
+    def _line_shard(line, nb_shards):
+        """
+        Returns the shard of a raw line of the dump
+        """
+        match = doi_in_line_re.search(line)
+        if match:
+            doi = match.group(1).decode('utf-8')
+        else:
+            doi = json.loads(line.decode('utf-8')).get('doi') or ''
+        return doi_shard(doi, nb_shards)
+
+    @report_speed(name='oadoi importing speed')
+    def read_dump_from_offset(self, filename, offset=0, shard=None, nb_shards=1):
+        """
+        Enumerates the JSON objects in the dump, starting at the given offset of the uncompressed dump.
+        If shard is given, only the records of this shard are parsed and returned.
+        :returns: generator of tuples (offset after the line, record)
+        """
+        for offset, line in self._read_lines(filename, offset):
+            if shard is None or self._line_shard(line, nb_shards) == shard:
+                yield offset, json.loads(line.decode('utf-8'))
+
+    def read_dump_chunks(self, filename, offset=0, chunk_size=5000, shard=None, nb_shards=1):
+        """
+        Enumerates the dump in chunks of records
+        :returns: generator of tuples (offset after the chunk, list of records)
+        """
+        chunk = []
+        for offset, record in self.read_dump_from_offset(filename, offset, shard, nb_shards):
+            chunk.append(record)
+            if len(chunk) >= chunk_size:
+                yield offset, chunk
+                chunk = []
+        if chunk:
+            yield offset, chunk
 
-    def load_dump(self, filename, start_doi=None, update_index=False, create_missing_dois=True):
+    @staticmethod
+    def read_checkpoint(checkpoint):
+        """
+        :param checkpoint: path to the checkpoint file
+        :returns: the offset stored in the checkpoint, 0 if there is none
+        """
+        try:
+            with open(checkpoint, 'r') as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    @staticmethod
+    def write_checkpoint(checkpoint, offset):
+        """
+        Stores the offset up to which the dump has been loaded
+        """
+        with open(checkpoint, 'w') as f:
+            f.write(str(offset))
+
+    def load_dump(self, filename, start_doi=None, update_index=False, create_missing_dois=True, checkpoint=None, chunk_size=5000, shard=None, nb_shards=1):
         """
         Reads a dump from the disk and loads it to the database.
+        The DOIs are looked up by chunks of records.
+
+        :param start_doi: skip the records before this DOI
+        :param checkpoint: path to a file where the offset of the last loaded chunk is stored. If the file exists, the loading resumes from there.
+        :param chunk_size: number of records per chunk
+        :param shard: if given, only load the records whose DOI fall in this shard
+        :param nb_shards: the number of shards the dump is split into
         """
-        for record in self.read_dump(filename, start_doi=start_doi):
-            self.create_oairecord(record, update_index, create_missing_dois)
+        offset = 0
+        if checkpoint:
+            offset = self.read_checkpoint(checkpoint)
+            if offset:
+                logger.info('Resuming oadoi dump at offset {}'.format(offset))
 
-    def create_oairecord(self, record, update_index=True, create_missing_dois=True):
+        start_doi_seen = start_doi is None
+        for offset, records in self.read_dump_chunks(filename, offset=offset, chunk_size=chunk_size, shard=shard, nb_shards=nb_shards):
+            if not start_doi_seen:
+                dois = [record.get('doi') for record in records]
+                if start_doi not in dois:
+                    continue
+                records = records[dois.index(start_doi):]
+                start_doi_seen = True
+            self.load_records(records, update_index, create_missing_dois)
+            if checkpoint:
+                self.write_checkpoint(checkpoint, offset)
+        logger.info('DOI cache: {}'.format(doi_cache.stats))
+
+    def load_records(self, records, update_index=False, create_missing_dois=True):
+        """
+        Loads a list of records of the dump, looking up all their DOIs at once.
+        The papers that changed are sent to the search index in bulk.
+        """
+        dois = [self._get_doi(record) for record in records]
+        papers = Paper.get_by_dois([doi for doi in dois if doi])
+        to_index = dict()
+        for doi, record in zip(dois, records):
+            if doi:
+                paper = self._add_oa_locations(doi, record, papers.get(doi), create_missing_dois, to_index)
+                if paper:
+                    papers[doi] = paper
+        if update_index and to_index:
+            Paper.update_index_batch(list(to_index.values()))
+
+    @staticmethod
+    def _get_doi(record):
         """
         Given one line of the dump (represented as a dict),
-        add it to the corresponding paper (if it exists)
+        returns its DOI if the record is worth importing, None otherwise
         """
         doi = to_doi(record['doi'])
         if not doi:
-            return
+            return None
         prefix = doi.split('/')[0]
         if prefix in free_doi_prefixes:
-            return
+            return None
         if not record.get('oa_locations'):
+            return None
+        return doi
+
+    def create_oairecord(self, record, update_index=True, create_missing_dois=True):
+        """
+        Given one line of the dump (represented as a dict),
+        add it to the corresponding paper (if it exists)
+        """
+        doi = self._get_doi(record)
+        if not doi:
             return
+        to_index = dict()
+        self._add_oa_locations(doi, record, Paper.get_by_doi(doi), create_missing_dois, to_index)
+        if update_index:
+            for paper in to_index.values():
+                paper.update_index()
 
-        paper = Paper.get_by_doi(doi)
+    def _add_oa_locations(self, doi, record, paper, create_missing_dois, to_index):
+        """
+        Adds the OA locations of one line of the dump to the paper with that DOI.
+        :param paper: the paper with that DOI, or None if there is none yet
+        :param to_index: dict where the papers that need to be reindexed are stored by pk
+        :returns: the paper, if any
+        """
         if not paper:
             if not create_missing_dois:
                 return
@@ -88,7 +244,7 @@ class OadoiAPI(object):
 
             # just to speed things up a bit...
             if paper.pdf_url == url:
-                return
+                return paper
 
             identifier='oadoi:'+url
             source = self.oadoi_source
@@ -113,7 +269,7 @@ class OadoiAPI(object):
                 super(Paper, paper).update_availability()
                 if old_pdf_url != paper.pdf_url:
                     paper.save()
-                    if update_index:
-                        paper.update_index()
+                    to_index[paper.pk] = paper
             except (DataError, ValueError):
                 logger.warning('Record does not fit in the DB')
+        return paper
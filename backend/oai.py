@@ -20,25 +20,46 @@
 
 
 import logging
+import pytz
 
+from collections import namedtuple
+from contextlib import closing
 from datetime import datetime
 
 from backend.papersource import PaperSource
+from backend.utils import prefetch_in_background
+from backend.utils import request_retry
 
 from django.db import transaction
-from multiprocessing_generator import ParallelGenerator
 from oaipmh.client import Client
+from oaipmh.datestamp import datetime_to_datestamp
 
+from oaipmh.error import BadResumptionTokenError
 from oaipmh.error import NoRecordsMatchError
 from oaipmh.metadata import MetadataRegistry
 from oaipmh.metadata import oai_dc_reader
+from papers.models import OaiHarvestWindow
 from papers.models import Paper
 from backend.translators import OAIDCTranslator
 from backend.translators import BASEDCTranslator
+from backend.oaireader import OaiRecordStream
 from backend.oaireader import base_dc_reader
 
 logger = logging.getLogger('dissemin.' + __name__)
 
+#: Yielded by :meth:`OaiPaperSource.list_records` after the records of each page
+PageEnd = namedtuple('PageEnd', ['resumption_token'])
+
+
+def to_naive_utc(dt):
+    """
+    pyoai only accepts naive datetimes, in UTC
+    """
+    if dt is not None and dt.tzinfo is not None:
+        dt = dt.astimezone(pytz.UTC).replace(tzinfo=None)
+    return dt
+
+
 class OaiPaperSource(PaperSource):  # TODO: this should not inherit from PaperSource
     """
     A paper source that fetches records from the OAI-PMH proxy
@@ -50,6 +71,13 @@ class OaiPaperSource(PaperSource):  # TODO: this should not inherit from PaperSo
     the metadata is served in.
     """
 
+    #: number of records fetched in advance when harvesting a window
+    records_lookahead = 1000
+    #: save the records by batches rather than one by one
+    bulk_ingest = True
+    #: number of records saved at once with bulk_ingest
+    batch_size = 500
+
     def __init__(self, oaisource, day_granularity=False, *args, **kwargs):
         """
         This sets up the paper source.
@@ -67,6 +95,7 @@ class OaiPaperSource(PaperSource):  # TODO: this should not inherit from PaperSo
         if not oaisource.endpoint:
             raise ValueError('No OAI endpoint was configured for this OAI source.')
 
+        self.oaisource = oaisource
         self.registry = MetadataRegistry()
         self.registry.registerReader('oai_dc', oai_dc_reader)
         self.registry.registerReader('base_dc', base_dc_reader)
@@ -77,6 +106,10 @@ class OaiPaperSource(PaperSource):  # TODO: this should not inherit from PaperSo
             'base_dc': BASEDCTranslator(oaisource),
         }
 
+        # rate reporting
+        self.last_report = datetime.now()
+        self.processed_since_report = 0
+
     # Translator management
 
     def add_translator(self, translator):
@@ -103,14 +136,135 @@ class OaiPaperSource(PaperSource):  # TODO: this should not inherit from PaperSo
         :param metadataPrefix: restrict the ingest for this metadata
                           format
         """
-        args = {'metadataPrefix':metadataPrefix}
-        if from_date:
-            args['from_'] = from_date
-        if resumptionToken:
-            args['resumptionToken'] = resumptionToken
-        records = self.client.listRecords(**args)
+        items = self.list_records(metadataPrefix, from_date=from_date,
+                                  resumptionToken=resumptionToken)
+        records = (item for item in items if not isinstance(item, PageEnd))
         self.process_records(records, metadataPrefix)
 
+    def harvest(self, from_date=None, until=None, metadataPrefix='oai_dc', nb_windows=1):
+        """
+        Fetches the records of the source between two dates, with
+        checkpoints: if the harvest is interrupted, calling this method
+        again resumes it where it stopped. Once the harvest is complete,
+        the `last_update` of the source is set to `until`.
+
+        :param from_date: only fetch records modified after that date
+        :param until: only fetch records modified before that date
+                          (defaults to the end of the pending harvest,
+                          or to now)
+        :param metadataPrefix: the metadata format to fetch
+        :param nb_windows: number of windows the date range is split into.
+                          They are harvested one after the other here, the
+                          `harvest_oai_window` task harvests them in parallel.
+        :returns: the harvested windows
+        :raises ValueError: if a harvest of another range is pending
+        """
+        windows = OaiHarvestWindow.plan(self.oaisource, from_date, until,
+                                        metadataPrefix, nb_windows)
+        for window in windows:
+            self.ingest_window(window)
+        OaiHarvestWindow.advance_source(self.oaisource)
+        return windows
+
+    def ingest_window(self, window):
+        """
+        Fetches the records of a :class:`OaiHarvestWindow`, starting
+        from its resumption token if it has one. The resumption token
+        and the latest datestamp are saved after each page.
+        If the resumption token has expired, the window is harvested again
+        from its start: the records are not listed in datestamp order, so
+        records older than the latest datestamp seen can still be missing.
+        """
+        if window.done:
+            return
+        try:
+            self._ingest_window_pages(window,
+                from_date=window.from_date,
+                resumptionToken=window.resumption_token)
+        except BadResumptionTokenError:
+            if window.resumption_token is None:
+                raise
+            logger.warning("Resumption token of %s has expired, restarting from %s" % (window, window.from_date))
+            self._ingest_window_pages(window, from_date=window.from_date)
+
+    def _ingest_window_pages(self, window, from_date=None, resumptionToken=None):
+        items = self.list_records(window.metadata_prefix,
+            from_date=from_date, until=window.until,
+            resumptionToken=resumptionToken)
+        # pyoai records cannot be pickled, so we prefetch them in a thread
+        # rather than with a ParallelGenerator
+        if self.records_lookahead > 0:
+            items = prefetch_in_background(items, self.records_lookahead, name='oai-prefetch')
+        records = []
+        last_datestamp = None
+        for item in items:
+            if isinstance(item, PageEnd):
+                self.save_records(records, window.metadata_prefix)
+                records = []
+                window.checkpoint(item.resumption_token, last_datestamp)
+                continue
+            records.append(item)
+            datestamp = item[0].datestamp().replace(tzinfo=pytz.UTC)
+            if last_datestamp is None or datestamp > last_datestamp:
+                last_datestamp = datestamp
+            if len(records) >= self.batch_size:
+                self.save_records(records, window.metadata_prefix)
+                records = []
+        if not window.done:
+            # No record matched
+            window.checkpoint(None)
+
+    def list_records(self, metadataPrefix, from_date=None, until=None,
+                     resumptionToken=None):
+        """
+        Same as the ListRecords verb of the client, but the records are
+        yielded one at a time as each page is downloaded and parsed (see
+        :class:`OaiRecordStream`), and the records of each page are
+        followed by a :class:`PageEnd` with the resumption token of the
+        next page (None for the last page).
+
+        :param resumptionToken: resume a previous listing. The other
+                    arguments are then ignored, as the token encodes them.
+        """
+        if resumptionToken:
+            args = {'resumptionToken':resumptionToken}
+        else:
+            args = {'metadataPrefix':metadataPrefix}
+            if from_date:
+                args['from'] = datetime_to_datestamp(to_naive_utc(from_date),
+                                                     self.client._day_granularity)
+            if until:
+                args['until'] = datetime_to_datestamp(to_naive_utc(until),
+                                                      self.client._day_granularity)
+        while True:
+            with self.open_request(verb='ListRecords', **args) as response:
+                stream = OaiRecordStream(response, metadataPrefix, self.registry)
+                try:
+                    for record in stream:
+                        yield record
+                except NoRecordsMatchError:
+                    return
+            token = stream.resumption_token
+            yield PageEnd(token)
+            if token is None:
+                return
+            args = {'resumptionToken':token}
+
+    def open_request(self, **kwargs):
+        """
+        Sends a request to the OAI-PMH endpoint. Unlike the `makeRequest`
+        method of the client, the response is not read into memory: it is
+        returned as a file-like object, to be parsed as it is downloaded.
+        It should be closed once read.
+
+        :param kwargs: the arguments of the request (verb included)
+        """
+        response = request_retry(self.oaisource.endpoint, params=kwargs,
+                                 timeout=60, stream=True)
+        # Compressed responses are decompressed as they are read
+        response.raw.decode_content = True
+        return closing(response.raw)
+
     def create_paper_by_identifier(self, identifier, metadataPrefix):
         """
         Queries the OAI-PMH proxy for a single paper.
@@ -157,6 +311,29 @@ class OaiPaperSource(PaperSource):  # TODO: this should not inherit from PaperSo
             except ValueError:
                 logger.exception("Ignoring invalid paper with header %s" % header.identifier())
 
+    def process_record_batch(self, records, format):
+        """
+        Saves many records (as returned by pyoai) at once: they are all
+        translated first, and the resulting bare papers are saved with
+        :meth:`Paper.from_bare_batch`, in a single transaction.
+
+        :returns: the list of papers saved
+        """
+        translator = self.translators.get(format)
+        if translator is None:
+            logger.warning("Unknown metadata format %s, skipping" % format)
+            return []
+
+        bare_papers = []
+        for header, metadata, _ in records:
+            paper = translator.translate(header, metadata._map)
+            if paper is not None:
+                bare_papers.append(paper)
+
+        with transaction.atomic():
+            saved = Paper.from_bare_batch(bare_papers)
+        return [paper for paper in saved if paper is not None]
+
     def process_records(self, listRecords, format):
         """
         Save as :class:`Paper` all the records contained in this list
@@ -167,23 +344,36 @@ class OaiPaperSource(PaperSource):  # TODO: this should not inherit from PaperSo
             raise ValueError("No OAI translators have been set up: " +
                              "We cannot save any record.")
 
-        last_report = datetime.now()
-        processed_since_report = 0
-
-        with ParallelGenerator(listRecords, max_lookahead=1000) as g:
-            for record in g:
-                header = record[0]
-                metadata = record[1]._map
-
-                self.process_record(header, metadata, format)
-
-                # rate reporting
-                processed_since_report += 1
-                if processed_since_report >= 1000:
-                    td = datetime.now() - last_report
-                    rate = 'infty'
-                    if td.seconds:
-                        rate = str(processed_since_report / td.seconds)
-                    logger.info("current rate: %s records/s" % rate)
-                    processed_since_report = 0
-                    last_report = datetime.now()
+        # The records are prefetched in a thread, as in :meth:`ingest_window`
+        if self.records_lookahead > 0:
+            listRecords = prefetch_in_background(listRecords, self.records_lookahead, name='oai-prefetch')
+        self.save_records(listRecords, format)
+
+    def save_records(self, records, format):
+        """
+        Saves the records as they come, reporting the rate regularly.
+        With `bulk_ingest`, the records are saved by batches of `batch_size`.
+        """
+        batch = []
+        for record in records:
+            if self.bulk_ingest:
+                batch.append(record)
+                if len(batch) >= self.batch_size:
+                    self.process_record_batch(batch, format)
+                    batch = []
+            else:
+                self.process_record(record[0], record[1]._map, format)
+
+            # rate reporting
+            self.processed_since_report += 1
+            if self.processed_since_report >= 1000:
+                td = datetime.now() - self.last_report
+                rate = 'infty'
+                if td.seconds:
+                    rate = str(self.processed_since_report / td.seconds)
+                logger.info("current rate: %s records/s" % rate)
+                self.processed_since_report = 0
+                self.last_report = datetime.now()
+
+        if batch:
+            self.process_record_batch(batch, format)
@@ -18,6 +18,12 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 #
 
+from io import BytesIO
+
+from lxml import etree
+from oaipmh import common
+from oaipmh import error
+from oaipmh.client import buildHeader
 from oaipmh.metadata import MetadataReader
 
 base_dc_reader = MetadataReader(
@@ -56,3 +62,91 @@ base_dc_reader = MetadataReader(
     'dc' : 'http://purl.org/dc/elements/1.1/'}
     )
 
+
+
+OAI_NAMESPACE = 'http://www.openarchives.org/OAI/2.0/'
+OAI_ERROR_CODES = [
+    'badArgument',
+    'badResumptionToken',
+    'badVerb',
+    'cannotDisseminateFormat',
+    'idDoesNotExist',
+    'noRecordsMatch',
+    'noMetadataFormats',
+    'noSetHierarchy',
+]
+
+
+def oai_tag(name):
+    return '{%s}%s' % (OAI_NAMESPACE, name)
+
+
+class OaiRecordStream(object):
+    """
+    Reads the records of a ListRecords response incrementally.
+
+    pyoai parses the whole response before returning any record, which
+    takes a lot of memory for large pages of `base_dc` records. This
+    yields each record as soon as its element is parsed, and frees the
+    elements parsed so far. The metadata is read by the readers of the
+    registry, as pyoai does.
+
+    Iterating yields (header, metadata, None) triples, like pyoai.
+    Unlike pyoai, the headers and metadata do not keep their elements
+    (their `element()` is None), so that the records kept by the consumer
+    do not hold parts of the tree.
+    The resumption token is available once the iteration is over.
+    Errors returned by the endpoint are raised as pyoai errors.
+    """
+
+    def __init__(self, source, metadata_prefix, registry):
+        """
+        :param source: the response, as a file-like object (typically the
+            HTTP response, parsed as it is downloaded) or as bytes
+        :param metadata_prefix: the metadata format of the records
+        :param registry: the :class:`MetadataRegistry` to read the metadata with
+        """
+        if isinstance(source, bytes):
+            source = BytesIO(source)
+        self.source = source
+        self.metadata_prefix = metadata_prefix
+        self.registry = registry
+        self.namespaces = {'oai': OAI_NAMESPACE}
+        #: the resumption token of the next page, None if this is the last page
+        self.resumption_token = None
+
+    def __iter__(self):
+        record_tag = oai_tag('record')
+        token_tag = oai_tag('resumptionToken')
+        error_tag = oai_tag('error')
+        context = etree.iterparse(self.source, events=('end',),
+                tag=(record_tag, token_tag, error_tag), huge_tree=True)
+        for _, element in context:
+            if element.tag == record_tag:
+                yield self.read_record(element)
+                # Free the memory used by the records parsed so far
+                element.clear()
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+            elif element.tag == token_tag:
+                self.resumption_token = (element.text or '').strip() or None
+            else:
+                self.raise_error(element)
+
+    def read_record(self, element):
+        header = buildHeader(element.find(oai_tag('header')), self.namespaces)
+        header = common.Header(None, header.identifier(), header.datestamp(),
+                               header.setSpec(), header.isDeleted())
+        metadata_element = element.find(oai_tag('metadata'))
+        metadata = None
+        if metadata_element is not None:
+            metadata = self.registry.readMetadata(self.metadata_prefix, metadata_element)
+            metadata = common.Metadata(None, metadata.getMap())
+        return (header, metadata, None)
+
+    def raise_error(self, element):
+        code = element.get('code')
+        if code not in OAI_ERROR_CODES:
+            raise error.UnknownError(
+                "Unknown error code from server: %s, message: %s" % (code, element.text))
+        raise getattr(error, code[0].upper() + code[1:] + 'Error')(element.text)
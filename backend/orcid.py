@@ -22,8 +22,11 @@
 import logging
 import json
 import os
+import zlib
 
 from django.conf import settings
+from django.db import connections
+from django.utils import timezone
 
 from backend.citeproc import CrossRef
 from backend.papersource import PaperSource
@@ -39,6 +42,7 @@ from papers.models import Researcher
 from papers.models import Paper
 from papers.orcid import OrcidProfile
 from papers.orcid import affiliate_author_with_orcid
+from papers.utils import jpath
 from papers.utils import validate_orcid
 from search import SearchQuerySet
 
@@ -51,6 +55,10 @@ class OrcidPaperSource(PaperSource):
     def __init__(self, *args, **kwargs):
         super(OrcidPaperSource, self).__init__(*args, **kwargs)
         self.oai_source = OaiSource.objects.get(identifier='orcid')
+        # Number of works skipped by the last refresh, as they had not changed
+        self.skipped_works = 0
+        # Put codes of the works imported (or skipped) by the last refresh
+        self.imported_works = set()
 
     def _enhance_paper(self, paper, ref_name, orcid_id):
         """
@@ -170,6 +178,7 @@ class OrcidPaperSource(PaperSource):
         to link to the researcher.
         """
         queryset = SearchQuerySet().models(Paper).filter(orcids=researcher.orcid).load_all()
+        now = timezone.now()
         papers_to_update = []
         for search_result in queryset:
             paper = search_result.object
@@ -179,22 +188,30 @@ class OrcidPaperSource(PaperSource):
                     if author.orcid == researcher.orcid:
                         author.researcher_id = researcher.id
                 paper.authors_list = [author.serialize() for author in new_authors]
+                # The new modification date also invalidates its cached renderings
+                paper.last_modified = now
                 papers_to_update.append(paper)
                 paper.update_index()
 
         if papers_to_update:
-            Paper.objects.bulk_update(papers_to_update, ['authors_list'])
+            Paper.objects.bulk_update(papers_to_update, ['authors_list', 'last_modified'])
 
 
-    def fetch_orcid_records(self, orcid_identifier, profile=None, use_doi=True):
+    def fetch_orcid_records(self, orcid_identifier, profile=None, use_doi=True, researcher=None, known_works=None):
         """
         Queries ORCiD to retrieve the publications associated with a given ORCiD.
         It also fetches such papers from the CrossRef search interface.
 
         :param profile: The ORCID profile if it has already been fetched before (format: parsed JSON).
         :param use_doi: Fetch the publications by DOI when we find one (recommended, but slow)
+        :param researcher: The researcher with this ORCiD, if it is already up to date with the profile.
+        :param known_works: dict from put codes (as strings) to the modification dates of the works
+            imported before. The works that have not been modified since are skipped.
         :returns: a generator, where all the papers found are yielded. (some of them could be in
                 free form, hence not imported)
+
+        The put codes of the works which are imported, or skipped as they are known already,
+        are stored in `self.imported_works`.
         """
         # Cleanup iD:
         orcid_id = validate_orcid(orcid_identifier)
@@ -210,8 +227,10 @@ class OrcidPaperSource(PaperSource):
             return
 
         # As we have fetched the profile, let's update the Researcher
-        self.researcher = Researcher.get_or_create_by_orcid(orcid_identifier,
-                profile.json, update=True)
+        if researcher is None:
+            researcher = Researcher.get_or_create_by_orcid(orcid_identifier,
+                    profile.json, update=True)
+        self.researcher = researcher
         if not self.researcher:
             return
 
@@ -225,7 +244,14 @@ class OrcidPaperSource(PaperSource):
         # - the ones without: we will fetch ORCID's metadata about them
         #   and try to create a paper with what they provide
         put_codes = []
+        self.skipped_works = 0
+        self.imported_works = set()
         for summary in profile.work_summaries:
+            if (known_works and summary.last_modified is not None and
+                known_works.get(str(summary.put_code)) == summary.last_modified):
+                self.skipped_works += 1
+                self.imported_works.add(summary.put_code)
+                continue
             if summary.doi and use_doi:
                 dois_and_putcodes.append((summary.doi.lower(), summary.put_code))
             else:
@@ -237,6 +263,7 @@ class OrcidPaperSource(PaperSource):
             dois = [doi for doi, put_code in dois_and_putcodes]
             for idx, paper in enumerate(self.fetch_metadata_from_dois(ref_name, orcid_id, dois)):
                 if paper is not None:
+                    self.imported_works.add(dois_and_putcodes[idx][1])
                     yield paper
                 else:
                     put_codes.append(dois_and_putcodes[idx][1])
@@ -256,60 +283,201 @@ class OrcidPaperSource(PaperSource):
                 ignored_papers.append(work.as_dict())
                 continue
 
-            yield self.create_paper(work)
+            paper = self.create_paper(work)
+            if paper is not None:
+                self.imported_works.add(work.put_code)
+            yield paper
 
         self.warn_user_of_ignored_papers(ignored_papers)
         if ignored_papers:
             logger.warning("Total ignored papers: %d" % (len(ignored_papers)))
 
-    def fetch_and_save(self, researcher, profile=None):
+    def fetch_and_save(self, researcher, profile=None, incremental=False):
         """
         Fetch papers and save them to the database.
+
+        :param incremental: only fetch the works that are new or modified since
+            the last import. Nothing is fetched if the profile has not been modified.
+        :returns: the number of papers saved
         """
         count = 0
+        self.skipped_works = 0
         if not researcher:
             return
         if researcher.orcid:
             if researcher.empty_orcid_profile == None:
                 self.update_empty_orcid(researcher, True)
 
-            for p in self.fetch_orcid_records(researcher.orcid, profile=profile):
+            try:
+                if profile is None:
+                    profile = OrcidProfile(orcid_id=researcher.orcid)
+            except MetadataSourceException:
+                logger.exception("ORCID Profile Error")
+                return count
+
+            known_works = None
+            if incremental:
+                if profile.last_modified is not None and profile.last_modified == researcher.orcid_last_modified:
+                    self.skipped_works = len(profile.work_summaries)
+                    logger.info("ORCID profile %s unchanged, %d works skipped" % (researcher.orcid, self.skipped_works))
+                    return count
+                known_works = researcher.orcid_work_dates
+
+            self.researcher = None
+            complete = True
+            for p in self.fetch_orcid_records(researcher.orcid, profile=profile, known_works=known_works):
                 if self.max_results is not None and count >= self.max_results:
+                    complete = False
                     break
 
                 count += 1
 
+            if complete and self.researcher is not None:
+                self.save_orcid_dates(self.researcher, profile, self.imported_works)
+            logger.info("ORCID profile %s: %d papers saved, %d works skipped" % (researcher.orcid, count, self.skipped_works))
+        return count
 
-    def bulk_import(self, directory, fetch_papers=True, use_doi=False):
+    @staticmethod
+    def save_orcid_dates(researcher, profile, imported_works):
+        """
+        Records the modification dates of the works which have been imported,
+        so that they are skipped by the next incremental import. The date of
+        the profile is only recorded if all of its works have been imported:
+        otherwise the next import tries the others again.
+
+        :param imported_works: the put codes of the imported works
+        """
+        summaries = profile.work_summaries
+        if all(summary.put_code in imported_works for summary in summaries):
+            researcher.orcid_last_modified = profile.last_modified
+        else:
+            researcher.orcid_last_modified = None
+        researcher.orcid_work_dates = {
+            str(summary.put_code): summary.last_modified
+            for summary in summaries
+            if summary.last_modified is not None and summary.put_code in imported_works
+        }
+        researcher.save(update_fields=['orcid_last_modified', 'orcid_work_dates'])
+
+    @staticmethod
+    def read_manifests(manifest_dir):
+        """
+        :returns: the set of files of the dump imported already, according
+            to the manifests of all the shards in manifest_dir
+        """
+        done = set()
+        if not manifest_dir or not os.path.isdir(manifest_dir):
+            return done
+        for fname in os.listdir(manifest_dir):
+            if fname.endswith('.manifest'):
+                with open(os.path.join(manifest_dir, fname), 'r') as f:
+                    done.update(line.rstrip('\n') for line in f)
+        return done
+
+    @staticmethod
+    def dump_files(directory, shard=None, nb_shards=1, skip=None):
+        """
+        Enumerates the JSON files of a dump, in a stable order
+        :param shard: if given, only the files of this shard are returned
+        :param skip: set of files to ignore
+        :returns: generator of paths relative to the directory
+        """
+        for root, dirs, fnames in os.walk(directory):
+            dirs.sort()
+            for fname in sorted(fnames):
+                if not fname.endswith('.json'):
+                    continue
+                path = os.path.relpath(os.path.join(root, fname), directory)
+                if skip and path in skip:
+                    continue
+                if shard is None or dump_file_shard(path, nb_shards) == shard:
+                    yield path
+
+    def bulk_import(self, directory, fetch_papers=True, use_doi=False,
+                    shard=None, nb_shards=1, manifest_dir=None, batch_size=100):
         """
         Bulk-imports ORCID profiles from a dump
         (warning: this still uses our DOI cache).
         The directory should contain json versions
-        of orcid profiles, as in the official ORCID
-        dump.
+        of orcid profiles, in the format of the public API
+        (a record, optionally with the full works, see :class:`OrcidProfile`).
+        ORCID is not queried: the works are read from the dump.
+
+        :param shard: only import the files of this shard (see `dump_file_shard`)
+        :param nb_shards: total number of shards
+        :param manifest_dir: directory where the imported files are listed, so that
+            an interrupted import can be resumed
+        :param batch_size: number of profiles whose researchers are saved at once
         """
-
-        for root, _, fnames in os.walk(directory):
-            for fname in fnames:
-                #if fname == '0000-0003-1349-4524.json':
-                #    seen = True
-                #if not seen:
-                #    continue
-
-                with open(os.path.join(root, fname), 'r') as f:
-                    try:
-                        profile = json.load(f)
-                        orcid = profile['orcid-profile'][
-                                        'orcid-identifier'][
-                                        'path']
-                        r = Researcher.get_or_create_by_orcid(
-                            orcid, profile, update=True)
-                        if fetch_papers:
-                            papers = self.fetch_orcid_records(orcid,
-                                profile=OrcidProfile(json=profile),
-                                use_doi=use_doi)
-                            for p in papers:
-                                self.save_paper(p, r)
-                    except (ValueError, KeyError):
-                        logger.warning("Invalid profile: %s" % fname)
-
+        done = self.read_manifests(manifest_dir)
+        manifest = None
+        if manifest_dir:
+            os.makedirs(manifest_dir, exist_ok=True)
+            manifest = open(os.path.join(manifest_dir,
+                'orcid-{}-of-{}.manifest'.format(shard or 0, nb_shards)), 'a')
+        try:
+            batch = []
+            for path in self.dump_files(directory, shard, nb_shards, skip=done):
+                batch.append(path)
+                if len(batch) >= batch_size:
+                    self._import_dump_batch(directory, batch, fetch_papers, use_doi, manifest)
+                    batch = []
+            if batch:
+                self._import_dump_batch(directory, batch, fetch_papers, use_doi, manifest)
+        finally:
+            if manifest:
+                manifest.close()
+
+    def _import_dump_batch(self, directory, paths, fetch_papers, use_doi, manifest):
+        """
+        Imports some files of a dump, and adds them to the manifest
+        """
+        profiles = []
+        for path in paths:
+            with open(os.path.join(directory, path), 'r') as f:
+                try:
+                    profile = json.load(f)
+                    orcid = validate_orcid(jpath('orcid-identifier/path', profile))
+                except ValueError:
+                    orcid = None
+            if orcid is None:
+                logger.warning("Invalid profile: %s" % path)
+                continue
+            profiles.append((orcid, OrcidProfile(orcid_id=orcid, json=profile, offline=True)))
+
+        researchers = Researcher.get_or_create_by_orcid_batch(profiles, update=True)
+        if fetch_papers:
+            for orcid, profile in profiles:
+                researcher = researchers.get(orcid)
+                if researcher is None:
+                    continue
+                try:
+                    # The papers are saved as they are fetched
+                    for p in self.fetch_orcid_records(orcid, profile=profile,
+                            use_doi=use_doi, researcher=researcher):
+                        pass
+                except (ValueError, KeyError):
+                    logger.warning("Invalid profile: %s" % orcid)
+
+        if manifest:
+            manifest.write(''.join(path + '\n' for path in paths))
+            manifest.flush()
+
+
+def dump_file_shard(path, nb_shards):
+    """
+    Assigns a file of an ORCID dump to one of nb_shards shards. This does not depend on the process, unlike hash().
+    """
+    return zlib.crc32(path.encode('utf-8')) % nb_shards
+
+
+def bulk_import_shard(kwargs):
+    """
+    Imports one shard of an ORCID dump. This is meant to run in a worker process,
+    so it opens its own database connection.
+    :param kwargs: arguments of OrcidPaperSource.bulk_import
+    :returns: the shard imported
+    """
+    connections.close_all()
+    OrcidPaperSource().bulk_import(**kwargs)
+    return kwargs.get('shard')
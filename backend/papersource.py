@@ -20,6 +20,8 @@
 
 
 
+from django.utils import timezone
+
 from papers.models import Paper
 from papers.models import Researcher
 
@@ -49,15 +51,44 @@ class PaperSource(object):
         :params paper: Paper object
         :returns: Paper object with updated researchers
         """
-        for idx, author in enumerate(paper.authors_list):
-            if author['orcid']:
-                try:
-                    researcher = Researcher.objects.get(orcid=author['orcid'])
-                    paper.set_researcher(idx, researcher.pk)
-                except Researcher.DoesNotExist:
-                    pass
+        return self.associate_researchers_batch([paper])[0]
 
-        return paper
+    def associate_researchers_batch(self, papers):
+        """
+        Associate known ORCIDs to the corresponding researchers, for many papers at once:
+        the researchers are looked up with one query, and the papers whose authors
+        changed are saved with another one.
+        :params papers: list of Paper objects
+        :returns: the list of Paper objects with updated researchers
+        """
+        orcids = {
+            author['orcid']
+            for paper in papers
+            for author in paper.authors_list
+            if author.get('orcid')
+        }
+        if not orcids:
+            return papers
+        researcher_ids = dict(
+            Researcher.objects.filter(orcid__in=orcids).values_list('orcid', 'pk'))
+
+        now = timezone.now()
+        changed = []
+        for paper in papers:
+            paper_changed = False
+            for author in paper.authors_list:
+                researcher_id = researcher_ids.get(author.get('orcid'))
+                if researcher_id is not None and author.get('researcher_id') != researcher_id:
+                    author['researcher_id'] = researcher_id
+                    paper_changed = True
+            if paper_changed and paper.pk is not None:
+                # The new modification date also invalidates its cached renderings
+                paper.last_modified = now
+                changed.append(paper)
+        if changed:
+            Paper.objects.bulk_update(changed, ['authors_list', 'last_modified'])
+
+        return papers
 
     def fetch_papers(self, researcher):
         """
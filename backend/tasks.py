@@ -22,9 +22,10 @@
 
 from celery import shared_task
 from celery.utils.log import get_task_logger
-from datetime import datetime
+from datetime import date
 from datetime import timedelta
 
+from django.conf import settings
 from django.utils import timezone
 
 from backend.citeproc import CrossRef
@@ -34,10 +35,12 @@ from backend.utils import run_only_once
 from backend.zotero import consolidate_publication
 from statistics.models import AccessStatistics
 
+from papers import indexqueue
 from papers.errors import MetadataSourceException
 from papers.models import Paper
 from papers.models import PaperWorld
 from papers.models import Researcher
+from papers.models import OaiHarvestWindow
 from papers.models import OaiSource
 from publishers.models import Publisher
 
@@ -71,7 +74,13 @@ def init_profile_from_orcid(pk):
 
 @shared_task(name='fetch_everything_for_researcher')
 @run_only_once('researcher', keys=['pk'], timeout=60*60)
-def fetch_everything_for_researcher(pk):
+def fetch_everything_for_researcher(pk, incremental=True):
+    """
+    Fetches the papers of a researcher from ORCID and CrossRef
+
+    :param incremental: only fetch the works added or modified in ORCID since the last time
+    :returns: the number of works skipped as they had not changed
+    """
     orcid_paper_source = OrcidPaperSource(max_results=1000)
     r = Researcher.objects.get(pk=pk)
 
@@ -82,7 +91,7 @@ def fetch_everything_for_researcher(pk):
 
     try:
         orcid_paper_source.link_existing_papers(r)
-        orcid_paper_source.fetch_and_save(r)
+        orcid_paper_source.fetch_and_save(r, incremental=incremental)
         update_researcher_task(r, None)
 
     except MetadataSourceException as e:
@@ -93,11 +102,14 @@ def fetch_everything_for_researcher(pk):
         r.update_stats()
         r.harvester = None
         update_researcher_task(r, None)
+    return orcid_paper_source.skipped_works
 
 def refetch_researchers(start_time=timezone.now() - timedelta(days=30*6)):
+    skipped_works = 0
     for r in Researcher.objects.filter(last_harvest__gt=start_time).order_by('last_harvest'):
         logger.info(r.url)
-        fetch_everything_for_researcher(r.pk)
+        skipped_works += fetch_everything_for_researcher(r.pk) or 0
+    logger.info("Works skipped as they had not changed: %d" % skipped_works)
 
 
 
@@ -134,6 +146,40 @@ def update_crossref():
     """
     CrossRef.fetch_latest_records()
 
+
+@shared_task(name='backfill_crossref')
+@run_only_once('backfill_crossref', timeout=10*60)
+def backfill_crossref(until=None):
+    """
+    Catches up with Crossref by fetching the missing days in parallel, one task per day.
+    last_update of Crossref advances as soon as the days are complete without gap.
+
+    :param until: last day to fetch in ISO format, defaults to yesterday
+    """
+    if until is not None:
+        until = date.fromisoformat(until)
+    for day in CrossRef.days_to_fetch(until):
+        fetch_crossref_day.delay(day=day.isoformat())
+
+
+@shared_task(name='fetch_crossref_day')
+@run_only_once('fetch_crossref_day', keys=['day'], timeout=24*3600)
+def fetch_crossref_day(day):
+    """
+    Fetches a single day from Crossref, as part of a backfill
+
+    :param day: the day in ISO format
+    """
+    CrossRef.fetch_backfill_day(date.fromisoformat(day))
+
+@shared_task(name='drain_index_queue')
+@run_only_once('drain_index_queue', timeout=60*60)
+def drain_index_queue():
+    """
+    Indexes the papers waiting in the queue of papers to index
+    """
+    indexqueue.drain()
+
 @shared_task(name='update_oai_sources')
 @run_only_once('update_oai_sources', timeout=24*3600)
 def update_oai_sources():
@@ -142,7 +188,32 @@ def update_oai_sources():
     their last update.
     """
     for source in OaiSource.objects.filter(endpoint__isnull=False):
-        oai = OaiPaperSource(source)
-        oai.ingest(source.last_update.replace(tzinfo=None), metadataPrefix='base_dc')
-        source.last_update = datetime.now()
-        source.save()
+        try:
+            windows = OaiHarvestWindow.plan(source, source.last_update, None,
+                'base_dc', nb_windows=settings.OAI_HARVEST_WINDOWS)
+        except ValueError as e:
+            # Started with the harvest_oai command: it has to be finished there
+            logger.warning('{}, skipping the source'.format(e))
+            continue
+        if len(windows) == 1:
+            harvest_oai_window(window=windows[0].pk)
+        else:
+            for window in windows:
+                harvest_oai_window.delay(window=window.pk)
+
+@shared_task(name='harvest_oai_window')
+@run_only_once('harvest_oai_window', keys=['window'], timeout=24*3600)
+def harvest_oai_window(window):
+    """
+    Harvests a window of an OAI source, resuming from its checkpoint.
+    The last_update of the source advances when all its windows are done.
+
+    :param window: the id of the :class:`OaiHarvestWindow`
+    """
+    try:
+        window = OaiHarvestWindow.objects.get(pk=window)
+    except OaiHarvestWindow.DoesNotExist:
+        # The harvest is complete already
+        return
+    OaiPaperSource(window.source).ingest_window(window)
+    OaiHarvestWindow.advance_source(window.source)
@@ -1,7 +1,10 @@
 import os
 import pytest
+import requests
 import responses
+import time
 
+from copy import deepcopy
 from datetime import date
 from datetime import datetime
 from datetime import timedelta
@@ -10,6 +13,8 @@ from urllib.parse import urlparse
 
 
 from django.conf import settings
+from django.db import connection
+from django.db import IntegrityError
 from django.utils import timezone
 
 from backend.citeproc import CiteprocError
@@ -22,9 +27,11 @@ from backend.citeproc import CiteprocTitleError
 from backend.citeproc import Citeproc
 from backend.citeproc import CrossRef
 from backend.citeproc import DOIResolver
+from dissemin.settings import redis_client
 from papers.baremodels import BareName
 from papers.doi import doi_to_crossref_identifier
 from papers.doi import doi_to_url
+from papers.doicache import doi_cache
 from papers.models import OaiRecord
 from papers.models import OaiSource
 from papers.models import Paper
@@ -518,7 +525,7 @@ class TestCrossRef(TestCiteproc):
         return citeproc
 
 
-    @pytest.mark.usefixtures('db')
+    @pytest.mark.usefixtures('db', 'ledger')
     def test_fetch_latest_records(self, monkeypatch):
         """
         Essentially, we test if source date is updated
@@ -539,6 +546,125 @@ class TestCrossRef(TestCiteproc):
         source.refresh_from_db()
         assert source.last_update.date() == timezone.now().date() - timedelta(days=1)
 
+    def test_fetch_latest_records_backfill(self, monkeypatch, ledger, crossref_source):
+        """
+        If a backfill moves last_update meanwhile, we do not move it back and skip the days it fetched
+        """
+        yesterday = timezone.now() - timedelta(days=1)
+        fetched = []
+        def fetch_day(day):
+            fetched.append(day)
+            OaiSource.objects.filter(identifier='crossref').update(last_update=yesterday)
+        monkeypatch.setattr(self.test_class, '_fetch_day', fetch_day)
+        self.test_class.fetch_latest_records()
+        crossref_source.refresh_from_db()
+        assert crossref_source.last_update == yesterday
+        assert len(fetched) == 1
+
+    @pytest.fixture
+    def run_on_commit(self):
+        """
+        The transaction of a test is never committed, this runs the callbacks waiting for the commit
+        """
+        def run():
+            callbacks, connection.run_on_commit = connection.run_on_commit, []
+            for sids, callback in callbacks:
+                callback()
+        return run
+
+    @pytest.fixture
+    def ledger(self):
+        """
+        Empties the ledger of the backfill before and after a test
+        """
+        redis_client.delete(self.test_class.ledger_key)
+        yield self.test_class.ledger_key
+        redis_client.delete(self.test_class.ledger_key)
+
+    @pytest.fixture
+    def crossref_source(self, db):
+        """
+        The CrossRef source, last updated ten days ago
+        """
+        source = OaiSource.objects.get(identifier='crossref')
+        source.last_update = timezone.now() - timedelta(days=10)
+        source.save()
+        return source
+
+    def test_days_to_fetch(self, ledger, crossref_source):
+        """
+        All days up to yesterday are to be fetched, except those already in the ledger
+        """
+        first_day = (crossref_source.last_update + timedelta(days=1)).date()
+        redis_client.sadd(ledger, (first_day + timedelta(days=2)).isoformat())
+        days = self.test_class.days_to_fetch()
+        assert days[0] == first_day
+        assert days[-1] == date.today() - timedelta(days=1)
+        assert first_day + timedelta(days=2) not in days
+        assert len(days) == 8
+
+    def test_days_to_fetch_until(self, ledger, crossref_source):
+        first_day = (crossref_source.last_update + timedelta(days=1)).date()
+        days = self.test_class.days_to_fetch(first_day + timedelta(days=1))
+        assert days == [first_day, first_day + timedelta(days=1)]
+
+    def test_advance_last_update(self, ledger, crossref_source, run_on_commit):
+        """
+        last_update moves only over the days without gap
+        """
+        last_update = crossref_source.last_update
+        for i in [1, 2, 4]:
+            redis_client.sadd(ledger, (last_update + timedelta(days=i)).date().isoformat())
+        self.test_class.advance_last_update()
+        crossref_source.refresh_from_db()
+        assert crossref_source.last_update == last_update + timedelta(days=2)
+        # The days stay in the ledger until last_update is committed
+        assert len(self.test_class._days_done()) == 3
+        run_on_commit()
+        assert self.test_class._days_done() == {(last_update + timedelta(days=4)).date()}
+
+    def test_fetch_backfill_day(self, monkeypatch, ledger, crossref_source, run_on_commit):
+        """
+        Days can be fetched out of order, last_update catches up when the gap is closed
+        """
+        monkeypatch.setattr(self.test_class, '_fetch_day', lambda day: None)
+        last_update = crossref_source.last_update
+        self.test_class.fetch_backfill_day((last_update + timedelta(days=2)).date())
+        crossref_source.refresh_from_db()
+        assert crossref_source.last_update == last_update
+        self.test_class.fetch_backfill_day((last_update + timedelta(days=1)).date())
+        crossref_source.refresh_from_db()
+        assert crossref_source.last_update == last_update + timedelta(days=2)
+        run_on_commit()
+        assert len(self.test_class._days_done()) == 0
+
+    def test_fetch_backfill_day_twice(self, monkeypatch, ledger, crossref_source, run_on_commit):
+        """
+        A day fetched again once last_update passed it does not linger in the ledger
+        """
+        monkeypatch.setattr(self.test_class, '_fetch_day', lambda day: None)
+        last_update = crossref_source.last_update
+        self.test_class.fetch_backfill_day((last_update + timedelta(days=1)).date())
+        self.test_class.fetch_backfill_day((last_update + timedelta(days=1)).date())
+        crossref_source.refresh_from_db()
+        assert crossref_source.last_update == last_update + timedelta(days=1)
+        run_on_commit()
+        assert len(self.test_class._days_done()) == 0
+
+    def test_fetch_backfill_day_error(self, monkeypatch, ledger, crossref_source):
+        """
+        A failing day is not recorded
+        """
+        def raise_error(day):
+            raise requests.exceptions.ConnectionError('Error')
+        monkeypatch.setattr(self.test_class, '_fetch_day', raise_error)
+        last_update = crossref_source.last_update
+        with pytest.raises(requests.exceptions.ConnectionError):
+            self.test_class.fetch_backfill_day((last_update + timedelta(days=1)).date())
+        crossref_source.refresh_from_db()
+        assert crossref_source.last_update == last_update
+        assert len(self.test_class._days_done()) == 0
+
     @responses.activate
     @pytest.mark.usefixtures('db')
     def test_fetch_batch(self):
@@ -564,6 +690,29 @@ class TestCrossRef(TestCiteproc):
         for paper, doi in zip(papers, dois):
             assert paper.get_doi() == doi.lower()
 
+    @responses.activate
+    @pytest.mark.usefixtures('db')
+    def test_fetch_batch_several_requests(self):
+        """
+        DOIs are requested by batches, the results are in the order of the DOIs
+        """
+        f_path = os.path.join(settings.BASE_DIR, 'backend', 'tests', 'data', 'crossref_batch.json')
+        with open(f_path, 'r') as f:
+            body = f.read()
+        responses.add(
+            responses.GET,
+            url='https://api.crossref.org/works',
+            body=body,
+            status=200,
+        )
+        unknown_dois = ['10.spanish/inquisition.{}'.format(i) for i in range(2 * self.test_class.batch_length)]
+        dois = unknown_dois + ['10.1016/j.gsd.2018.08.007', '10.1109/sYnAsc.2010.88']
+        papers = self.test_class.fetch_batch(dois)
+        assert len(responses.calls) == 3
+        assert papers[:-2] == [None] * len(unknown_dois)
+        for paper, doi in zip(papers[-2:], dois[-2:]):
+            assert paper.get_doi() == doi.lower()
+
     @responses.activate
     @pytest.mark.usefixtures('db')
     def test_fetch_batch_doi_not_found(self):
@@ -643,7 +792,7 @@ class TestCrossRef(TestCiteproc):
         """
         def callback(*args, **kwargs):
             raise CiteprocError('Error')
-        monkeypatch.setattr(self.test_class, 'to_paper', callback)
+        monkeypatch.setattr(self.test_class, 'to_bare_paper', callback)
         day = date.today()
         self.test_class._fetch_day(day)
 
@@ -654,11 +803,171 @@ class TestCrossRef(TestCiteproc):
         """
         def callback(*args, **kwargs):
             raise ValueError('Error')
-        monkeypatch.setattr(self.test_class, 'to_paper', callback)
+        monkeypatch.setattr(self.test_class, 'to_bare_paper', callback)
         day = date.today()
         self.test_class._fetch_day(day)
 
 
+    @pytest.mark.usefixtures('db')
+    def test_fetch_day_single_ingest(self, monkeypatch, rsps_fetch_day):
+        """
+        Without bulk ingest, papers are saved one after the other and we get the same papers
+        """
+        monkeypatch.setattr(self.test_class, 'bulk_ingest', False)
+        self.test_class.rows = 30
+        day = date.today()
+        self.test_class._fetch_day(day)
+        assert Paper.objects.count() > 0
+
+    @pytest.mark.usefixtures('db')
+    def test_fetch_day_no_prefetch(self, monkeypatch, rsps_fetch_day):
+        """
+        Without prefetching, we follow the cursor through all pages as well
+        """
+        monkeypatch.setattr(self.test_class, 'prefetch_pages', 0)
+        day = date.today()
+        self.test_class._fetch_day(day)
+        assert len(rsps_fetch_day.calls) == 6
+        assert Paper.objects.count() > 0
+
+    def test_fetch_pages(self, rsps_fetch_day):
+        """
+        Pages are yielded until there are no more items
+        """
+        pages = list(self.test_class._fetch_pages(date.today()))
+        assert len(pages) == 5
+        assert len(rsps_fetch_day.calls) == 6
+
+    def test_prefetch(self):
+        """
+        The pages come in the same order as from the generator
+        """
+        pages = list(self.test_class._prefetch(iter(range(10)), 2))
+        assert pages == list(range(10))
+
+    def test_prefetch_bounded(self):
+        """
+        The producer does not run further ahead than the depth of the buffer
+        """
+        produced = []
+        def pages():
+            for i in range(10):
+                produced.append(i)
+                yield i
+        prefetched = self.test_class._prefetch(pages(), 2)
+        assert next(prefetched) == 0
+        time.sleep(0.2)
+        # One in the hand of the consumer, two in the buffer and one waiting to be put
+        assert len(produced) <= 4
+        assert list(prefetched) == list(range(1, 10))
+
+    def test_prefetch_exception(self):
+        """
+        Exceptions raised while fetching are raised in the consumer
+        """
+        def pages():
+            yield 1
+            raise requests.exceptions.ConnectionError('Error')
+        prefetched = self.test_class._prefetch(pages(), 2)
+        assert next(prefetched) == 1
+        with pytest.raises(requests.exceptions.ConnectionError):
+            next(prefetched)
+
+    @pytest.mark.usefixtures('db')
+    def test_to_papers(self, citeproc):
+        """
+        Papers must be created and records attached
+        """
+        papers = self.test_class.to_papers([citeproc])
+        assert len(papers) == 1
+        p = papers[0]
+        assert p.pk >= 1
+        assert p.get_doi() == citeproc['DOI'].lower()
+        assert OaiRecord.objects.filter(about=p).count() == 1
+
+    @pytest.mark.usefixtures('db')
+    def test_to_papers_update(self, citeproc):
+        """
+        Harvesting the same item twice must update the existing paper and record
+        """
+        p = self.test_class.to_papers([deepcopy(citeproc)])[0]
+        citeproc['abstract'] = 'A detective story, with a labyrinth'
+        q = self.test_class.to_papers([deepcopy(citeproc)])[0]
+        assert p.pk == q.pk
+        r = OaiRecord.objects.get(about=q)
+        assert r.description == citeproc['abstract']
+
+    @pytest.mark.usefixtures('db')
+    def test_to_papers_update_merge(self, citeproc):
+        """
+        Harvesting an item again must not overwrite better metadata of its record
+        """
+        p = self.test_class.to_papers([deepcopy(citeproc)])[0]
+        source = OaiSource.objects.create(identifier='repo', name='Repository', oa=True, priority=10)
+        pdf_url = 'https://repository.example.org/paper.pdf'
+        description = 'A detective story, with a labyrinth and a garden of forking paths'
+        OaiRecord.objects.filter(about=p).update(source=source, priority=10, pdf_url=pdf_url, description=description)
+        citeproc['issued'] = {'date-parts': [[2000, 1, 1]]}
+        q = self.test_class.to_papers([deepcopy(citeproc)])[0]
+        assert p.pk == q.pk
+        r = OaiRecord.objects.get(about=q)
+        assert r.source == source
+        assert r.pdf_url == pdf_url
+        assert r.description == description
+        assert Paper.objects.get(pk=p.pk).pubdate == date(2000, 1, 1)
+
+    @pytest.mark.usefixtures('db')
+    def test_to_papers_duplicates(self, citeproc):
+        """
+        The same item twice in a page must result in one paper
+        """
+        papers = self.test_class.to_papers([deepcopy(citeproc), deepcopy(citeproc)])
+        assert len(papers) == 2
+        assert papers[0].pk == papers[1].pk
+        assert Paper.objects.count() == 1
+
+    @pytest.mark.usefixtures('db')
+    def test_to_papers_concurrent(self, citeproc, monkeypatch):
+        """
+        If another process creates the paper while the page is saved, we end up with one paper
+        """
+        find_duplicates = OaiRecord.find_duplicate_records_batch
+        def create_concurrently(candidates):
+            # The other process creates the paper once we have looked it up
+            Paper.from_bare(self.test_class.to_bare_paper(deepcopy(citeproc)))
+            return find_duplicates(candidates)
+        monkeypatch.setattr(OaiRecord, 'find_duplicate_records_batch', create_concurrently)
+        papers = self.test_class.to_papers([deepcopy(citeproc)])
+        assert len(papers) == 1
+        assert Paper.objects.count() == 1
+        assert papers[0].pk == Paper.objects.get().pk
+
+    @pytest.mark.usefixtures('db')
+    def test_to_papers_conflict_retry(self, citeproc, monkeypatch):
+        """
+        A paper whose saving conflicts with another process is saved again
+        """
+        from_bare = Paper.from_bare
+        conflicts = []
+        def conflicting_from_bare(bare_paper):
+            if not conflicts:
+                conflicts.append(bare_paper)
+                raise IntegrityError('duplicate key value violates unique constraint')
+            return from_bare(bare_paper)
+        monkeypatch.setattr(Paper, 'from_bare', conflicting_from_bare)
+        papers = self.test_class.to_papers([deepcopy(citeproc), deepcopy(citeproc)])
+        assert conflicts
+        assert papers[0] is not None
+        assert papers[0].pk == papers[1].pk
+
+    def test_to_papers_invalid_item(self, monkeypatch):
+        """
+        Invalid items are skipped
+        """
+        monkeypatch.setattr(Paper, 'from_bare_batch', lambda x: x)
+        monkeypatch.setattr(Paper, 'update_index_batch', lambda x: None)
+        assert self.test_class.to_papers(['spam']) == []
+
     def test_filter_dois_by_comma(self):
         """
         Tests filtering of DOIs wheter they have a ',' or not
@@ -744,3 +1053,15 @@ class TestDOI(TestCiteproc):
         q = self.test_class.save_doi(doi)
 
         assert p == q
+
+    @pytest.mark.usefixtures('db')
+    def test_save_doi_stale_cache(self, mock_doi):
+        """
+        If the cached paper of the DOI is not the right one, we fetch the DOI again
+        """
+        doi = '10.1016/j.gsd.2018.08.007'
+        p = self.test_class.save_doi(doi)
+        doi_cache.set(doi, p.pk + 1000)
+        assert self.test_class._is_up_to_date(doi) is None
+        doi_cache.set(doi, p.pk)
+        assert self.test_class._is_up_to_date(doi).about == p
@@ -0,0 +1,107 @@
+import codecs
+import os
+import pytest
+import re
+import time
+
+from oaipmh.metadata import MetadataRegistry
+
+from backend.extractors import REGISTERED_OAI_EXTRACTORS
+from backend.extractors import RegexExtractor
+from backend.extractors import baseExtractor
+from backend.oaireader import OaiRecordStream
+from backend.oaireader import base_dc_reader
+
+
+class Header(object):
+
+    def __init__(self, identifier):
+        self._identifier = identifier
+
+    def identifier(self):
+        return self._identifier
+
+
+def naive_urls(extractor, metadata):
+    """
+    Extracts URLs by trying all the mappings on all the values, in order,
+    keeping the last match for each resource type
+    """
+    urls = dict()
+    for (field, regex, resource_type, skeleton) in extractor.mappings:
+        for val in metadata[field]:
+            val = val.strip()
+            if regex.match(val):
+                urls[resource_type] = regex.sub(skeleton, val)
+    return urls
+
+
+def recorded_base_records():
+    """
+    The metadata of the BASE records stored in the test data
+    """
+    registry = MetadataRegistry()
+    registry.registerReader('base_dc', base_dc_reader)
+    datadir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+    records = []
+    for fname in sorted(os.listdir(datadir)):
+        if not fname.startswith('ft') or not fname.endswith('.xml'):
+            continue
+        with codecs.open(os.path.join(datadir, fname), 'r', 'utf-8') as f:
+            record = re.search(r'<record>.*</record>', f.read(), re.DOTALL).group(0)
+        page = ('<?xml version="1.0" encoding="UTF-8"?>'
+            '<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">'
+            '<ListRecords>{}</ListRecords></OAI-PMH>').format(record).encode('utf-8')
+        for header, metadata, _ in OaiRecordStream(page, 'base_dc', registry):
+            records.append((header, metadata.getMap()))
+    return records
+
+
+def test_last_match_wins():
+    extractor = RegexExtractor([
+        ('identifier', re.compile(r'(https?://.*)'), 'splash', r'\1'),
+        ('relation', re.compile(r'(https?://.*\.pdf)'), 'pdf', r'\1'),
+        ('identifier', re.compile(r'(https?://.*\.pdf)'), 'pdf', r'\1'),
+    ])
+    metadata = {
+        'identifier': ['http://a.org/1.pdf', ' http://a.org/2 ', 'no url'],
+        'relation': ['http://b.org/3.pdf', 'http://b.org/4.pdf'],
+    }
+    urls = extractor.extract(Header('oai:a.org:1'), metadata)
+    assert urls == {'splash': 'http://a.org/2', 'pdf': 'http://a.org/1.pdf'}
+    assert urls == naive_urls(extractor, metadata)
+
+
+def test_missing_fields():
+    assert baseExtractor.extract(Header('oai:a.org:1'), {'identifier': [], 'link': []}) == {}
+
+
+def test_same_urls_as_naive_extraction():
+    for header, metadata in recorded_base_records():
+        for extractor in REGISTERED_OAI_EXTRACTORS.values():
+            extractor.header = header
+            extractor.metadata = metadata
+            assert extractor._urls() == naive_urls(extractor, metadata)
+
+
+@pytest.mark.benchmark
+def test_benchmark_base_extractor():
+    """
+    Extracts the URLs of the recorded BASE records, many times over
+    """
+    records = recorded_base_records() * 2000
+
+    start = time.perf_counter()
+    for header, metadata in records:
+        naive_urls(baseExtractor, metadata)
+    naive = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for header, metadata in records:
+        baseExtractor.header = header
+        baseExtractor.metadata = metadata
+        baseExtractor._urls()
+    ranked = time.perf_counter() - start
+
+    print('naive URL extraction: {:.0f} records/sec'.format(len(records) / naive))
+    print('BASE extractor: {:.0f} records/sec'.format(len(records) / ranked))
@@ -1,7 +1,14 @@
+import json
+import os
 import pytest
 
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from django.core.management import call_command
 from django.test import TestCase
 
+from backend.maintenance import update_index_parallel
 from backend.maintenance import update_paper_statuses, unmerge_paper_by_dois
 from papers.models import OaiRecord
 from papers.models import Paper
@@ -44,3 +51,43 @@ class MaintenanceTest(TestCase):
         self.assertTrue(p4.id != p1.id)
         self.assertTrue(p4.id != p3.id)
         self.assertEqual(p4.title, title2)
+
+    def test_update_index_parallel(self):
+        p1 = Paper.create_by_doi('10.1016/j.bmc.2005.06.035')
+        p2 = Paper.create_by_doi('10.1016/j.ijar.2017.06.011')
+        with mock.patch('backend.maintenance.bulk') as bulk:
+            update_index_parallel(Paper, processes=1, batch_size=1)
+        sent = [doc['_id'] for call in bulk.call_args_list for doc in call[0][1]]
+        self.assertTrue('papers.paper.{}'.format(p1.pk) in sent)
+        self.assertTrue('papers.paper.{}'.format(p2.pk) in sent)
+        self.assertEqual(len(sent), len(set(sent)))
+        self.assertEqual(len(sent), Paper.objects.count())
+
+    def test_update_index_parallel_resume(self):
+        Paper.create_by_doi('10.1016/j.bmc.2005.06.035')
+        p2 = Paper.create_by_doi('10.1016/j.ijar.2017.06.011')
+        with TemporaryDirectory() as checkpoint_dir:
+            with mock.patch('backend.maintenance.bulk'):
+                update_index_parallel(Paper, processes=1, checkpoint_dir=checkpoint_dir)
+            with open(os.path.join(checkpoint_dir, 'ranges.json')) as f:
+                ranges = json.load(f)
+            self.assertEqual(ranges[-1][1], p2.pk)
+
+            # Everything is done already: nothing is sent again
+            with mock.patch('backend.maintenance.bulk') as bulk:
+                update_index_parallel(Paper, processes=1, checkpoint_dir=checkpoint_dir)
+            self.assertEqual(bulk.call_count, 0)
+
+    def test_populate_url_keys(self):
+        p = Paper.create_by_doi('10.1016/j.bmc.2005.06.035')
+        record = OaiRecord.new(source=self.arxiv,
+                      identifier='oai:arXiv.org:aunrisste',
+                      about=p,
+                      splash_url='http://www.perdu.com/',
+                      pdf_url='https://www.perdu.com/paper.pdf')
+        OaiRecord.objects.filter(pk=record.pk).update(splash_key=None, pdf_key=None)
+        call_command('populate_url_keys', batch_size=1)
+        record = OaiRecord.objects.get(pk=record.pk)
+        self.assertEqual(record.splash_key, '://www.perdu.com/')
+        self.assertEqual(record.pdf_key, '://www.perdu.com/paper.pdf')
+        self.assertFalse(OaiRecord.objects.filter(splash_key__isnull=True).exists())
@@ -1,9 +1,11 @@
 import os
 import pytest
+import tempfile
 
 import django.test
 
 from backend.oadoi import OadoiAPI
+from backend.oadoi import doi_shard
 from papers.models import Paper
 
 @pytest.mark.usefixtures("load_test_data")
@@ -28,3 +30,48 @@ class OadoiAPITest(django.test.TestCase):
         # the paper is now OA, yay!
         p = Paper.get_by_doi(doi)
         self.assertEqual(p.pdf_url, 'http://europepmc.org/articles/pmc5718814?pdf=render')
+
+    def test_read_dump_chunks(self):
+        oadoi = OadoiAPI()
+        filename = os.path.join(self.testdir, 'data/sample_unpaywall_snapshot.jsonl.gz')
+        chunks = list(oadoi.read_dump_chunks(filename, chunk_size=4))
+        self.assertEqual([len(records) for _, records in chunks], [4, 4, 2])
+        # Resuming from the offset of a chunk yields the remaining records
+        offset = chunks[0][0]
+        records = [record for _, record in oadoi.read_dump_from_offset(filename, offset)]
+        self.assertEqual(records, chunks[1][1] + chunks[2][1])
+
+    def test_load_dump_checkpoint(self):
+        oadoi = OadoiAPI()
+        filename = os.path.join(self.testdir, 'data/sample_unpaywall_snapshot.jsonl.gz')
+        with tempfile.TemporaryDirectory() as tmpdir:
+            checkpoint = os.path.join(tmpdir, 'oadoi.checkpoint')
+            self.assertEqual(oadoi.read_checkpoint(checkpoint), 0)
+            oadoi.load_dump(filename, create_missing_dois=False, checkpoint=checkpoint, chunk_size=4)
+            offset, _ = list(oadoi.read_dump_chunks(filename, chunk_size=4))[-1]
+            self.assertEqual(oadoi.read_checkpoint(checkpoint), offset)
+
+    @pytest.mark.usefixtures('mock_doi')
+    def test_load_records(self):
+        doi = '10.1080/21645515.2017.1330236'
+        Paper.create_by_doi(doi)
+        oadoi = OadoiAPI()
+        filename = os.path.join(self.testdir, 'data/sample_unpaywall_snapshot.jsonl.gz')
+        records = [record for _, record in oadoi.read_dump_from_offset(filename)]
+        oadoi.load_records(records, create_missing_dois=False)
+        p = Paper.get_by_doi(doi)
+        self.assertEqual(p.pdf_url, 'http://europepmc.org/articles/pmc5718814?pdf=render')
+
+    def test_read_dump_shards(self):
+        """
+        The shards form a partition of the dump
+        """
+        oadoi = OadoiAPI()
+        filename = os.path.join(self.testdir, 'data/sample_unpaywall_snapshot.jsonl.gz')
+        all_dois = [record['doi'] for _, record in oadoi.read_dump_from_offset(filename)]
+        shard_dois = []
+        for shard in range(3):
+            for _, record in oadoi.read_dump_from_offset(filename, shard=shard, nb_shards=3):
+                self.assertEqual(doi_shard(record['doi'], 3), shard)
+                shard_dois.append(record['doi'])
+        self.assertEqual(sorted(shard_dois), sorted(all_dois))
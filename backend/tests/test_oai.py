@@ -23,16 +23,27 @@
 import codecs
 import os
 import pytest
+import pytz
+import re
 import unittest
 
+from datetime import datetime
+from io import BytesIO
+
+from mock import Mock
 from mock import patch
+from oaipmh.error import BadResumptionTokenError
 from oaipmh.error import CannotDisseminateFormatError
 from oaipmh.error import IdDoesNotExistError
+from oaipmh.error import NoRecordsMatchError
 from oaipmh.client import Client
 
 from django.test import TestCase
 
 from backend.oai import OaiPaperSource
+from backend.oai import PageEnd
+from backend.oaireader import OaiRecordStream
+from papers.models import OaiHarvestWindow
 from papers.models import OaiRecord
 from papers.models import OaiSource
 from papers.models import Paper
@@ -310,3 +321,181 @@ class OaiTest(TestCase):
                 'ftdatacite:oai:oai.datacite.org:3505359',
                 'base_dc')
         self.assertTrue(paper.pdf_url is not None)
+
+
+class OaiHarvestTest(TestCase):
+
+    def setUp(self):
+        self.source = OaiSource.objects.get(identifier='base')
+        self.source.endpoint = 'https://some_endpoint'
+        self.source.save()
+        self.oai = OaiPaperSource(self.source)
+        self.testdir = os.path.dirname(os.path.abspath(__file__))
+        self.until = datetime(2019, 1, 1, tzinfo=pytz.UTC)
+
+    def page(self, identifier, token):
+        """
+        A page of ListRecords with the record of a test file
+        """
+        fname = identifier.replace('/', '_') + '.xml'
+        with codecs.open(os.path.join(self.testdir, 'data', fname), 'r', 'utf-8') as f:
+            record = re.search(r'<record>.*</record>', f.read(), re.DOTALL).group(0)
+        return ('<?xml version="1.0" encoding="UTF-8"?>'
+            '<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">'
+            '<responseDate>2019-02-16T16:55:54Z</responseDate>'
+            '<request verb="ListRecords">https://some_endpoint</request>'
+            '<ListRecords>{}<resumptionToken>{}</resumptionToken></ListRecords>'
+            '</OAI-PMH>').format(record, token or '').encode('utf-8')
+
+    def responses(self, fail_on_second_page=False):
+        def make_request(**kwargs):
+            if kwargs.get('resumptionToken') == 'page2':
+                if fail_on_second_page:
+                    raise IOError('connection lost')
+                return BytesIO(self.page('ftunivsavoie:oai:HAL:hal-01062339v1', None))
+            return BytesIO(self.page('ftunivsavoie:oai:HAL:hal-01062241v1', 'page2'))
+        return make_request
+
+    def test_list_records(self):
+        with patch.object(OaiPaperSource, 'open_request', side_effect=self.responses()):
+            items = list(self.oai.list_records('base_dc', from_date=self.until))
+        self.assertEqual(len(items), 4)
+        self.assertEqual([items[1], items[3]], [PageEnd('page2'), PageEnd(None)])
+        self.assertEqual([items[0][0].identifier(), items[2][0].identifier()],
+            ['ftunivsavoie:oai:HAL:hal-01062241v1', 'ftunivsavoie:oai:HAL:hal-01062339v1'])
+
+    def test_list_records_streamed(self):
+        response = Mock(raw=BytesIO(self.page('ftunivsavoie:oai:HAL:hal-01062339v1', None)))
+        with patch('backend.oai.request_retry', return_value=response) as request:
+            items = list(self.oai.list_records('base_dc', until=self.until))
+        self.assertEqual(len(items), 2)
+        self.assertEqual(request.call_args[1]['params']['verb'], 'ListRecords')
+        # The response is parsed as it is downloaded, then closed
+        self.assertTrue(request.call_args[1]['stream'])
+        self.assertTrue(response.raw.decode_content)
+        self.assertTrue(response.raw.closed)
+
+    def test_ingest(self):
+        with patch.object(OaiPaperSource, 'open_request', side_effect=self.responses()) as open_request:
+            self.oai.ingest(metadataPrefix='base_dc')
+        self.assertEqual(open_request.call_count, 2)
+        self.assertEqual(OaiRecord.objects.filter(identifier__in=[
+            'ftunivsavoie:oai:HAL:hal-01062241v1', 'ftunivsavoie:oai:HAL:hal-01062339v1']).count(), 2)
+
+    def test_plan(self):
+        start = datetime(2018, 1, 1, tzinfo=pytz.UTC)
+        windows = OaiHarvestWindow.plan(self.source, start, self.until, 'base_dc', nb_windows=4)
+        self.assertEqual(len(windows), 4)
+        self.assertEqual(windows[0].from_date, start)
+        self.assertEqual(windows[-1].until, self.until)
+        for previous, window in zip(windows, windows[1:]):
+            self.assertEqual(previous.until, window.from_date)
+        # Pending windows are resumed instead of planning new ones
+        self.assertEqual(
+            [w.pk for w in OaiHarvestWindow.plan(self.source, start, self.until, 'base_dc', nb_windows=2)],
+            [w.pk for w in windows])
+        # Without an end, the pending harvest is resumed as well
+        windows[0].checkpoint(None)
+        self.assertEqual(
+            [w.pk for w in OaiHarvestWindow.plan(self.source, start, None, 'base_dc')],
+            [w.pk for w in windows[1:]])
+
+    def test_plan_other_range(self):
+        start = datetime(2018, 1, 1, tzinfo=pytz.UTC)
+        OaiHarvestWindow.plan(self.source, start, self.until, 'base_dc', nb_windows=4)
+        # Another range cannot be harvested before the pending harvest is done
+        with self.assertRaises(ValueError):
+            OaiHarvestWindow.plan(self.source, None, self.until, 'base_dc')
+        with self.assertRaises(ValueError):
+            OaiHarvestWindow.plan(self.source, start, datetime(2018, 6, 1, tzinfo=pytz.UTC), 'base_dc')
+        self.assertEqual(OaiHarvestWindow.objects.filter(source=self.source).count(), 4)
+
+    def test_harvest_resume(self):
+        with patch.object(OaiPaperSource, 'open_request', side_effect=self.responses(fail_on_second_page=True)):
+            with self.assertRaises(IOError):
+                self.oai.harvest(until=self.until, metadataPrefix='base_dc')
+
+        # The first page has been saved, with its checkpoint
+        self.assertTrue(OaiRecord.objects.filter(identifier='ftunivsavoie:oai:HAL:hal-01062241v1').exists())
+        window = OaiHarvestWindow.objects.get(source=self.source)
+        self.assertEqual(window.resumption_token, 'page2')
+        self.assertEqual(window.last_datestamp, datetime(2016, 11, 28, 10, 39, 57, tzinfo=pytz.UTC))
+        self.assertFalse(window.done)
+
+        with patch.object(OaiPaperSource, 'open_request', side_effect=self.responses()):
+            self.oai.harvest(until=self.until, metadataPrefix='base_dc')
+        self.assertTrue(OaiRecord.objects.filter(identifier='ftunivsavoie:oai:HAL:hal-01062339v1').exists())
+        self.assertFalse(OaiHarvestWindow.objects.filter(source=self.source).exists())
+        self.assertEqual(OaiSource.objects.get(pk=self.source.pk).last_update, self.until)
+
+    def test_harvest_expired_token(self):
+        start = datetime(2016, 1, 1, tzinfo=pytz.UTC)
+        window = OaiHarvestWindow.plan(self.source, start, self.until, 'base_dc')[0]
+        window.checkpoint('expired', datetime(2016, 11, 28, 10, 39, 57, tzinfo=pytz.UTC))
+        requests = []
+        def make_request(**kwargs):
+            requests.append(kwargs)
+            if kwargs.get('resumptionToken') == 'expired':
+                raise BadResumptionTokenError('expired')
+            return BytesIO(self.page('ftunivsavoie:oai:HAL:hal-01062339v1', None))
+
+        with patch.object(OaiPaperSource, 'open_request', side_effect=make_request):
+            self.oai.ingest_window(window)
+        # The whole window is harvested again, as records before the
+        # latest datestamp seen might not have been listed yet
+        self.assertEqual(requests[1]['from'], '2016-01-01T00:00:00Z')
+        self.assertTrue(window.done)
+
+    def test_process_record_batch(self):
+        with patch.object(OaiPaperSource, 'open_request', side_effect=self.responses()):
+            records = [r for r in self.oai.list_records('base_dc') if not isinstance(r, PageEnd)]
+        papers = self.oai.process_record_batch(records, 'base_dc')
+        self.assertEqual(len(papers), 2)
+        self.assertEqual(
+            set(OaiRecord.objects.filter(about__in=papers).values_list('identifier', flat=True)),
+            {'ftunivsavoie:oai:HAL:hal-01062241v1', 'ftunivsavoie:oai:HAL:hal-01062339v1'})
+
+        # Harvesting the same records again does not create anything
+        nb_records = OaiRecord.objects.count()
+        again = self.oai.process_record_batch(records, 'base_dc')
+        self.assertEqual([p.pk for p in again], [p.pk for p in papers])
+        self.assertEqual(OaiRecord.objects.count(), nb_records)
+
+    def test_harvest_one_by_one(self):
+        self.oai.bulk_ingest = False
+        with patch.object(OaiPaperSource, 'open_request', side_effect=self.responses()):
+            self.oai.harvest(until=self.until, metadataPrefix='base_dc')
+        self.assertEqual(OaiRecord.objects.filter(identifier__in=[
+            'ftunivsavoie:oai:HAL:hal-01062241v1', 'ftunivsavoie:oai:HAL:hal-01062339v1']).count(), 2)
+
+    def test_record_stream(self):
+        stream = OaiRecordStream(self.page('ftunivsavoie:oai:HAL:hal-01062241v1', 'page2'),
+                                 'base_dc', self.oai.registry)
+        records = list(stream)
+        self.assertEqual(stream.resumption_token, 'page2')
+        self.assertEqual(len(records), 1)
+        header, metadata, _ = records[0]
+        self.assertEqual(header.identifier(), 'ftunivsavoie:oai:HAL:hal-01062241v1')
+        self.assertEqual(header.datestamp(), datetime(2016, 11, 28, 10, 39, 57))
+        self.assertEqual(metadata.getField('creator')[:2], ['Lim, T.', 'Jimenez, J.'])
+        # The records do not hold parts of the tree
+        self.assertIsNone(header.element())
+        self.assertIsNone(metadata.element())
+
+    def test_record_stream_error(self):
+        response = (b'<?xml version="1.0" encoding="UTF-8"?>'
+            b'<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">'
+            b'<responseDate>2019-02-16T16:55:54Z</responseDate>'
+            b'<error code="noRecordsMatch">No records</error></OAI-PMH>')
+        with self.assertRaises(NoRecordsMatchError):
+            list(OaiRecordStream(response, 'base_dc', self.oai.registry))
+
+    def test_harvest_no_records(self):
+        no_records = (b'<?xml version="1.0" encoding="UTF-8"?>'
+            b'<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">'
+            b'<responseDate>2019-02-16T16:55:54Z</responseDate>'
+            b'<request verb="ListRecords">https://some_endpoint</request>'
+            b'<error code="noRecordsMatch">No records</error></OAI-PMH>')
+        with patch.object(OaiPaperSource, 'open_request', return_value=BytesIO(no_records)):
+            self.oai.harvest(until=self.until, metadataPrefix='base_dc')
+        self.assertEqual(OaiSource.objects.get(pk=self.source.pk).last_update, self.until)
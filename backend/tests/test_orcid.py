@@ -1,14 +1,18 @@
 # -*- encoding: utf-8 -*-
 
 
+import json
 import pytest
 import unittest
 
+from mock import patch
+
 from backend.citeproc import CrossRef
 from backend.orcid import affiliate_author_with_orcid
 from backend.orcid import OrcidPaperSource
 from papers.models import Paper
 from papers.models import Researcher
+from papers.orcid import OrcidProfile
 from papers.tests.test_orcid import OrcidProfileStub
 
 
@@ -97,6 +101,41 @@ class TestOrcid():
         assert papers[0] is None
 
 
+    def test_bulk_import(self, db, tmpdir, monkeypatch):
+        """
+        Profiles are imported from the dump only, and not imported again when resuming
+        """
+        profile = OrcidProfileStub('0000-0001-6723-6833')
+        record = dict(profile.json, bulk=profile.request_element('works/36115041')['bulk'])
+        dump = tmpdir.mkdir('dump')
+        dump.join('0000-0001-6723-6833.json').write(json.dumps(record))
+        dump.join('invalid.json').write('{')
+        manifest_dir = str(tmpdir.join('manifests'))
+        monkeypatch.setattr(OrcidProfile, 'request_element', raise_error)
+
+        OrcidPaperSource().bulk_import(str(dump), manifest_dir=manifest_dir)
+        researcher = Researcher.objects.get(orcid='0000-0001-6723-6833')
+        assert researcher.name.last == 'Boersch-Supan'
+        assert OrcidPaperSource.read_manifests(manifest_dir) == {'0000-0001-6723-6833.json', 'invalid.json'}
+
+        monkeypatch.setattr(Researcher, 'get_or_create_by_orcid_batch', raise_error)
+        OrcidPaperSource().bulk_import(str(dump), manifest_dir=manifest_dir)
+
+    def test_dump_files_shards(self, tmpdir):
+        dump = tmpdir.mkdir('dump')
+        for i in range(10):
+            dump.mkdir(str(i)).join('{}.json'.format(i)).write('{}')
+        all_files = set(OrcidPaperSource.dump_files(str(dump)))
+        assert len(all_files) == 10
+        shards = [set(OrcidPaperSource.dump_files(str(dump), shard, 3)) for shard in range(3)]
+        assert set.union(*shards) == all_files
+        assert sum(len(shard) for shard in shards) == 10
+
+
+def raise_error(*args, **kwargs):
+    raise AssertionError('Unexpected call')
+
+
 class OrcidUnitTest(unittest.TestCase):
 
     def test_affiliate_author(self):
@@ -202,6 +241,34 @@ class OrcidIntegrationTest(unittest.TestCase):
         p2 = Paper.objects.get(title='Information quality and uncertainty')
         self.assertTrue(p1 != p2)
         
+    @pytest.mark.usefixtures('mock_crossref')
+    def test_incremental_refresh(self):
+        profile = OrcidProfileStub('0000-0002-6293-3231', instance='orcid.org')
+        pablo = Researcher.get_or_create_by_orcid('0000-0002-6293-3231', profile=profile)
+        self.source.fetch_and_save(pablo, profile=profile, incremental=True)
+        pablo.refresh_from_db()
+        self.assertEqual(pablo.orcid_last_modified, profile.last_modified)
+        self.assertEqual(len(pablo.orcid_work_dates), 9)
+
+        # The profile has not changed: nothing is fetched
+        with patch.object(OrcidPaperSource, 'fetch_orcid_records') as fetch:
+            self.source.fetch_and_save(pablo, profile=profile, incremental=True)
+        fetch.assert_not_called()
+        self.assertEqual(self.source.skipped_works, 9)
+
+        # One work has changed: it is the only one fetched
+        pablo.orcid_last_modified = None
+        pablo.orcid_work_dates['26309303'] -= 1
+        with patch.object(OrcidPaperSource, 'fetch_metadata_from_dois', return_value=[]) as fetch:
+            self.source.fetch_and_save(pablo, profile=profile, incremental=True)
+        self.assertEqual(fetch.call_args[0][2], [profile.work_summaries[0].doi.lower()])
+        self.assertEqual(self.source.skipped_works, 8)
+        # It could not be imported: it is fetched again by the next refresh
+        pablo.refresh_from_db()
+        self.assertEqual(pablo.orcid_last_modified, None)
+        self.assertEqual(len(pablo.orcid_work_dates), 8)
+        self.assertNotIn('26309303', pablo.orcid_work_dates)
+
     @pytest.mark.usefixtures('mock_crossref')
     def test_link_existing_papers(self):
         # Fetch papers from a researcher
@@ -222,12 +289,16 @@ class OrcidIntegrationTest(unittest.TestCase):
         
         # Now the profile has no papers anymore    
         self.assertEqual(pablo.papers.count(), 0)
+        versions = {paper.pk: Paper.objects.get(pk=paper.pk).cache_version for paper in papers}
         
         # Let's fix that!
         self.source.link_existing_papers(pablo)
         
         # Now it's fine!!
         self.assertEqual(Researcher.objects.get(id=pablo.id).papers.count(), 9)
+        # and the cached renderings of the papers are invalidated
+        for paper in Researcher.objects.get(id=pablo.id).papers:
+            self.assertGreater(paper.cache_version, versions[paper.pk])
                 
 
 
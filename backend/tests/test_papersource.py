@@ -0,0 +1,50 @@
+import pytest
+
+from backend.papersource import PaperSource
+from papers.models import Paper
+from papers.models import Researcher
+
+
+@pytest.mark.usefixtures('db')
+class TestAssociateResearchers():
+
+    @staticmethod
+    def create_paper(orcids):
+        return Paper.objects.create(
+            pubdate='2019-10-08',
+            authors_list=[{
+                'name': {'first': 'John', 'last': 'Doe{}'.format(idx), 'full': 'john doe{}'.format(idx)},
+                'orcid': orcid,
+                'affiliation': None,
+                'researcher_id': None,
+            } for idx, orcid in enumerate(orcids)]
+        )
+
+    def test_associate_researchers_batch(self, django_assert_num_queries):
+        antonin = Researcher.create_by_name('Antonin', 'Delpeuch', orcid='0000-0002-8612-8827')
+        pablo = Researcher.create_by_name('Pablo', 'Rauzy', orcid='0000-0002-6293-3231')
+        p1 = self.create_paper(['0000-0002-8612-8827', None, '0000-0002-6293-3231'])
+        p2 = self.create_paper(['0000-0001-6723-6833'])
+        p3 = self.create_paper(['0000-0002-6293-3231'])
+        version = p1.cache_version
+
+        # One query to find the researchers, one to update the papers
+        with django_assert_num_queries(2):
+            PaperSource().associate_researchers_batch([p1, p2, p3])
+
+        researcher_ids = lambda paper: [author['researcher_id'] for author in Paper.objects.get(pk=paper.pk).authors_list]
+        assert researcher_ids(p1) == [antonin.pk, None, pablo.pk]
+        assert researcher_ids(p2) == [None]
+        assert researcher_ids(p3) == [pablo.pk]
+        # The cached renderings of the updated papers are invalidated
+        assert Paper.objects.get(pk=p1.pk).cache_version > version
+        assert Paper.objects.get(pk=p2.pk).cache_version == p2.cache_version
+
+        # Nothing to update anymore
+        with django_assert_num_queries(1):
+            PaperSource().associate_researchers_batch([p1, p2, p3])
+
+    def test_associate_researchers_no_orcid(self, django_assert_num_queries):
+        paper = self.create_paper([None])
+        with django_assert_num_queries(0):
+            assert PaperSource().associate_researchers(paper) == paper
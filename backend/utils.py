@@ -23,8 +23,10 @@
 from time import sleep
 
 import logging
+import queue
 import requests
 import requests.exceptions
+import threading
 from datetime import datetime
 from datetime import timedelta
 
@@ -76,6 +78,7 @@ def request_retry(url, **kwargs):
     :param delay: the minimum delay between requests (default 5)
     :param backoff: the multiple used when raising the delay after an unsuccessful query (default 2)
     :param session: A session to use
+    :param stream: do not download the body of the response right away (default False)
     """
     params = kwargs.get('params', None)
     timeout = kwargs.get('timeout', 10)
@@ -84,12 +87,14 @@ def request_retry(url, **kwargs):
     backoff = kwargs.get('backoff', 2)
     headers = kwargs.get('headers', {})
     session = kwargs.get('session', requests.Session())
+    stream = kwargs.get('stream', False)
     try:
         r = session.get(url,
                          params=params,
                          timeout=timeout,
                          headers=headers,
-                         allow_redirects=True)
+                         allow_redirects=True,
+                         stream=stream)
         r.raise_for_status()
         return r
     except requests.exceptions.RequestException:
@@ -104,7 +109,8 @@ def request_retry(url, **kwargs):
                          retries=retries-1,
                          delay=delay*backoff,
                          backoff=backoff,
-                         session=session)
+                         session=session,
+                         stream=stream)
 
 def urlopen_retry(url, **kwargs):
     return request_retry(url, **kwargs).text
@@ -114,6 +120,55 @@ def cached_urlopen_retry(*args, **kwargs):
     return urlopen_retry(*args, **kwargs)
 
 
+def prefetch_in_background(items, depth, name='prefetch'):
+    """
+    Consumes the generator `items` in a background thread, so that the next items
+    (typically pages of results of an API) are downloaded while the current one is processed.
+    At most `depth` items are kept in memory, the thread waits when the consumer falls behind.
+    Exceptions of the generator are raised in the consumer.
+
+    :param items: generator
+    :param depth: number of items to fetch in advance
+    :param name: name of the background thread
+    :returns: generator yielding the same items as `items`
+    """
+    buffer = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(kind, value):
+        # We do not block forever, in case the consumer has stopped
+        while not stop.is_set():
+            try:
+                buffer.put((kind, value), timeout=1)
+            except queue.Full:
+                continue
+            return True
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put('item', item):
+                    return
+        except Exception as e:
+            put('error', e)
+        else:
+            put('done', None)
+
+    producer = threading.Thread(target=produce, name=name, daemon=True)
+    producer.start()
+    try:
+        while True:
+            kind, value = buffer.get()
+            if kind == 'done':
+                return
+            elif kind == 'error':
+                raise value
+            yield value
+    finally:
+        stop.set()
+
+
 def utf8_truncate(s, length=1024):
     """
     Truncates a string to given length when converted to utf8.
@@ -25,6 +25,7 @@ from deposit.models import Repository
 from dissemin.settings import BASE_DIR
 from dissemin.settings import POSSIBLE_LANGUAGE_CODES
 from papers.baremodels import PAPER_TYPE_CHOICES
+from papers.doicache import doi_cache
 from papers.models import Department
 from papers.models import Institution
 from papers.models import Name
@@ -36,6 +37,16 @@ from publishers.models import Journal
 from publishers.models import Publisher
 
 
+@pytest.fixture(autouse=True)
+def empty_doi_cache():
+    """
+    The DOI cache outlives the database of a test, so we empty it
+    """
+    doi_cache.clear()
+    yield
+    doi_cache.clear()
+
+
 @pytest.fixture
 def load_json(db, oaisource):
     """
@@ -95,6 +95,10 @@ DOI_PROXY_SUPPORTS_BATCH = True
 #DOI_PROXY_SUPPORTS_BATCH = False
 
 DOI_OUTDATED_DURATION = timedelta(days=180)
+# Number of DOIs whose paper is remembered by each process
+DOI_CACHE_SIZE = 100000
+# Share the DOIs between processes through Redis
+DOI_CACHE_REDIS = False
 # Endpoint to fetch DOI from
 DOI_RESOLVER_ENDPOINT= 'https://dx.doi.org/'
 
@@ -271,6 +275,21 @@ except ImportError:
 CELERY_ACCEPT_CONTENT = ['pickle', 'json', 'msgpack', 'yaml']
 CELERY_IMPORTS = ['backend.tasks']
 
+# Papers are put in a queue when they change, and indexed in bulk by a celery task.
+# Otherwise, they are indexed right away.
+DEFERRED_INDEXING = False
+# Number of papers indexed at once
+INDEX_QUEUE_BATCH_SIZE = 500
+# Maximum time a paper waits in the queue
+INDEX_QUEUE_MAX_DELAY = timedelta(seconds=30)
+
+# Number of date windows harvested in parallel when updating an OAI source
+OAI_HARVEST_WINDOWS = 1
+
+# Maximum number of connections open at the same time to an API (ORCID, CrossRef),
+# and number of requests sent concurrently to it when importing a profile
+HTTP_CONNECTIONS_PER_HOST = 4
+
 CELERYBEAT_SCHEDULE = {
     'update_all_stats': {
         'task': 'update_all_stats',
@@ -288,6 +307,10 @@ CELERYBEAT_SCHEDULE = {
            'task': 'fetch_updates_from_romeo',
            'schedule': timedelta(days=14),
     },
+    'drain_index_queue': {
+        'task': 'drain_index_queue',
+        'schedule': INDEX_QUEUE_MAX_DELAY,
+    },
 #    'update_crossref': {
 #          'task': 'update_crossref',
 #          'schedule': timedelta(days=1),
@@ -368,6 +391,10 @@ HAYSTACK_CONNECTIONS = {
     },
 }
 
+# Number of seconds the results of searches without full text query
+# (for instance the papers of a researcher) are cached
+SEARCH_CACHE_TIMEOUT = 60
+
 # Deposit notification callback, can be overriden to notify an external
 # service on deposit
 DEPOSIT_NOTIFICATION_CALLBACK = (lambda payload: None)
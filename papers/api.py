@@ -35,6 +35,7 @@ from papers.models import Paper
 from papers.name import parse_comma_name
 from papers.utils import tolerant_datestamp_to_datetime
 from papers.views import PaperSearchView, ResearcherView
+from publishers.models import Publisher
 from ratelimit.decorators import ratelimit
 
 def api_paper_common(request, paper):
@@ -48,6 +49,37 @@ def api_paper_common(request, paper):
             'paper': paper.json()
         })
 
+def search_results_json(results):
+    """
+    The JSON representations of the papers found by a search. They are
+    read from the search index, so that neither the papers nor their
+    records are fetched from the database. Papers indexed before this
+    representation was stored are fetched from the database.
+
+    The policies of the publishers are not stored in the index, as they
+    change independently of the papers: they are fetched for all the
+    results at once.
+    """
+    papers = []
+    publisher_ids = set()
+    for result in results:
+        api_json = getattr(result, 'api_json', None)
+        if api_json:
+            paper = json.loads(api_json)
+            publisher_ids.update(
+                record['publisher_id'] for record in paper.get('records', []) if 'publisher_id' in record)
+        else:
+            paper = result.object.json()
+        papers.append(paper)
+
+    publishers = Publisher.objects.in_bulk(publisher_ids) if publisher_ids else {}
+    for paper in papers:
+        for record in paper.get('records', []):
+            publisher = publishers.get(record.pop('publisher_id', None))
+            if publisher is not None:
+                record['policy'] = publisher.json()
+    return papers
+
 @ratelimit(key='ip',rate='300/m', block=True)
 def api_paper_pk(request, pk):
     p = Paper.objects.filter(pk=pk).first()
@@ -81,6 +113,11 @@ class PaperSearchAPI(PaperSearchView):
     def dispatch(self, *args, **kwargs):
         return super(PaperSearchAPI, self).dispatch(*args, **kwargs)
 
+    def load_results(self, results):
+        # The JSON representation of the papers is read from the index
+        if self.request.GET.get('format') == 'bibtex':
+            super(PaperSearchAPI, self).load_results(results)
+
     def render_to_response(self, context, **kwargs):
         if 'format' in self.request.GET and self.request.GET['format'] == 'bibtex':
             bibtex = format_paper_citation_dict(
@@ -96,10 +133,7 @@ class PaperSearchAPI(PaperSearchView):
             return HttpResponse(bibtex, content_type='application/x-bibtex')
         else:
             stats = context['search_stats'].pie_data()
-            papers = [
-                result.object.json()
-                for result in context['object_list']
-            ]
+            papers = search_results_json(context['object_list'])
             messages = [m.serialize_to_json() for m in context.get('messages', [])]
             response = {
                 'messages': messages,
@@ -115,6 +149,11 @@ class ResearcherAPI(ResearcherView):
     def dispatch(self, *args, **kwargs):
         return super(ResearcherAPI, self).dispatch(*args, **kwargs)
 
+    def load_results(self, results):
+        # The JSON representation of the papers is read from the index
+        if self.request.GET.get('format') == 'bibtex':
+            super(ResearcherAPI, self).load_results(results)
+
     def render_to_response(self, context, **kwargs):
         if 'format' in self.request.GET and self.request.GET['format'] == 'bibtex':
             bibtex = format_paper_citation_dict(
@@ -132,10 +171,7 @@ class ResearcherAPI(ResearcherView):
             # TODO: Export the full researcher object (not just the papers) as
             # JSON?
             stats = context['search_stats'].pie_data()
-            papers = [
-                result.object.json()
-                for result in context['object_list']
-            ]
+            papers = search_results_json(context['object_list'])
             response = {
                 'messages': context['messages'],
                 'stats': stats,
@@ -27,7 +27,6 @@ done online,
 without name ambiguity resolution.
 """
 
-import hashlib
 import logging
 import re
 from urllib.parse import quote  # for the Google Scholar and CORE link
@@ -41,6 +40,8 @@ from django.utils.translation import ugettext_lazy as _
 from papers.bibtex import PAPER_TYPE_TO_BIBTEX, format_paper_citation_dict
 from papers.doi import doi_to_oadoi_url
 from papers.fingerprint import create_paper_plain_fingerprint
+from papers.fingerprint import hash_fingerprint
+from papers.name import normalize_name
 from papers.utils import datetime_to_date
 from papers.utils import iunaccent
 from papers.utils import maybe_recapitalize_title
@@ -210,17 +211,32 @@ class BarePaper(BareObject):
         """
         Creates an instance of this class from a :class:`BarePaper`.
         """
-        bare_obj.update_availability()
-        bare_obj.fingerprint = bare_obj.new_fingerprint()
-        ist = super(BarePaper, cls).from_bare(bare_obj)
-        for idx, a in enumerate(bare_obj.authors):
-            ist.add_author(a, position=idx)
+        ist = cls.unsaved_from_bare(bare_obj)
         ist.save()
         ist.just_created = True
         for r in bare_obj.oairecords:
             ist.add_oairecord(r)
         return ist
 
+    @classmethod
+    def unsaved_from_bare(cls, bare_obj, refresh_fingerprint=True):
+        """
+        Same as :meth:`from_bare`, but neither saves the instance
+        nor adds the OAI records of the bare paper to it.
+        This is useful to create many papers at once.
+
+        :param refresh_fingerprint: recompute the fingerprint of the bare
+            paper. Set to `False` when it is already up to date, for
+            instance computed with :func:`fingerprint_many`.
+        """
+        bare_obj.update_availability()
+        if refresh_fingerprint:
+            bare_obj.fingerprint = bare_obj.new_fingerprint()
+        ist = super(BarePaper, cls).from_bare(bare_obj)
+        for idx, a in enumerate(bare_obj.authors):
+            ist.add_author(a, position=idx)
+        return ist
+
     @classmethod
     def create(cls, title, author_names, pubdate, visible=True,
                affiliations=None, orcids=None):
@@ -514,10 +530,7 @@ class BarePaper(BareObject):
         that may have occured since the last computation of the fingerprint.
         This does not update the `fingerprint` field, just computes its candidate value.
         """
-        buf = self.plain_fingerprint(verbose)
-        m = hashlib.md5()
-        m.update(buf.encode('utf-8'))
-        return m.hexdigest()
+        return hash_fingerprint(self.plain_fingerprint(verbose))
 
     # Abstract -------------------------------------------------
     @cached_property
@@ -705,37 +718,19 @@ class BarePaper(BareObject):
         return result
 
 
-class BareAuthor(BareObject):
+class AuthorMixin(object):
     """
-    The base class for the author of a paper.
-    This holds the name of the author, its position in the authors list,
-    and its possible affiliations.
+    The methods shared by all authors of papers, whether they are
+    :class:`BareAuthor` or read from a stored representation (see
+    :class:`SerializedAuthor`). They only rely on the `name`, `orcid`,
+    `affiliation`, `researcher_id` and `researcher` attributes.
     """
-    _bare_fields = [
-        'affiliation',
-        'orcid',
-        'researcher_id',
-    ]
-    _bare_foreign_key_fields = [
-        'name',
-    ]
+    __slots__ = ()
+
     _mandatory_fields = [
         'name',
     ]
 
-    @cached_property
-    def _researcher_model(self):
-        return apps.get_app_config('papers').get_model('Researcher')
-
-    @cached_property
-    def researcher(self):
-        """
-        Returns the :class:`Researcher` object associated with
-        this author (if any)
-        """
-        if self.researcher_id:
-            return self._researcher_model.objects.get(id=self.researcher_id)
-
     @property
     def is_known(self):
         """
@@ -762,6 +757,50 @@ class BareAuthor(BareObject):
             'researcher_id': self.researcher_id,
             }
 
+    def json(self):
+        """
+        JSON representation of the author for dataset dumping purposes,
+        or for the public API.
+        """
+        orcid_id = self.orcid
+        affiliation = None
+        if not orcid_id and self.affiliation:
+            affiliation = self.affiliation
+        return remove_nones({
+                'name': self.name.json(),
+                'affiliation': affiliation,
+                'orcid': orcid_id,
+                })
+
+
+class BareAuthor(AuthorMixin, BareObject):
+    """
+    The base class for the author of a paper.
+    This holds the name of the author, its position in the authors list,
+    and its possible affiliations.
+    """
+    _bare_fields = [
+        'affiliation',
+        'orcid',
+        'researcher_id',
+    ]
+    _bare_foreign_key_fields = [
+        'name',
+    ]
+
+    @cached_property
+    def _researcher_model(self):
+        return apps.get_app_config('papers').get_model('Researcher')
+
+    @cached_property
+    def researcher(self):
+        """
+        Returns the :class:`Researcher` object associated with
+        this author (if any)
+        """
+        if self.researcher_id:
+            return self._researcher_model.objects.get(id=self.researcher_id)
+
     @classmethod
     def deserialize(cls, rep):
         """
@@ -776,20 +815,115 @@ class BareAuthor(BareObject):
             )
         return inst
 
-    def json(self):
+
+class SerializedAuthor(AuthorMixin):
+    """
+    An author read from its serialized representation, as stored in
+    `Paper.authors_list`. The fields are read from the representation
+    when they are accessed: the name is only deserialized when it is
+    needed, and the researcher only fetched when it is needed.
+
+    Changes made to the fields of this author do not alter the stored
+    representation, which is copied the first time a field is set.
+
+    Unlike :class:`BareAuthor`, this is not a :class:`BareObject`: it has
+    no instance dictionary, since papers can have thousands of authors.
+    """
+    __slots__ = (
+        '_rep',
+        '_shared',
+        '_name',
+        '_name_rep',
+        '_researcher',
+        '_researcher_for',
+    )
+
+    def __init__(self, rep):
+        self._rep = rep
+        self._shared = True
+        self._name_rep = None
+        self._researcher_for = None
+
+    @property
+    def rep(self):
         """
-        JSON representation of the author for dataset dumping purposes,
-        or for the public API.
+        The serialized representation this author is read from
         """
-        orcid_id = self.orcid
-        affiliation = None
-        if not orcid_id and self.affiliation:
-            affiliation = self.affiliation
-        return remove_nones({
-                'name': self.name.json(),
-                'affiliation': affiliation,
-                'orcid': orcid_id,
-                })
+        return self._rep
+
+    def _set(self, key, value):
+        if self._shared:
+            self._rep = dict(self._rep)
+            self._shared = False
+        self._rep[key] = value
+
+    @property
+    def orcid(self):
+        return self._rep.get('orcid')
+
+    @orcid.setter
+    def orcid(self, value):
+        self._set('orcid', value)
+
+    @property
+    def affiliation(self):
+        return self._rep.get('affiliation')
+
+    @affiliation.setter
+    def affiliation(self, value):
+        self._set('affiliation', value)
+
+    @property
+    def researcher_id(self):
+        return self._rep.get('researcher_id')
+
+    @researcher_id.setter
+    def researcher_id(self, value):
+        self._set('researcher_id', value)
+
+    @property
+    def name(self):
+        rep = self._rep['name']
+        if self._name_rep is not rep:
+            self._name = BareName.deserialize(rep)
+            self._name_rep = rep
+        return self._name
+
+    @name.setter
+    def name(self, value):
+        # The representation is detached, so its name is never replaced
+        self._set('name', self._rep['name'])
+        self._name = value
+        self._name_rep = self._rep['name']
+
+    @property
+    def researcher(self):
+        """
+        Returns the :class:`Researcher` object associated with
+        this author (if any)
+        """
+        researcher_id = self.researcher_id
+        if not researcher_id:
+            return None
+        if self._researcher_for != researcher_id:
+            self._researcher = self._researcher_model.objects.get(id=researcher_id)
+            self._researcher_for = researcher_id
+        return self._researcher
+
+    @researcher.setter
+    def researcher(self, researcher):
+        self._researcher = researcher
+        self._researcher_for = self.researcher_id
+
+    @property
+    def _researcher_model(self):
+        return apps.get_app_config('papers').get_model('Researcher')
+
+    def check_mandatory_fields(self):
+        for field in self._mandatory_fields:
+            if not self._rep.get(field):
+                raise ValueError('No %s provided to create a %s.' %
+                                 (field, self.__class__.__name__))
 
 
 class BareName(BareObject):
@@ -860,6 +994,19 @@ class BareName(BareObject):
     def pair(self):
         return (self.first, self.last)
 
+    @property
+    def normalized(self):
+        """
+        The :class:`papers.name.NormalizedName` of this name, to compare
+        it to other names. It is computed on first access and kept until
+        the name changes.
+        """
+        normalized = getattr(self, '_normalized', None)
+        if normalized is None or normalized.pair != self.pair:
+            normalized = normalize_name(self.first, self.last)
+            self._normalized = normalized
+        return normalized
+
     @classmethod
     def deserialize(cls, rep):
         """
@@ -0,0 +1,195 @@
+# -*- encoding: utf-8 -*-
+
+# Dissemin: open access policy enforcement tool
+# Copyright (C) 2014 Antonin Delpeuch
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+
+"""
+A cache mapping DOIs to the id of the paper they belong to.
+
+The ingestion code looks up the same DOIs over and over again.
+This cache keeps the most recent ones in memory, and optionally
+shares them between processes through Redis.
+
+Only DOIs that are known to the database are stored: a cache miss
+means that the database has to be asked. Entries can become stale
+(for instance when a paper is deleted), so the callers check that
+the paper still exists before using it.
+
+With the Redis tier, invalidating a DOI removes it from Redis and
+bumps a version number stored in Redis. Each process compares that
+version with the one of its in-memory entries before using them, and
+drops them all if another process invalidated a DOI in the meantime.
+Invalidations are rare: moving records to another paper points their
+DOIs to it instead. Without the Redis tier, no request is made to
+Redis and a process only sees its own invalidations.
+"""
+
+import threading
+
+from collections import OrderedDict
+
+from django.conf import settings
+
+from dissemin.settings import redis_client
+
+
+class DOICache(object):
+    """
+    A bounded LRU cache from DOIs to paper ids, with an optional Redis tier.
+    """
+    redis_prefix = 'doi-paper:'
+    version_key = 'doi-paper-version'
+
+    def __init__(self, maxsize=100000, use_redis=False, redis_timeout=24*3600):
+        """
+        :param maxsize: the number of DOIs kept in memory
+        :param use_redis: also store the DOIs in Redis
+        :param redis_timeout: number of seconds after which the DOIs expire in Redis
+        """
+        self.maxsize = maxsize
+        self.use_redis = use_redis
+        self.redis_timeout = redis_timeout
+        self._local = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    @property
+    def stats(self):
+        """
+        :returns: dict with the number of hits in memory, hits in Redis and misses
+        """
+        return {
+            'hits' : self.hits,
+            'redis_hits' : self.redis_hits,
+            'misses' : self.misses,
+            'size' : len(self._local),
+        }
+
+    def _redis_key(self, doi):
+        return self.redis_prefix + doi
+
+    def _set_local(self, doi, paper_id):
+        with self._lock:
+            self._local[doi] = paper_id
+            self._local.move_to_end(doi)
+            while len(self._local) > self.maxsize:
+                self._local.popitem(last=False)
+
+    def _check_version(self, version):
+        """
+        Empties the in-memory cache if a DOI has been invalidated,
+        by any process, since its entries were stored
+        :param version: the current version, as stored in Redis
+        """
+        with self._lock:
+            if version != self._version:
+                self._local.clear()
+                self._version = version
+
+    def get(self, doi):
+        """
+        :param doi: a normalized DOI
+        :returns: the id of the paper with that DOI, None if unknown
+        """
+        return self.get_many([doi]).get(doi)
+
+    def get_many(self, dois):
+        """
+        Looks up several DOIs at once. With the Redis tier, this makes
+        one request to check the version, and one for the DOIs that are
+        not in memory.
+        :param dois: list of normalized DOIs
+        :returns: dict mapping the known DOIs to the ids of their papers
+        """
+        if self.use_redis:
+            self._check_version(redis_client.get(self.version_key))
+        paper_ids = {}
+        missing = []
+        with self._lock:
+            for doi in dois:
+                paper_id = self._local.get(doi)
+                if paper_id is not None:
+                    self._local.move_to_end(doi)
+                    self.hits += 1
+                    paper_ids[doi] = paper_id
+                else:
+                    missing.append(doi)
+        if missing and self.use_redis:
+            values = redis_client.mget([self._redis_key(doi) for doi in missing])
+            not_found = []
+            for doi, value in zip(missing, values):
+                if value is not None:
+                    paper_ids[doi] = int(value)
+                    self.redis_hits += 1
+                    self._set_local(doi, paper_ids[doi])
+                else:
+                    not_found.append(doi)
+            missing = not_found
+        self.misses += len(missing)
+        return paper_ids
+
+    def set(self, doi, paper_id):
+        """
+        Records that the paper with id paper_id has the given DOI
+        """
+        if not doi or paper_id is None:
+            return
+        if self.use_redis:
+            pipe = redis_client.pipeline()
+            pipe.get(self.version_key)
+            pipe.set(self._redis_key(doi), paper_id, ex=self.redis_timeout)
+            version, _ = pipe.execute()
+            self._check_version(version)
+        self._set_local(doi, paper_id)
+
+    def invalidate(self, doi):
+        """
+        Forgets about a DOI, for instance because its record has changed.
+        With the Redis tier, this also empties the in-memory cache of the
+        other processes.
+        """
+        if not doi:
+            return
+        with self._lock:
+            self._local.pop(doi, None)
+        if self.use_redis:
+            pipe = redis_client.pipeline()
+            pipe.delete(self._redis_key(doi))
+            pipe.incr(self.version_key)
+            pipe.execute()
+
+    def clear(self):
+        """
+        Empties the in-memory cache. Redis entries expire on their own.
+        """
+        with self._lock:
+            self._local.clear()
+            self._version = None
+        self.reset_stats()
+
+
+doi_cache = DOICache(
+    maxsize=getattr(settings, 'DOI_CACHE_SIZE', 100000),
+    use_redis=getattr(settings, 'DOI_CACHE_REDIS', False),
+)
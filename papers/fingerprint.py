@@ -20,8 +20,11 @@
 
 
 
+import hashlib
 import re
 
+from functools import lru_cache
+
 from papers.name import split_name_words
 from papers.utils import kill_html
 from papers.utils import remove_diacritics
@@ -30,6 +33,38 @@ from papers.utils import ulower
 # Paper fingerprinting
 
 stripped_chars = re.compile(r'[^- a-z0-9]')
+dashes = re.compile(r'[ -]+')
+
+#: Number of last names whose normalized form is remembered
+LAST_NAME_CACHE_SIZE = 65536
+
+
+@lru_cache(maxsize=LAST_NAME_CACHE_SIZE)
+def last_name_fingerprint(last_name):
+    """
+    The part of the fingerprint coming from an author: the last name,
+    without the small words such as "van", "der", "de"…
+    The same names come up again and again, so the results are cached.
+
+    >>> last_name_fingerprint('van der Waals')
+    'waals'
+    >>> last_name_fingerprint('Müller-Lüdenscheidt')
+    'muller-ludenscheidt'
+    """
+    last_name_words, last_name_separators = split_name_words(remove_diacritics(last_name))
+    last_words = []
+    for i, w in enumerate(last_name_words):
+        if (w[0].isupper() or
+                (i > 0 and last_name_separators[i-1] == '-')):
+            last_words.append(w)
+
+    # If no word was uppercased, fall back on all the words
+    if not last_words:
+        last_words = last_name_words
+
+    # Lowercase
+    last_words = list(map(ulower, last_words))
+    return '-'.join(last_words)
 
 
 def create_paper_plain_fingerprint(title, authors, year):
@@ -55,47 +90,90 @@ def create_paper_plain_fingerprint(title, authors, year):
     >>> create_paper_plain_fingerprint('Ambiguity', [('John','Doe')], 2014)
     'ambiguity-2014/doe'
     """
+    buf, with_authors = title_fingerprint(title, year)
+    if with_authors:
+        buf = add_authors_fingerprint(
+            buf, [last_name_fingerprint(author[1]) for author in authors if author])
+    return buf
+
+
+def title_fingerprint(title, year):
+    """
+    The part of the plain fingerprint coming from the title (and the year
+    for titles made of a single word).
+
+    :returns: a pair: the fingerprint of the title, and whether the
+        last names of the authors should be added to it (for short titles)
+    """
     title = kill_html(title)
     title = remove_diacritics(title).lower()
     title = stripped_chars.sub('', title)
     title = title.strip()
-    title = re.sub('[ -]+', '-', title)
+    title = dashes.sub('-', title)
     buf = title
 
     # If the title is long enough, we return the fingerprint as is
     if len(buf) > 50:
-        return buf
+        return buf, False
 
     # If the title is very short, we add the year (for "Preface", "Introduction", "New members" cases)
     # if len(title) <= 16:
     if not '-' in title:
         buf += '-'+str(year)
 
-    author_names_list = []
-    for author in authors:
-        if not author:
-            continue
-        author = (remove_diacritics(author[0]), remove_diacritics(author[1]))
-
-        # Last name, without the small words such as "van", "der", "de"…
-        last_name_words, last_name_separators = split_name_words(author[1])
-        last_words = []
-        for i, w in enumerate(last_name_words):
-            if (w[0].isupper() or
-                    (i > 0 and last_name_separators[i-1] == '-')):
-                last_words.append(w)
-
-        # If no word was uppercased, fall back on all the words
-        if not last_words:
-            last_words = last_name_words
-
-        # Lowercase
-        last_words = list(map(ulower, last_words))
-        fp = '-'.join(last_words)
-        author_names_list.append(fp)
-
-    author_names_list.sort()
-    for fp in author_names_list:
-        buf += '/'+fp
+    return buf, True
+
 
+def add_authors_fingerprint(buf, last_name_fingerprints):
+    """
+    Adds the normalized last names of the authors to the fingerprint
+    of a title, in alphabetical order.
+    """
+    for fp in sorted(last_name_fingerprints):
+        buf += '/'+fp
     return buf
+
+
+def hash_fingerprint(plain_fingerprint):
+    """
+    Turns a plain fingerprint into the fingerprint stored for papers
+
+    >>> hash_fingerprint('ambiguity-2014/doe')
+    '6a0cdbc5372a795ca63980625a258066'
+    """
+    m = hashlib.md5()
+    m.update(plain_fingerprint.encode('utf-8'))
+    return m.hexdigest()
+
+
+def fingerprint_many(papers):
+    """
+    Computes the (hashed) fingerprints of many papers at once.
+    Each distinct last name of the batch is normalized once, and
+    only when the title of one of its papers is short enough to
+    need the authors.
+
+    :param papers: an iterable of (title, authors, year) triples, as taken
+        by :func:`create_paper_plain_fingerprint`
+    :returns: the list of fingerprints, in the same order
+    """
+    papers = [(title_fingerprint(title, year), authors)
+              for title, authors, year in papers]
+
+    last_names = {
+        author[1]
+        for (buf, with_authors), authors in papers if with_authors
+        for author in authors if author
+    }
+    normalized = {
+        last_name: last_name_fingerprint(last_name)
+        for last_name in last_names
+    }
+
+    fingerprints = []
+    for (buf, with_authors), authors in papers:
+        if with_authors:
+            buf = add_authors_fingerprint(
+                buf, [normalized[author[1]] for author in authors if author])
+        fingerprints.append(hash_fingerprint(buf))
+    return fingerprints
@@ -37,6 +37,7 @@ from papers.utils import validate_orcid
 from publishers.models import OA_STATUS_CHOICES_WITHOUT_HELPTEXT
 from statistics.models import COMBINED_STATUS_CHOICES
 from statistics.models import PDF_STATUS_CHOICES
+from statistics.models import STATUS_AGGREGATIONS
 
 
 class OrcidField(forms.CharField):
@@ -172,18 +173,17 @@ class PaperSearchForm(SearchForm):
                 sq.add(SQ(authors_full=Sloppy(reversed_name, slop=1)), SQ.OR)
                 self.queryset = self.queryset.filter(sq)
 
-        self.queryset = self.queryset.aggregations({
-            "status": {"terms": {"field": "combined_status_exact"}},
-        })
+        self.queryset = self.queryset.aggregations(STATUS_AGGREGATIONS)
 
         status = self.cleaned_data['status']
         if status:
             self.queryset = self.queryset.post_filter(
                 combined_status__in=status)
 
-        # Default ordering by decreasing publication date
+        # Default ordering by decreasing publication date.
+        # The papers are loaded by the views that need them.
         order = self.cleaned_data['sort_by'] or '-pubdate'
-        self.queryset = self.queryset.order_by(order).load_all()
+        self.queryset = self.queryset.order_by(order)
 
         return self.queryset
 
@@ -0,0 +1,96 @@
+# -*- encoding: utf-8 -*-
+
+# Dissemin: open access policy enforcement tool
+# Copyright (C) 2014 Antonin Delpeuch
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+
+"""
+HTTP connections shared by the threads of a process.
+
+Importing a profile takes many requests to the same APIs (ORCID, CrossRef).
+They are sent concurrently, over keep-alive connections. The connections
+to each host are pooled, and at most `HTTP_CONNECTIONS_PER_HOST` of them
+are open at the same time: further requests wait for a free connection.
+"""
+
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from django.conf import settings
+
+# Number of hosts for which connections are kept open
+POOLED_HOSTS = 16
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def make_session(connections_per_host):
+    """
+    :param connections_per_host: maximum number of connections open to a host
+    :returns: a session whose requests wait when all the connections
+        to their host are busy
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=POOLED_HOSTS,
+        pool_maxsize=connections_per_host,
+        pool_block=True,
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_session():
+    """
+    :returns: the session of this process
+    """
+    global _session, _session_pid
+    with _session_lock:
+        # Connections must not be shared with forked processes
+        if _session is None or _session_pid != os.getpid():
+            _session = make_session(settings.HTTP_CONNECTIONS_PER_HOST)
+            _session_pid = os.getpid()
+        return _session
+
+
+def map_concurrently(func, items, max_workers=None):
+    """
+    Applies a function to items in threads, typically to send
+    requests to an API. The function should not use the database,
+    as the threads have their own connections to it.
+
+    :param func: the function, taking an item as argument
+    :param items: the list of items
+    :param max_workers: number of threads, defaults to `HTTP_CONNECTIONS_PER_HOST`
+    :returns: the list of the results, in the order of the items.
+        The first exception raised by the function is raised.
+    """
+    items = list(items)
+    if max_workers is None:
+        max_workers = settings.HTTP_CONNECTIONS_PER_HOST
+    if max_workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        return list(executor.map(func, items))
@@ -0,0 +1,109 @@
+# -*- encoding: utf-8 -*-
+
+# Dissemin: open access policy enforcement tool
+# Copyright (C) 2014 Antonin Delpeuch
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Affero General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+
+"""
+Deferred updates of the search index.
+
+When `DEFERRED_INDEXING` is enabled, papers are not sent to Elasticsearch
+one by one when they change. Their ids are stored in a Redis sorted set
+instead, so that a paper changed several times is only indexed once.
+The celery task `drain_index_queue` then indexes them in bulk. It runs
+every `INDEX_QUEUE_MAX_DELAY`, and as soon as `INDEX_QUEUE_BATCH_SIZE`
+papers are waiting.
+"""
+
+import logging
+import time
+
+from django.conf import settings
+
+from dissemin.settings import redis_client
+
+logger = logging.getLogger('dissemin.' + __name__)
+
+QUEUE_KEY = 'index-queue'
+
+
+def enqueue_papers(paper_ids):
+    """
+    Adds papers to the queue of papers to index.
+    A paper already waiting keeps its position.
+
+    :param paper_ids: list of ids of papers
+    """
+    paper_ids = [pk for pk in paper_ids if pk is not None]
+    if not paper_ids:
+        return
+    now = time.time()
+    redis_client.zadd(QUEUE_KEY, {pk: now for pk in paper_ids}, nx=True)
+    if queue_length() >= settings.INDEX_QUEUE_BATCH_SIZE:
+        from backend.tasks import drain_index_queue
+        drain_index_queue.delay()
+
+
+def queue_length():
+    """
+    :returns: the number of papers waiting to be indexed
+    """
+    return redis_client.zcard(QUEUE_KEY)
+
+
+def pop_batch(batch_size):
+    """
+    Removes the oldest papers from the queue.
+    They are removed before being indexed, so that a paper changed
+    in the meantime is put back in the queue.
+
+    :returns: list of ids of papers
+    """
+    pipe = redis_client.pipeline()
+    pipe.zrange(QUEUE_KEY, 0, batch_size - 1)
+    pipe.zremrangebyrank(QUEUE_KEY, 0, batch_size - 1)
+    paper_ids, _ = pipe.execute()
+    return [int(pk) for pk in paper_ids]
+
+
+def drain(batch_size=None):
+    """
+    Indexes all the papers of the queue, by batches
+
+    :returns: the number of papers indexed
+    """
+    from papers.models import Paper
+
+    if batch_size is None:
+        batch_size = settings.INDEX_QUEUE_BATCH_SIZE
+    indexed = 0
+    while True:
+        paper_ids = pop_batch(batch_size)
+        if not paper_ids:
+            break
+        # Deleted papers have been removed from the index already
+        papers = list(Paper.objects.filter(pk__in=paper_ids))
+        try:
+            Paper.update_index_batch(papers, deferred=False)
+        except Exception:
+            # We put the papers back, they will be indexed later
+            enqueue_papers(paper_ids)
+            raise
+        indexed += len(papers)
+    if indexed:
+        logger.info('Indexed {} papers from the queue'.format(indexed))
+    return indexed
@@ -0,0 +1,31 @@
+# Generated by Django 2.2.9 on 2020-01-20 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('papers', '0001_squashed_0059_remove_django_geojson'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='oairecord',
+            name='pdf_key',
+            field=models.CharField(blank=True, max_length=1024, null=True),
+        ),
+        migrations.AddField(
+            model_name='oairecord',
+            name='splash_key',
+            field=models.CharField(blank=True, max_length=1024, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='oairecord',
+            index=models.Index(fields=['about', 'splash_key'], name='papers_oair_about_i_34e67b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='oairecord',
+            index=models.Index(fields=['about', 'pdf_key'], name='papers_oair_about_i_4fbb31_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 2.2.9 on 2020-01-27 14:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('papers', '0002_oairecord_url_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OaiHarvestWindow',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metadata_prefix', models.CharField(max_length=64)),
+                ('from_date', models.DateTimeField(null=True)),
+                ('until', models.DateTimeField()),
+                ('resumption_token', models.TextField(blank=True, null=True)),
+                ('last_datestamp', models.DateTimeField(null=True)),
+                ('done', models.BooleanField(default=False)),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='papers.OaiSource')),
+            ],
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 2.2.9 on 2020-02-03 10:12
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('papers', '0003_oaiharvestwindow'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='researcher',
+            name='orcid_last_modified',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='researcher',
+            name='orcid_work_dates',
+            field=django.contrib.postgres.fields.jsonb.JSONField(blank=True, default=dict),
+        ),
+    ]
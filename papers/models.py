@@ -42,8 +42,11 @@ This module defines most of the models used in the platform.
 
 
 
+from collections import Counter
+from collections import defaultdict
 from datetime import datetime
 from datetime import timedelta
+import operator
 import re
 import haystack
 import pytz
@@ -62,27 +65,33 @@ from django.contrib.postgres.fields import ArrayField
 from django_countries.fields import CountryField
 from django_countries.fields import countries
 from django.conf import settings
-from django.core.cache import cache
-from django.core.cache.utils import make_template_fragment_key
 from django.core.exceptions import ObjectDoesNotExist
 from django.urls import reverse
 from django.db import DataError
+from django.db import IntegrityError
 from django.db import models
+from django.db import transaction
+from django.db.models import OuterRef
+from django.db.models import Q
 from django.db.models import prefetch_related_objects
+from django.db.models import Subquery
 from django.template.defaultfilters import slugify
 from django.utils import timezone
 from django.utils.functional import cached_property
 from django.utils.translation import ugettext_lazy as _
 from django.utils.http import urlencode
-from papers.baremodels import BareAuthor
 from papers.baremodels import BareName
 from papers.baremodels import BareOaiRecord
 from papers.baremodels import BarePaper
+from papers.baremodels import SerializedAuthor
 from papers.baremodels import MAX_NAME_LENGTH
 from papers.baremodels import PAPER_TYPE_CHOICES
 from papers.baremodels import PAPER_TYPE_PREFERENCE
 from papers.doi import to_doi
+from papers.doicache import doi_cache
 from papers.errors import MetadataSourceException
+from papers.fingerprint import fingerprint_many
+from papers.indexqueue import enqueue_papers
 from papers.name import match_names
 from papers.name import unify_name_lists
 from papers.orcid import OrcidProfile
@@ -328,6 +337,11 @@ class Researcher(models.Model):
     orcid = models.CharField(max_length=32, null=True, blank=True, unique=True)
     #: Did we manage to import at least one record from the ORCID profile? (Null if we have not tried)
     empty_orcid_profile = models.NullBooleanField()
+    #: Last modification of the ORCID record when we last imported it
+    orcid_last_modified = models.DateTimeField(null=True, blank=True)
+    #: Last modification (in ms, as given by ORCID) of each work of the ORCID record
+    #: when we last imported it, by put code
+    orcid_work_dates = JSONField(default=dict, blank=True)
 
     # Fetching
     #: Last time we harvested publications for this researcher
@@ -466,6 +480,88 @@ class Researcher(models.Model):
 
         return researcher
 
+    @classmethod
+    def get_or_create_by_orcid_batch(cls, profiles, update=False):
+        """
+        Same as :meth:`get_or_create_by_orcid` for many profiles at once,
+        as when importing a dump: the researchers and their names are
+        fetched, created and updated with a constant number of queries
+        (except for institutions).
+
+        :param profiles: list of pairs (ORCID id, :class:`OrcidProfile` or its parsed JSON)
+        :param update: refresh researcher attributes even if they already exist
+        :returns: a dict from ORCID ids to researchers, None for invalid profiles
+        """
+        profiles = [
+            (orcid, OrcidProfile(json=profile) if type(profile) == dict else profile)
+            for orcid, profile in profiles if orcid is not None
+        ]
+        existing = {
+            r.orcid: r for r in
+            Researcher.objects.filter(orcid__in=[orcid for orcid, _ in profiles])
+        }
+        researchers = {}
+        to_refresh = []
+        for orcid, profile in profiles:
+            if orcid in existing and not update:
+                researchers[orcid] = existing[orcid]
+            else:
+                to_refresh.append((orcid, profile))
+
+        names = Name.get_or_create_batch([profile.name for _, profile in to_refresh])
+        institutions = {}
+        to_create = []
+        to_update = []
+        for (orcid, profile), name in zip(to_refresh, names):
+            researchers[orcid] = None
+            if name is None:
+                continue
+            homepage = profile.homepage
+            if homepage:
+                homepage = homepage[:1024]
+            institution = profile.institution
+            if institution:
+                key = tuple(sorted(institution.items()))
+                if key not in institutions:
+                    institutions[key] = Institution.create(institution)
+                institution = institutions[key]
+            values = {
+                'homepage': homepage,
+                'orcid': orcid,
+                'email': profile.email,
+                'institution': institution,
+                'name': name,
+            }
+
+            researcher = existing.get(orcid)
+            if researcher is None:
+                to_create.append(Researcher(**values))
+                continue
+            save = False
+            for kw, val in values.items():
+                if getattr(researcher, kw) != val:
+                    setattr(researcher, kw, val)
+                    save = True
+            if save:
+                to_update.append(researcher)
+            researchers[orcid] = researcher
+
+        if to_update:
+            Researcher.objects.bulk_update(to_update, ['homepage', 'orcid', 'email', 'institution', 'name'])
+        if to_create:
+            try:
+                with transaction.atomic():
+                    Researcher.objects.bulk_create(to_create)
+            except IntegrityError:
+                # Some of them have been created in the meantime
+                for researcher in to_create:
+                    researchers[researcher.orcid] = Researcher.get_or_create_by_orcid(
+                        researcher.orcid, dict(profiles)[researcher.orcid], update=update)
+            else:
+                for researcher in to_create:
+                    researchers[researcher.orcid] = researcher
+        return researchers
+
     @classmethod
     def create_by_name(cls, first, last, **kwargs):
         """
@@ -563,6 +659,42 @@ class Name(models.Model, BareName):
         return cls.objects.get_or_create(full=n.full[:255],
                                          defaults={'first': n.first, 'last': n.last})
 
+    @classmethod
+    def get_or_create_batch(cls, name_pairs):
+        """
+        Same as :meth:`get_or_create` for a list of names,
+        with a constant number of queries.
+
+        :param name_pairs: list of pairs (first,last), or None
+        :returns: the list of names, with None for invalid ones
+        """
+        candidates = []
+        for pair in name_pairs:
+            n = None
+            if pair and (pair[0] or pair[1]):
+                n = cls.create(pair[0], pair[1])
+                if (len(n.first or '') >= MAX_NAME_LENGTH-1 or
+                    len(n.last or '') >= MAX_NAME_LENGTH-1):
+                    n = None
+                else:
+                    n.full = n.full[:255]
+            candidates.append(n)
+
+        fulls = {n.full for n in candidates if n is not None}
+        names = {}
+        for n in cls.objects.filter(full__in=fulls).order_by('pk'):
+            names.setdefault(n.full, n)
+        missing = {}
+        for n in candidates:
+            if n is not None and n.full not in names:
+                missing.setdefault(n.full, n)
+        if missing:
+            # Other processes might create the same names at the same time
+            cls.objects.bulk_create(missing.values(), ignore_conflicts=True)
+            for n in cls.objects.filter(full__in=list(missing)).order_by('pk'):
+                names.setdefault(n.full, n)
+        return [names.get(n.full) if n is not None else None for n in candidates]
+
     @classmethod
     def lookup_name(cls, author_name):
         """
@@ -648,15 +780,44 @@ class Paper(models.Model, BarePaper):
         super(Paper, self).__init__(*args, **kwargs)
         self.just_created = False
         self.cached_oairecords = None
+        self.cached_authors = None
+        # Whether the paper is on the to-do list of users, by user id
+        self.cached_todolist = {}
+
+    def __getstate__(self):
+        state = super(Paper, self).__getstate__().copy()
+        # Rebuilt from authors_list when needed
+        state.pop('cached_authors', None)
+        return state
+
+    #: Fields displayed in the cached renderings of the paper
+    CACHED_FIELDS = {'authors_list', 'title', 'pdf_url'}
+
+    def save(self, *args, **kwargs):
+        # Saving only some of the displayed fields still changes the cache version
+        update_fields = kwargs.get('update_fields')
+        if update_fields and 'last_modified' not in update_fields and self.CACHED_FIELDS & set(update_fields):
+            kwargs['update_fields'] = list(update_fields) + ['last_modified']
+        super(Paper, self).save(*args, **kwargs)
 
     ### Relations to other models, reimplemented from :class:`BarePaper` ###
 
     @property
     def authors(self):
         """
-        The author sorted as they should appear. Their names are pre-fetched.
+        The author sorted as they should appear. They are read from
+        `authors_list`, and only rebuilt when its items are replaced:
+        authors whose representation did not change are kept, with their
+        name and researcher if these were already fetched.
         """
-        return list(map(BareAuthor.deserialize, self.authors_list))
+        reps = self.authors_list
+        cached = getattr(self, 'cached_authors', None)
+        if (cached is None or len(cached) != len(reps) or
+                not all(map(operator.is_, map(operator.attrgetter('rep'), cached), reps))):
+            known = {id(author.rep): author for author in cached or []}
+            cached = [known.get(id(rep)) or SerializedAuthor(rep) for rep in reps]
+            self.cached_authors = cached
+        return list(cached)
 
     def author_name_pairs(self):
         """
@@ -763,7 +924,10 @@ class Paper(models.Model, BarePaper):
 
         # Test first if there is no other record with this DOI
         doi = oairecord.doi
-        if doi and check_by_doi:
+        if doi and check_by_doi and doi_cache.get(doi) == self.pk:
+            # We already know that this paper has a record with this DOI
+            self.just_created = False
+        elif doi and check_by_doi:
             matches = OaiRecord.objects.filter(doi=doi)[:1]
             if matches:
                 rec = matches[0]
@@ -832,6 +996,205 @@ class Paper(models.Model, BarePaper):
             raise ValueError(
                 'Invalid paper, does not fit in the database schema:\n'+str(e))
 
+    @classmethod
+    def from_bare_batch(cls, bare_papers):
+        """
+        Saves many bare papers to the database, with the same outcome as
+        calling :meth:`from_bare` on each of them.
+
+        Fingerprints, identifiers and DOIs of the whole batch are looked
+        up with a few queries. Papers that are entirely new are created with
+        `bulk_create`, and papers whose records are all known already
+        (a source harvested again) are refreshed with `bulk_update`.
+        Everything else (merges, new records for existing papers, duplicates
+        inside the batch) goes through :meth:`from_bare`.
+
+        :param bare_papers: list of :class:`BarePaper`
+        :returns: the list of :class:`Paper` instances, in the same order.
+            Papers which could not be saved are replaced by `None`.
+        """
+        bare_papers = list(bare_papers)
+        if not bare_papers:
+            return []
+
+        # The authors shared by the papers of the batch are normalized once
+        fingerprints = fingerprint_many(
+            (p.title, p.bare_author_names(), p.year) for p in bare_papers)
+        for bare_paper, fingerprint in zip(bare_papers, fingerprints):
+            bare_paper.fingerprint = fingerprint
+        identifiers = [r.identifier for p in bare_papers for r in p.oairecords]
+        dois = [r.doi for p in bare_papers for r in p.oairecords if r.doi]
+
+        existing_papers = {
+            p.fingerprint: p
+            for p in Paper.objects.filter(fingerprint__in=fingerprints)
+        }
+        existing_records = {
+            r.identifier: r
+            for r in OaiRecord.objects.filter(identifier__in=identifiers).select_related('publisher')
+        }
+        paper_ids_by_doi = defaultdict(set)
+        for doi, about_id in OaiRecord.objects.filter(doi__in=dois).values_list('doi', 'about_id'):
+            paper_ids_by_doi[doi].add(about_id)
+
+        # Anything that appears twice in the batch has to be merged,
+        # so we leave it to the regular path
+        fingerprint_counts = Counter(fingerprints)
+        identifier_counts = Counter(identifiers)
+        doi_counts = Counter(dois)
+
+        to_create = []
+        to_update = []
+        fallback = []
+        for idx, bare_paper in enumerate(bare_papers):
+            records = bare_paper.oairecords
+            if (fingerprint_counts[bare_paper.fingerprint] > 1 or
+                any(identifier_counts[r.identifier] > 1 for r in records) or
+                any(doi_counts[r.doi] > 1 for r in records if r.doi)):
+                fallback.append(idx)
+                continue
+            matches = [existing_records.get(r.identifier) for r in records]
+            doi_paper_ids = set()
+            for r in records:
+                if r.doi:
+                    doi_paper_ids |= paper_ids_by_doi[r.doi]
+            paper = existing_papers.get(bare_paper.fingerprint)
+            if paper is None:
+                if not any(matches) and not doi_paper_ids:
+                    to_create.append(idx)
+                else:
+                    fallback.append(idx)
+            elif (records and
+                  all(m is not None and m.about_id == paper.pk for m in matches) and
+                  doi_paper_ids <= {paper.pk}):
+                to_update.append(idx)
+            else:
+                fallback.append(idx)
+
+        # Records are matched by url before identifier in
+        # :meth:`OaiRecord.new`, so a refreshed record which duplicates
+        # another one of its paper has to go through the regular path
+        candidates = [
+            (existing_papers[bare_papers[idx].fingerprint], r.splash_url, r.pdf_url)
+            for idx in to_update for r in bare_papers[idx].oairecords]
+        duplicates = iter(OaiRecord.find_duplicate_records_batch(candidates))
+        refreshed = []
+        for idx in to_update:
+            records = bare_papers[idx].oairecords
+            paper_duplicates = [next(duplicates) for r in records]
+            if all(d is None or d.pk == existing_records[r.identifier].pk
+                   for r, d in zip(records, paper_duplicates)):
+                refreshed.append(idx)
+            else:
+                fallback.append(idx)
+        to_update = refreshed
+
+        result = [None] * len(bare_papers)
+        try:
+            with transaction.atomic():
+                cls._create_batch(bare_papers, to_create, result)
+                cls._update_batch(bare_papers, to_update, existing_papers, existing_records, result)
+        except (DataError, IntegrityError) as e:
+            # Something in the batch does not fit: we save papers one by one
+            # to isolate the culprit
+            logger.warning('Batch insertion failed, falling back on single insertions: {}'.format(e))
+            result = [None] * len(bare_papers)
+            fallback = list(range(len(bare_papers)))
+
+        for idx in fallback:
+            result[idx] = cls._from_bare_retry(bare_papers[idx])
+
+        return result
+
+    @classmethod
+    def _from_bare_retry(cls, bare_paper, retries=1):
+        """
+        Same as :meth:`from_bare`, for :meth:`from_bare_batch`. Batches
+        can be saved in parallel, so another process can create the same
+        paper or record in the meantime: as it is committed once we get
+        the IntegrityError, saving the paper again finds it.
+
+        :returns: the :class:`Paper`, or `None` if it could not be saved
+        """
+        try:
+            with transaction.atomic():
+                return cls.from_bare(bare_paper)
+        except ValueError:
+            logger.exception('Ignoring invalid paper "{}"'.format(bare_paper.title))
+        except IntegrityError:
+            if retries > 0:
+                return cls._from_bare_retry(bare_paper, retries-1)
+            logger.exception('Ignoring conflicting paper "{}"'.format(bare_paper.title))
+
+    @classmethod
+    def _create_batch(cls, bare_papers, indices, result):
+        """
+        Creates the papers at the given indices, along with their
+        records, which are all known to be new.
+        Used by :meth:`from_bare_batch`.
+        """
+        papers = [cls.unsaved_from_bare(bare_papers[idx], refresh_fingerprint=False)
+                  for idx in indices]
+        cls.objects.bulk_create(papers)
+
+        records = []
+        for idx, paper in zip(indices, papers):
+            paper.cached_oairecords = []
+            for bare_record in bare_papers[idx].oairecords:
+                bare_record.cleanup_description()
+                record = OaiRecord.from_bare(bare_record)
+                record.about = paper
+                record.update_url_keys()
+                paper.cached_oairecords.append(record)
+                records.append(record)
+            result[idx] = paper
+        OaiRecord.objects.bulk_create(records)
+
+    @classmethod
+    def _update_batch(cls, bare_papers, indices, existing_papers, existing_records, result):
+        """
+        Refreshes the papers at the given indices, whose records are all
+        known already.
+        Used by :meth:`from_bare_batch`.
+        """
+        if not indices:
+            return
+        papers = [existing_papers[bare_papers[idx].fingerprint] for idx in indices]
+
+        records_by_paper = defaultdict(list)
+        for record in OaiRecord.objects.filter(about__in=papers).select_related('publisher'):
+            records_by_paper[record.about_id].append(
+                existing_records.get(record.identifier, record))
+
+        now = timezone.now()
+        records = []
+        for idx, paper in zip(indices, papers):
+            bare_paper = bare_papers[idx]
+            if bare_paper.visible and not paper.visible:
+                paper.visible = True
+            paper.update_authors(bare_paper.authors, save_now=False)
+            for bare_record in bare_paper.oairecords:
+                bare_record.cleanup_description()
+                record = existing_records[bare_record.identifier]
+                old_doi = record.doi
+                record.update_from_bare(bare_record)
+                record.update_url_keys()
+                if record.doi != old_doi:
+                    doi_cache.invalidate(old_doi)
+                record.last_update = now
+                if bare_record.pubdate and paper.pubdate > bare_record.pubdate:
+                    paper.pubdate = bare_record.pubdate
+                records.append(record)
+            paper.cached_oairecords = records_by_paper[paper.pk]
+            super(Paper, paper).update_availability()
+            paper.last_modified = now
+            result[idx] = paper
+
+        OaiRecord.objects.bulk_update(records, OaiRecord.MERGED_FIELDS + ['splash_key', 'pdf_key', 'last_update'])
+        # The new modification date also invalidates their cached renderings
+        cls.objects.bulk_update(papers, [
+            'authors_list', 'visible', 'pubdate', 'pdf_url', 'oa_status', 'doctype', 'last_modified'])
+
     ### Other methods, specific to this non-bare subclass ###
 
     def update_author_stats(self):
@@ -878,7 +1241,7 @@ class Paper(models.Model, BarePaper):
             except AttributeError:
                 # anonymous user
                 return False
-            if not match_names(author.name.pair,
+            if not match_names(author.name.normalized,
                                (first_name, last_name)):
                 continue
             if author.orcid:
@@ -927,7 +1290,7 @@ class Paper(models.Model, BarePaper):
             raise ValueError
         user_orcid = user_researcher.orcid
         for idx, author in enumerate(self.authors):
-            if not match_names(author.name.pair,
+            if not match_names(author.name.normalized,
                                (user.first_name, user.last_name)):
                 continue
             if author.orcid:
@@ -947,6 +1310,8 @@ class Paper(models.Model, BarePaper):
         """
         Checks if this paper is on the user todo list
         """
+        if user.pk in self.cached_todolist:
+            return self.cached_todolist[user.pk]
         return self.todolist.filter(pk=user.pk).exists()
 
 
@@ -968,6 +1333,54 @@ class Paper(models.Model, BarePaper):
     def is_deposited(self):
         return self.successful_deposits().count() > 0
 
+    @classmethod
+    def prefetch_for_display(cls, papers, user=None):
+        """
+        Fetches what is needed to display many papers at once, for
+        instance a page of search results, with a fixed number of queries:
+        the records of the papers with their publishers and journals,
+        the researchers of their authors, whether they are deposited,
+        and whether they are on the to-do list of the user.
+
+        :param papers: the list of papers
+        :param user: the user the papers are displayed to, if any
+        """
+        papers = [p for p in papers if p is not None]
+        if not papers:
+            return
+        pks = [paper.pk for paper in papers]
+
+        records = {pk: [] for pk in pks}
+        for record in OaiRecord.objects.filter(about__in=pks).select_related(
+                'source', 'journal', 'publisher'):
+            records[record.about_id].append(record)
+
+        researcher_ids = set()
+        for paper in papers:
+            researcher_ids.update(paper.researcher_ids)
+        researchers = {}
+        if researcher_ids:
+            researchers = Researcher.objects.select_related(
+                'name', 'user').in_bulk(researcher_ids)
+
+        deposited = set(cls.objects.filter(
+            pk__in=pks, depositrecord__oairecord__isnull=False
+            ).values_list('pk', flat=True))
+
+        on_todolist = None
+        if user is not None and user.is_authenticated:
+            on_todolist = set(cls.todolist.through.objects.filter(
+                user=user, paper__in=pks).values_list('paper_id', flat=True))
+
+        for paper in papers:
+            paper.cached_oairecords = records[paper.pk]
+            paper.is_deposited = paper.pk in deposited
+            for author in paper.authors:
+                if author.researcher_id in researchers:
+                    author.researcher = researchers[author.researcher_id]
+            if on_todolist is not None:
+                paper.cached_todolist[user.pk] = paper.pk in on_todolist
+
     def update_availability(self, cached_oairecords=[]):
         """
         Updates the :class:`Paper`'s own `pdf_url` field
@@ -981,8 +1394,8 @@ class Paper(models.Model, BarePaper):
                 it can pass it to this function to save a db query
         """
         super(Paper, self).update_availability(cached_oairecords)
+        # Saving also changes the cache version
         self.save()
-        self.invalidate_cache()
 
     def status_helptext(self):
         """
@@ -1037,6 +1450,21 @@ class Paper(models.Model, BarePaper):
         return None
 
 
+    @classmethod
+    def get_id_by_doi(cls, doi):
+        """
+        Finds the id of the paper associated to that DOI (if any),
+        without querying the database if the DOI is cached
+        """
+        doi = to_doi(doi)
+        if doi is None:
+            return None
+        paper_id = doi_cache.get(doi)
+        if paper_id is None:
+            paper_id = OaiRecord.objects.filter(doi=doi).values_list('about_id', flat=True).first()
+            doi_cache.set(doi, paper_id)
+        return paper_id
+
     @classmethod
     def get_by_doi(cls, doi):
         """
@@ -1045,10 +1473,48 @@ class Paper(models.Model, BarePaper):
         doi = to_doi(doi)
         if doi is None:
             return None
+        paper_id = doi_cache.get(doi)
+        if paper_id is not None:
+            # The cached paper is fetched by primary key,
+            # instead of looking up the DOI in the records
+            paper = Paper.objects.filter(pk=paper_id).first()
+            if paper is not None:
+                return paper
         # there should not be more than one paper in this
         # queryset
-        for record in OaiRecord.objects.filter(doi=doi)[:1]:
+        for record in OaiRecord.objects.filter(doi=doi).select_related('about')[:1]:
+            doi_cache.set(doi, record.about_id)
             return record.about
+        if paper_id is not None:
+            doi_cache.invalidate(doi)
+
+    @classmethod
+    def get_by_dois(cls, dois):
+        """
+        Finds the papers associated to the DOIs in a single query
+        :param dois: list of DOIs
+        :returns: dict mapping DOIs to papers, DOIs without paper are left out
+        """
+        dois = [doi for doi in map(to_doi, dois) if doi]
+        cached_ids = doi_cache.get_many(dois)
+
+        papers = dict()
+        if cached_ids:
+            cached_papers = Paper.objects.in_bulk(set(cached_ids.values()))
+            for doi, paper_id in cached_ids.items():
+                if paper_id in cached_papers:
+                    papers[doi] = cached_papers[paper_id]
+
+        missing = [doi for doi in dois if doi not in papers]
+        if missing:
+            for record in OaiRecord.objects.filter(doi__in=missing).select_related('about'):
+                if record.doi not in papers:
+                    papers[record.doi] = record.about
+                    doi_cache.set(record.doi, record.about_id)
+            for doi in missing:
+                if doi in cached_ids and doi not in papers:
+                    doi_cache.invalidate(doi)
+        return papers
 
     @classmethod
     def create_by_hal_id(self, hal_id, bare=False):
@@ -1078,21 +1544,21 @@ class Paper(models.Model, BarePaper):
     def successful_deposits(self):
         return self.depositrecord_set.filter(oairecord__isnull=False)
 
+    @property
+    def cache_version(self):
+        """
+        Part of the keys of the cached renderings of this paper: it
+        changes when the paper is saved or its cache is invalidated.
+        """
+        return self.last_modified.timestamp()
+
     def invalidate_cache(self):
         """
-        Invalidate the HTML cache for all the publications of this researcher.
+        Invalidates the cached renderings of this paper, for all
+        languages and researchers, by changing its cache version.
         """
-        for a in self.authors+[None]:
-            rpk = None
-            if a:
-                if a.researcher_id is None:
-                    continue
-                else:
-                    rpk = a.researcher_id
-            for lang in settings.POSSIBLE_LANGUAGE_CODES:
-                key = make_template_fragment_key(
-                    'publiListItem', [self.pk, lang, rpk])
-                cache.delete(key)
+        self.last_modified = timezone.now()
+        Paper.objects.filter(pk=self.pk).update(last_modified=self.last_modified)
 
     def update_authors(self,
                        new_authors,
@@ -1111,10 +1577,9 @@ class Paper(models.Model, BarePaper):
         if hasattr(self, 'interesting_authors'):
             del self.interesting_authors
 
-        new_author_names = [(a.name.first, a.name.last) for a in
-                            new_authors]
+        new_author_names = [a.name.normalized for a in new_authors]
 
-        old_names = [(a.name.first, a.name.last) for a in old_authors]
+        old_names = [a.name.normalized for a in old_authors]
         unified_names = unify_name_lists(old_names, new_author_names)
 
         unified_authors = []
@@ -1176,11 +1641,12 @@ class Paper(models.Model, BarePaper):
 
         self.visible = paper.visible or self.visible
 
+        moved_dois = list(OaiRecord.objects.filter(about=paper.pk, doi__isnull=False).values_list('doi', flat=True))
         OaiRecord.objects.filter(about=paper.pk).update(about=self.pk)
+        for doi in moved_dois:
+            doi_cache.set(doi, self.pk)
         self.update_authors(paper.authors, save_now=False)
 
-        paper.invalidate_cache()
-
         # create a copy of the paper to delete,
         # so that the instance we have got as argument
         # is not invalidated
@@ -1255,10 +1721,19 @@ class Paper(models.Model, BarePaper):
             except haystack.exceptions.NotHandled:
                 pass
 
-    def update_index(self):
+    def update_index(self, deferred=None):
         """
         Updates Haystack's index for this paper
+
+        :param deferred: put the paper in the queue of papers to index,
+            instead of indexing it right away. Defaults to the
+            `DEFERRED_INDEXING` setting.
         """
+        if deferred is None:
+            deferred = settings.DEFERRED_INDEXING
+        if deferred:
+            enqueue_papers([self.pk])
+            return
         using_backends = haystack.connection_router.for_write(instance=self)
         for using in using_backends:
             try:
@@ -1268,6 +1743,33 @@ class Paper(models.Model, BarePaper):
             except haystack.exceptions.NotHandled:
                 pass
 
+    @classmethod
+    def update_index_batch(cls, papers, deferred=None):
+        """
+        Updates Haystack's index for many papers at once,
+        with one bulk request per backend. The records and researchers
+        of the papers are fetched with a few queries for the whole batch.
+
+        :param deferred: see :meth:`update_index`
+        """
+        papers = [p for p in papers if p is not None]
+        if not papers:
+            return
+        if deferred is None:
+            deferred = settings.DEFERRED_INDEXING
+        if deferred:
+            enqueue_papers([p.pk for p in papers])
+            return
+        using_backends = haystack.connection_router.for_write()
+        for using in using_backends:
+            try:
+                index = haystack.connections[using].get_unified_index(
+                                        ).get_index(Paper)
+                with index.prefetched(papers):
+                    index._get_backend(using).update(index, papers)
+            except haystack.exceptions.NotHandled:
+                pass
+
 # Rough data extracted through OAI-PMH
 
 class OaiSourceManager(CachingManager):
@@ -1322,6 +1824,108 @@ class OaiSource(CachingMixin, models.Model):
         verbose_name = "OAI source"
 
 
+class OaiHarvestWindow(models.Model):
+    """
+    A range of datestamps of an :class:`OaiSource` being harvested.
+    The resumption token and the latest datestamp seen are stored after
+    each page of records, so that an interrupted harvest resumes where
+    it stopped. The range of a harvest can be split in several windows,
+    harvested in parallel.
+    """
+    source = models.ForeignKey(OaiSource, on_delete=models.CASCADE)
+
+    #: the metadata format harvested
+    metadata_prefix = models.CharField(max_length=64)
+
+    #: start of the window (included). Null to harvest from the beginning.
+    from_date = models.DateTimeField(null=True)
+
+    #: end of the window (included)
+    until = models.DateTimeField()
+
+    #: resumption token returned with the last page processed
+    resumption_token = models.TextField(null=True, blank=True)
+
+    #: latest datestamp of the records processed so far
+    last_datestamp = models.DateTimeField(null=True)
+
+    #: has the window been harvested entirely?
+    done = models.BooleanField(default=False)
+
+    def __str__(self):
+        return '{} ({} to {})'.format(self.source, self.from_date, self.until)
+
+    @classmethod
+    def plan(cls, source, from_date, until, metadata_prefix, nb_windows=1):
+        """
+        Returns the windows to harvest for a source. If the previous
+        harvest of the source was interrupted, its remaining windows are
+        returned so that it is resumed. Otherwise, the range between
+        from_date and until is split in nb_windows windows of equal length.
+
+        :param from_date: start of the range (aware datetime), or None
+        :param until: end of the range (aware datetime). If None, the
+            pending harvest is resumed whatever its end, or the range
+            ends now.
+        :raises ValueError: if a harvest of another range is pending
+        """
+        windows = list(cls.objects.filter(source=source,
+            metadata_prefix=metadata_prefix).order_by('until'))
+        pending = [w for w in windows if not w.done]
+        if pending:
+            # The windows done are kept until the whole harvest is done,
+            # so they give the range of the harvest
+            start = windows[0].from_date
+            end = windows[-1].until
+            if from_date != start or (until is not None and until != end):
+                raise ValueError('A harvest of {} from {} to {} is pending'.format(
+                    source, start, end))
+            return pending
+        if until is None:
+            until = timezone.now()
+        if from_date is None or nb_windows <= 1:
+            bounds = [from_date, until]
+        else:
+            step = (until - from_date) / nb_windows
+            bounds = [from_date + i*step for i in range(nb_windows)] + [until]
+        windows = [cls(source=source, metadata_prefix=metadata_prefix,
+                       from_date=start, until=end)
+                   for start, end in zip(bounds, bounds[1:])]
+        return cls.objects.bulk_create(windows)
+
+    def checkpoint(self, resumption_token, datestamp=None):
+        """
+        Records that a page of records has been processed.
+
+        :param resumption_token: the token to fetch the next page, None if
+            this was the last page
+        :param datestamp: the latest datestamp of the records of the page
+        """
+        self.resumption_token = resumption_token
+        if datestamp is not None and (self.last_datestamp is None or datestamp > self.last_datestamp):
+            self.last_datestamp = datestamp
+        self.done = resumption_token is None
+        self.save(update_fields=['resumption_token', 'last_datestamp', 'done'])
+
+    @classmethod
+    def advance_source(cls, source):
+        """
+        Once all the windows of a source are harvested, moves its
+        `last_update` to the end of the harvest and forgets the windows.
+
+        :returns: True if the harvest of the source is complete
+        """
+        with transaction.atomic():
+            source = OaiSource.objects.no_cache().select_for_update().get(pk=source.pk)
+            windows = list(cls.objects.filter(source=source))
+            if not windows or not all(w.done for w in windows):
+                return False
+            source.last_update = max(w.until for w in windows)
+            source.save()
+            cls.objects.filter(pk__in=[w.pk for w in windows]).delete()
+        return True
+
+
 class OaiRecord(models.Model, BareOaiRecord):
     source = models.ForeignKey(OaiSource, on_delete=models.CASCADE)
     about = models.ForeignKey(Paper, on_delete=models.CASCADE)
@@ -1352,6 +1956,11 @@ class OaiRecord(models.Model, BareOaiRecord):
     doi = models.CharField(max_length=1024, blank=True,
                            null=True, db_index=True)
 
+    # Normalized versions of splash_url and pdf_url, used to find duplicates.
+    # See :meth:`url_key`
+    splash_key = models.CharField(max_length=1024, blank=True, null=True)
+    pdf_key = models.CharField(max_length=1024, blank=True, null=True)
+
     last_update = models.DateTimeField(auto_now=True)
 
     # Cached version of source.priority
@@ -1360,10 +1969,132 @@ class OaiRecord(models.Model, BareOaiRecord):
     def __str__(self):
         return self.identifier
 
+    #: Fields that :meth:`merge_metadata` can change
+    MERGED_FIELDS = [
+        'source',
+        'priority',
+        'splash_url',
+        'pdf_url',
+        'contributors',
+        'keywords',
+        'description',
+        'doi',
+        'pubtype',
+    ]
+
+    https_re = re.compile(r'https?(.*)')
+
+    @classmethod
+    def url_key(cls, url):
+        """
+        Normalizes a URL so that slight variations of the same URL
+        (for instance https:// instead of http://) get the same key.
+        URLs pointing to a DOI are reduced to the DOI.
+
+        :returns: the key, or `None` if the URL is empty or not a HTTP URL
+        """
+        if not url:
+            return
+        doi = to_doi(url)
+        if doi:
+            return doi
+        match = cls.https_re.match(url.strip())
+        if match:
+            return match.group(1)[:1024]
+
+    def update_url_keys(self):
+        """
+        Recomputes the normalized URLs of this record.
+        URLs without key get an empty key, so that `None` means
+        that the keys have not been computed yet.
+        """
+        self.splash_key = self.url_key(self.splash_url) or ''
+        self.pdf_key = self.url_key(self.pdf_url) or ''
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        record = super(OaiRecord, cls).from_db(db, field_names, values)
+        # Remember the DOI in the database, to invalidate it in the DOI cache if it changes
+        record._saved_doi = record.doi
+        return record
+
+    def save(self, *args, **kwargs):
+        self.update_url_keys()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'splash_url', 'pdf_url'} & set(update_fields):
+            kwargs['update_fields'] = list(update_fields) + ['splash_key', 'pdf_key']
+        super(OaiRecord, self).save(*args, **kwargs)
+        saved_doi = getattr(self, '_saved_doi', None)
+        if saved_doi != self.doi and (update_fields is None or 'doi' in update_fields):
+            doi_cache.invalidate(saved_doi)
+            self._saved_doi = self.doi
+        doi_cache.set(self.doi, self.about_id)
+
+    def delete(self, *args, **kwargs):
+        for doi in {getattr(self, '_saved_doi', None), self.doi}:
+            doi_cache.invalidate(doi)
+        return super(OaiRecord, self).delete(*args, **kwargs)
+
     def update_priority(self):
         super(OaiRecord, self).update_priority()
         self.save(update_fields=['priority'])
 
+    def update_from_bare(self, bare_record):
+        """
+        Refreshes the metadata of this record with a bare record
+        bearing the same identifier, typically because the record
+        has been harvested again. The metadata is merged as in
+        :meth:`new`.
+
+        The change is not commited to the database.
+
+        :returns: `True` if the record was changed
+        """
+        return self.merge_metadata(bare_record.source, bare_record.__dict__)
+
+    def merge_metadata(self, source, fields):
+        """
+        Merges the metadata of a duplicate of this record in it:
+        the PDF url is only replaced by one from a source with higher
+        priority, longer descriptions, keywords, contributors and DOIs
+        win, and the publication type is only changed for a preferred one.
+
+        The change is not commited to the database.
+
+        :param source: the :class:`OaiSource` of the duplicate
+        :param fields: the values of the fields of the duplicate
+        :returns: `True` if the record was changed
+        """
+        changed = False
+
+        pdf_url = fields.get('pdf_url')
+        if pdf_url is not None and (self.pdf_url is None or
+                                    (self.pdf_url != pdf_url and self.priority < source.priority)):
+            self.source = source
+            self.priority = source.priority
+            self.pdf_url = pdf_url
+            self.splash_url = fields.get('splash_url') or self.splash_url
+            changed = True
+
+        for field in ['contributors', 'keywords', 'description', 'doi']:
+            new_val = fields.get(field, '')
+            old_val = getattr(self, field)
+            if new_val and (not old_val or len(old_val) < len(new_val)):
+                setattr(self, field, new_val)
+                changed = True
+
+        new_pubtype = fields.get('pubtype', source.default_pubtype)
+        if new_pubtype in PAPER_TYPE_PREFERENCE:
+            idx = PAPER_TYPE_PREFERENCE.index(new_pubtype)
+            old_idx = len(PAPER_TYPE_PREFERENCE)-1
+            if self.pubtype in PAPER_TYPE_PREFERENCE:
+                old_idx = PAPER_TYPE_PREFERENCE.index(self.pubtype)
+            if idx < old_idx:
+                changed = True
+                self.pubtype = PAPER_TYPE_PREFERENCE[idx]
+
+        return changed
+
     @classmethod
     def new(cls, **kwargs):
         """
@@ -1405,7 +2136,13 @@ class OaiRecord(models.Model, BareOaiRecord):
 
         # We check that there are not already too many records in this
         # paper
-        if about.cached_oairecords and len(about.cached_oairecords) >= MAX_OAIRECORDS_PER_PAPER:
+        if about.cached_oairecords is not None:
+            nb_records = len(about.cached_oairecords)
+        elif not about.just_created:
+            nb_records = about.oairecord_set.count()
+        else:
+            nb_records = 0
+        if nb_records >= MAX_OAIRECORDS_PER_PAPER:
             raise ValueError('Too many records in paper %d' % about.pk)
 
         # We don't search for records with the same identifier yet,
@@ -1449,44 +2186,13 @@ class OaiRecord(models.Model, BareOaiRecord):
 
         # Update the duplicate if necessary
         if match:
-            changed = False
-
-            if pdf_url != None and (match.pdf_url == None or
-                                    (match.pdf_url != pdf_url and match.priority < source.priority)):
-                match.source = source
-                match.priority = source.priority
-                match.pdf_url = pdf_url
-                match.splash_url = splash_url
-                changed = True
-
-            def update_field_conditionally(field):
-                global changed
-                new_val = kwargs.get(field, '')
-                if new_val and (not match.__dict__[field] or
-                                len(match.__dict__[field]) < len(new_val)):
-                    match.__dict__[field] = new_val
-                    changed = True
-
-            update_field_conditionally('contributors')
-            update_field_conditionally('keywords')
-            update_field_conditionally('description')
-            update_field_conditionally('doi')
+            changed = match.merge_metadata(source, kwargs)
 
             new_pubdate = kwargs.get('pubdate')
             if new_pubdate and match.about.pubdate > new_pubdate:
                 match.about.pubdate = new_pubdate
                 match.save(update_fields=['pubdate'])
 
-            new_pubtype = kwargs.get('pubtype', source.default_pubtype)
-            if new_pubtype in PAPER_TYPE_PREFERENCE:
-                idx = PAPER_TYPE_PREFERENCE.index(new_pubtype)
-                old_idx = len(PAPER_TYPE_PREFERENCE)-1
-                if match.pubtype in PAPER_TYPE_PREFERENCE:
-                    old_idx = PAPER_TYPE_PREFERENCE.index(match.pubtype)
-                if idx < old_idx:
-                    changed = True
-                    match.pubtype = PAPER_TYPE_PREFERENCE[idx]
-
             if changed:
                 try:
                     match.save()
@@ -1515,39 +2221,76 @@ class OaiRecord(models.Model, BareOaiRecord):
         :param splash_url: the splash url of the target record (link to the metadata page)
         :param pdf_url: the url of the PDF, if known (otherwise `None`)
         """
-        https_re = re.compile(r'https?(.*)')
-
-        def shorten(url):
-            """
-            removes the 'https?' prefix or converts to DOI
-            """
-            if not url:
-                return
-            doi = to_doi(url)
-            if doi:
-                return doi
-            match = https_re.match(url.strip())
-            if match:
-                return match.group(1)
-
-        short_splash = shorten(splash_url)
-        short_pdf = shorten(pdf_url)
-
-        if short_splash == None or paper == None:
-            return
+        return cls.find_duplicate_records_batch([(paper, splash_url, pdf_url)])[0]
+
+    @classmethod
+    def find_duplicate_records_batch(cls, candidates):
+        """
+        Finds duplicate OAI records for many records at once, with a single query.
+        See :meth:`find_duplicate_records`.
 
-        records = list(paper.oairecord_set.all()[:MAX_OAIRECORDS_PER_PAPER])
-        paper.cached_oairecords = records
+        :param candidates: list of triples (paper, splash_url, pdf_url)
+        :returns: the list of duplicates (or `None`), in the same order
+        """
+        keys = []
+        for paper, splash_url, pdf_url in candidates:
+            splash_key = cls.url_key(splash_url)
+            if paper is None or not splash_key:
+                keys.append(None)
+            else:
+                keys.append((paper, splash_key, cls.url_key(pdf_url)))
+        valid_keys = [k for k in keys if k is not None]
+        if not valid_keys:
+            return [None] * len(candidates)
+
+        url_keys = set()
+        for paper, splash_key, pdf_key in valid_keys:
+            url_keys.add(splash_key)
+            if pdf_key:
+                url_keys.add(pdf_key)
+
+        # Records saved before the keys were introduced have no splash key
+        # (until the `populate_url_keys` command has run), so we compute
+        # their keys here. As before the keys, at most
+        # MAX_OAIRECORDS_PER_PAPER of them are considered for each paper.
+        legacy_records = cls.objects.filter(
+            about_id=OuterRef('about_id'),
+            splash_key__isnull=True,
+        ).order_by('pk').values('pk')[:MAX_OAIRECORDS_PER_PAPER]
+        records = cls.objects.filter(
+            Q(splash_key__in=url_keys) | Q(pdf_key__in=url_keys) |
+            Q(splash_key__isnull=True, pk__in=Subquery(legacy_records)),
+            about__in={key[0].pk for key in valid_keys},
+        ).order_by('pk')
+
+        by_splash = dict()
+        by_pdf = dict()
         for record in records:
-            short_splash2 = shorten(record.splash_url)
-            short_pdf2 = shorten(record.pdf_url)
-            if (short_splash == short_splash2 or
-                (short_pdf is not None and
-                 short_pdf2 == short_pdf)):
-                return record
+            if record.splash_key is None:
+                record.update_url_keys()
+            if record.splash_key:
+                by_splash.setdefault((record.about_id, record.splash_key), record)
+            if record.pdf_key:
+                by_pdf.setdefault((record.about_id, record.pdf_key), record)
+
+        duplicates = []
+        for key in keys:
+            if key is None:
+                duplicates.append(None)
+                continue
+            paper, splash_key, pdf_key = key
+            duplicate = by_splash.get((paper.pk, splash_key))
+            if duplicate is None and pdf_key:
+                duplicate = by_pdf.get((paper.pk, pdf_key))
+            duplicates.append(duplicate)
+        return duplicates
 
     class Meta:
         verbose_name = "OAI record"
+        indexes = [
+            models.Index(fields=['about', 'splash_key']),
+            models.Index(fields=['about', 'pdf_key']),
+        ]
 
 
 def create_default_stats():
@@ -23,6 +23,8 @@
 import re
 import logging
 
+from functools import lru_cache
+
 import name_tools
 from papers.utils import iunaccent
 from papers.utils import remove_diacritics
@@ -263,6 +265,129 @@ def name_signature(first, last):
         ident = iunaccent(first[0])+'-'+ident
     return ident
 
+### Normalized names ###
+
+
+class NormalizedName(object):
+    """
+    A (first, last) name pair, with the normalized forms used to
+    compare names computed once and for all. It behaves like the
+    pair itself, so it can be given to all the matching functions
+    of this module instead of a pair.
+
+    >>> n = NormalizedName('Jean-Pierre', 'Émery')
+    >>> n.first_words
+    ('Jean', 'Pierre')
+    >>> n.initials
+    ('J', 'P')
+    >>> n.unaccented_last
+    'emery'
+    >>> first, last = n
+    >>> n == ('Jean-Pierre', 'Émery')
+    True
+    """
+    __slots__ = (
+        'first',
+        'last',
+        #: words and separators of the first name
+        'first_words',
+        'first_separators',
+        #: first letters of the words of the first name
+        'initials',
+        #: words of the first name, without diacritics and case
+        'unaccented_first_words',
+        #: last name without diacritics and case
+        'unaccented_last',
+        '_last_words',
+        #: last name without diacritics, case and hyphens
+        'last_key',
+    )
+
+    def __init__(self, first, last):
+        init = super(NormalizedName, self).__setattr__
+        init('first', first)
+        init('last', last)
+        words, separators = split_name_words(first)
+        init('first_words', tuple(words))
+        init('first_separators', tuple(separators))
+        init('initials', tuple(w[0] for w in words))
+        init('unaccented_first_words', tuple(split_name_words(iunaccent(first))[0]))
+        unaccented_last = iunaccent(last)
+        init('unaccented_last', unaccented_last)
+        init('_last_words', None)
+        init('last_key', normalize_last_name(last))
+
+    @classmethod
+    def of(cls, name):
+        """
+        :param name: a (first, last) pair or a NormalizedName
+        :returns: the corresponding NormalizedName, shared with
+            the other callers normalizing the same name
+        """
+        if isinstance(name, cls):
+            return name
+        first, last = name
+        return normalize_name(first, last)
+
+    @property
+    def last_words(self):
+        """
+        The set of the words of the unaccented last name,
+        computed on first access.
+        """
+        if self._last_words is None:
+            words = frozenset(split_name_words(self.unaccented_last)[0])
+            super(NormalizedName, self).__setattr__('_last_words', words)
+        return self._last_words
+
+    @property
+    def pair(self):
+        return (self.first, self.last)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('NormalizedName instances are immutable')
+
+    def __len__(self):
+        return 2
+
+    def __iter__(self):
+        yield self.first
+        yield self.last
+
+    def __getitem__(self, idx):
+        return self.pair[idx]
+
+    def __eq__(self, other):
+        if isinstance(other, NormalizedName):
+            other = other.pair
+        return self.pair == other
+
+    def __hash__(self):
+        return hash(self.pair)
+
+    def __repr__(self):
+        return 'NormalizedName(%r, %r)' % self.pair
+
+
+#: Number of normalized names kept in memory. The same authors come back
+#: every time their papers are merged, in particular for large collaborations.
+NORMALIZED_NAME_CACHE_SIZE = 65536
+
+
+@lru_cache(maxsize=NORMALIZED_NAME_CACHE_SIZE)
+def normalize_name(first, last):
+    """
+    :returns: the :class:`NormalizedName` of a name, cached
+    """
+    return NormalizedName(first, last)
+
+
+def is_name_pair(name):
+    """
+    Can this object be compared to other names?
+    """
+    return bool(name) and len(name) == 2
+
 ### Name similarity measure ###
 
 weight_initial_match = 0.4
@@ -286,18 +411,14 @@ def name_similarity(a, b):
     Returns a float: how similar are these two names?
     """
 
-    if not a or not b or len(a) != 2 or len(b) != 2:
+    if not is_name_pair(a) or not is_name_pair(b):
         return False
-    firstA, lastA = a
-    firstB, lastB = b
-    firstA = iunaccent(firstA)
-    firstB = iunaccent(firstB)
-    lastA = iunaccent(lastA)
-    lastB = iunaccent(lastB)
-    if lastA != lastB:
+    a = NormalizedName.of(a)
+    b = NormalizedName.of(b)
+    if a.unaccented_last != b.unaccented_last:
         return 0.
-    partsA, sepsA = split_name_words(firstA)
-    partsB, sepsB = split_name_words(firstB)
+    partsA = list(a.unaccented_first_words)
+    partsB = list(b.unaccented_first_words)
     parts = list(zip(partsA, partsB))
     if not all(map(match_first_names, parts)):
         # Try to match in reverse
@@ -340,26 +461,20 @@ def shallower_name_similarity(a, b):
     affiliation to the right author in papers fetched from ORCID.
     (in the next function)
     """
-    if not a or not b or len(a) != 2 or len(b) != 2:
+    if not is_name_pair(a) or not is_name_pair(b):
         return False
-    firstA, lastA = a
-    firstB, lastB = b
+    a = NormalizedName.of(a)
+    b = NormalizedName.of(b)
 
     # Matching last names
-    lastA = iunaccent(lastA)
-    lastB = iunaccent(lastB)
-    wordsA, _ = split_name_words(lastA)
-    wordsB, _ = split_name_words(lastB)
-    wordsA = set(wordsA)
-    wordsB = set(wordsB)
+    wordsA = a.last_words
+    wordsB = b.last_words
     if not wordsA or not wordsB:
         return False
     ratio = float(len(wordsA & wordsB)) / len(wordsA | wordsB)
 
-    partsA, sepsA = split_name_words(firstA)
-    partsB, sepsB = split_name_words(firstB)
-    partsA = [ p[0] for p in partsA ]
-    partsB = [ p[0] for p in partsB ]
+    partsA = list(a.initials)
+    partsB = list(b.initials)
 
     parts = list(zip(partsA, partsB))
     if not all(map(match_first_names, parts)):
@@ -379,6 +494,8 @@ def most_similar_author(ref_name, authors):
     in the authors list, if there is any compatible name.
     (None otherwise)
     """
+    if is_name_pair(ref_name):
+        ref_name = NormalizedName.of(ref_name)
     max_sim_idx = None
     max_sim = 0.
     for idx, name in enumerate(authors):
@@ -556,18 +673,18 @@ def name_unification(a, b):
     """
     Returns the unified name of two matching names
 
-    :param a: the first name pair (pair of unicode strings)
+    :param a: the first name pair (pair of unicode strings, or :class:`NormalizedName`)
     :param b: the second name pair (idem)
     :returns: a unified name pair.
     """
-    firstA, lastA = a
-    firstB, lastB = b
+    a = NormalizedName.of(a)
+    b = NormalizedName.of(b)
 
-    if normalize_last_name(lastA) != normalize_last_name(lastB):
+    if a.last_key != b.last_key:
         return None
 
-    wordsA, sepsA = split_name_words(firstA)
-    wordsB, sepsB = split_name_words(firstB)
+    wordsA, sepsA = list(a.first_words), list(a.first_separators)
+    wordsB, sepsB = list(b.first_words), list(b.first_separators)
 
     def keep_best(pair):
         a, b = pair
@@ -610,7 +727,7 @@ def name_unification(a, b):
     if best_words is not None:
         best_words, best_seps = deduplicate_words(best_words, best_seps)
         firstUnified = rebuild_name(best_words, best_seps)
-        return firstUnified, lastA
+        return firstUnified, a.last
 
     # No match
     return None
@@ -621,13 +738,19 @@ def unify_name_lists(a, b):
     Unify two name lists, by matching compatible names and unifying them, and inserting the other names as they are.
     The names are sorted by average rank in the two lists.
 
+    Both lists are sorted by last and first names, so that the names
+    sharing a last name come together, ordered by their first names.
+    The two sorted lists are then merged in a single pass, so the
+    unification is O(n log n). The names are normalized once (and
+    cached, see :func:`normalize_name`), which matters for papers by
+    large collaborations.
+
     :returns: the unified list of pairs: the first component is the unified name (a pair itself),
               the second is the pair of indices from the original lists this name was created from
               (None when there is no corresponding name in one of the lists).
     """
-    # TODO some normalization of last names? for instance case, hyphens…
-    a = sorted(enumerate(a), key=lambda idx_first_last: (idx_first_last[1][1], idx_first_last[1][0]))
-    b = sorted(enumerate(b), key=lambda idx_first_last1: (idx_first_last1[1][1], idx_first_last1[1][0]))
+    a = sorted(enumerate(map(NormalizedName.of, a)), key=_sort_key)
+    b = sorted(enumerate(map(NormalizedName.of, b)), key=_sort_key)
 
     iA = 0
     iB = 0
@@ -646,10 +769,8 @@ def unify_name_lists(a, b):
             result.append((a[iA][1], (rankA+1)/lenA, (idxA, None)))
             iA += 1
         else:
-            idxA = a[iA][0]
-            idxB = b[iB][0]
-            nameA = a[iA][1]
-            nameB = b[iB][1]
+            idxA, nameA = a[iA]
+            idxB, nameB = b[iB]
             rankA = (idxA+1)/lenA
             rankB = (idxB+1)/lenB
 
@@ -667,30 +788,37 @@ def unify_name_lists(a, b):
                 result.append((nameA, rankA, (idxA, idxB)))
                 iA += 1
                 iB += 1
-            elif nameA[1] == nameB[1]:
+            elif nameA.last == nameB.last:
                 # Those two names look incompatible because of their first names
                 result.append((nameA, rankA, (idxA, None)))
                 result.append((nameB, rankB, (None, idxB)))
                 iA += 1
                 iB += 1
-            elif nameA[1] < nameB[1]:
+            elif nameA.last < nameB.last:
                 result.append((nameA, rankA, (idxA, None)))
                 iA += 1
             else:
                 result.append((nameB, rankB, (None, idxB)))
                 iB += 1
 
-    result = [(name, idx) for name, _, idx in sorted(result, key=lambda x: x[1])]
+    result.sort(key=lambda x: x[1])
+
+    seen = set()
+    unique = []
+    for name, _, idx in result:
+        first, last = name
+        key = tuple(sorted([first.lower(), last.lower()]))
+        if key not in seen:
+            seen.add(key)
+            unique.append((tuple(name), idx))
+        else:
+            unique.append((None, idx))
+    return unique
 
-    def make_unique(lst):
-        seen = set()
-        for name, idx in lst:
-            first, last = name
-            [k1, k2] = sorted([first.lower(), last.lower()])
-            if (k1, k2) not in seen:
-                seen.add((k1, k2))
-                yield (name, idx)
-            else:
-                yield (None, idx)
 
-    return list(make_unique(result))
+def _sort_key(idx_name):
+    """
+    Order of the names in :func:`unify_name_lists`
+    """
+    name = idx_name[1]
+    return (name.last, name.first)
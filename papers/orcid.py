@@ -20,11 +20,16 @@
 
 
 import logging
+import pytz
 import requests
 
+from datetime import datetime
+
 from django.conf import settings
 from django.utils.functional import cached_property
 from papers.errors import MetadataSourceException
+from papers.httppool import get_session
+from papers.httppool import map_concurrently
 from papers.name import normalize_name_words
 from papers.name import parse_comma_name
 from papers.name import most_similar_author
@@ -93,14 +98,23 @@ class OrcidProfile(object):
     """
     An orcid profile as returned by the ORCID public API (in JSON)
     """
+    # Number of works fetched by each request
+    works_batch_size = 25
+    # Number of seconds after which a request to the API times out
+    timeout = 30
 
-    def __init__(self, orcid_id=None, json=None, instance=settings.ORCID_BASE_DOMAIN):
+    def __init__(self, orcid_id=None, json=None, instance=settings.ORCID_BASE_DOMAIN, offline=False):
         """
         Create a profile by ORCID ID or by providing directly the parsed JSON payload.
+
+        :param offline: never query the API, only use the metadata in the JSON payload
+            (as when importing a dump). Besides the record, it can contain the full
+            metadata of works, in the format of the bulk works endpoint (key 'bulk').
         """
         self.json = json
         self.id = orcid_id
         self.instance = instance
+        self.offline = offline
         if self.instance not in ['orcid.org', 'sandbox.orcid.org']:
             raise ValueError('Unexpected instance')
 
@@ -135,7 +149,7 @@ class OrcidProfile(object):
         """
         headers = {'Accept': 'application/orcid+json'}
         url = self.api_uri + path
-        return requests.get(url, headers=headers).json()
+        return get_session().get(url, headers=headers, timeout=self.timeout).json()
 
     def fetch(self):
         """
@@ -151,7 +165,7 @@ class OrcidProfile(object):
                     return self.fetch()
                 raise ValueError
             self.json = parsed
-        except (requests.exceptions.HTTPError, ValueError):
+        except (requests.exceptions.RequestException, ValueError):
             raise MetadataSourceException(
                 'The ORCiD {id} could not be found from {instance}'.format(id=self.id, instance=self.instance))
         except TypeError:
@@ -166,7 +180,12 @@ class OrcidProfile(object):
         return list(self._work_summaries_generator())
 
     def _work_summaries_generator(self):
-        works_summary = self.request_element('works')
+        # The full record contains the summaries already
+        works_summary = jpath('activities-summary/works', self.json or {})
+        if works_summary is None:
+            if self.offline:
+                return
+            works_summary = self.request_element('works')
         for group in works_summary.get('group') or []:
             for summary in group.get('work-summary') or []:
                 yield OrcidWorkSummary(summary)
@@ -220,6 +239,15 @@ class OrcidProfile(object):
                     }
         return None
 
+    @property
+    def last_modified(self):
+        """
+        Last time the record was modified, or None
+        """
+        timestamp = jpath('history/last-modified-date/value', self.json)
+        if timestamp is not None:
+            return datetime.fromtimestamp(timestamp / 1000., tz=pytz.utc)
+
     @property
     def email(self):
         # TODO
@@ -261,14 +289,23 @@ class OrcidProfile(object):
     def fetch_works(self, put_codes):
         """
         Retrieves the full metadata of the given works in this profile.
-        """
-        batch_size = 25
-        # TODO
-        i = 0
-        while i < len(put_codes):
-            batch = put_codes[i:(i+batch_size)]
-            i += batch_size
-            works_meta = self.request_element('works/'+','.join([str(c) for c in batch]))
+        The works are requested by batches, sent concurrently.
+        """
+        if self.offline:
+            put_codes = set(put_codes)
+            for work in self.json.get('bulk') or []:
+                if jpath('work/put-code', work) in put_codes:
+                    yield OrcidWork(self, work)
+            return
+
+        batches = [
+            put_codes[i:i+self.works_batch_size]
+            for i in range(0, len(put_codes), self.works_batch_size)
+        ]
+        works_metas = map_concurrently(
+            lambda batch: self.request_element('works/'+','.join([str(c) for c in batch])),
+            batches)
+        for works_meta in works_metas:
             for work in works_meta.get('bulk') or []:
                 yield OrcidWork(self, work)
 
@@ -310,6 +347,14 @@ class OrcidWorkSummary(object):
     def put_code(self):
         return self.json.get('put-code')
 
+    @property
+    def last_modified(self):
+        """
+        Last time this publication was modified, in milliseconds since the epoch
+        (as given by ORCID), or None
+        """
+        return jpath('last-modified-date/value', self.json)
+
     def __str__(self):
         return self.title or '(no title)'
 
@@ -1,7 +1,13 @@
+import json
+
+from contextlib import contextmanager
+
 from haystack import indexes
 from papers.utils import remove_diacritics
 
+from .models import OaiRecord
 from .models import Paper
+from .models import Researcher
 
 # from https://github.com/django-haystack/django-haystack/issues/204#issuecomment-544579
 class IntegerMultiValueField(indexes.MultiValueField):
@@ -35,11 +41,50 @@ class PaperIndex(indexes.SearchIndex, indexes.Indexable):
     #: ID of journal
     journal = indexes.IntegerField(null=True)
 
+    #: JSON representation of the paper, as served by the API
+    api_json = indexes.CharField(indexed=False, null=True)
+
     def get_model(self):
         return Paper
 
+    def prefetch(self, papers):
+        """
+        Fetches the records and the institutions of researchers of many
+        papers at once, so that preparing them does not need any query.
+        """
+        records = {paper.pk : [] for paper in papers}
+        for record in OaiRecord.objects.filter(about__in=list(records.keys())).select_related(
+                'source', 'journal', 'publisher'):
+            records[record.about_id].append(record)
+        researcher_ids = set()
+        for paper in papers:
+            paper.cached_oairecords = records[paper.pk]
+            researcher_ids.update(paper.researcher_ids)
+        institutions = dict(Researcher.objects.filter(
+            id__in=researcher_ids).values_list('id', 'institution_id'))
+        for paper in papers:
+            paper.researcher_institutions = institutions
+
+    @contextmanager
+    def prefetched(self, papers):
+        """
+        Same as :meth:`prefetch`, for the duration of a block only:
+        the papers get their previous records back afterwards, and the
+        institutions are removed, so that the papers do not keep the
+        prefetched data once the batch is indexed.
+        """
+        previous_records = [paper.cached_oairecords for paper in papers]
+        self.prefetch(papers)
+        try:
+            yield
+        finally:
+            for paper, records in zip(papers, previous_records):
+                paper.cached_oairecords = records
+                paper.__dict__.pop('researcher_institutions', None)
+
     def full_prepare(self, obj):
-        obj.cache_oairecords()
+        if obj.cached_oairecords is None:
+            obj.cache_oairecords()
         return super(PaperIndex, self).full_prepare(obj)
 
     def get_updated_field(self):
@@ -66,6 +111,10 @@ class PaperIndex(indexes.SearchIndex, indexes.Indexable):
         return [orcid for orcid in obj.orcids() if orcid]
 
     def prepare_institutions(self, obj):
+        institutions = getattr(obj, 'researcher_institutions', None)
+        if institutions is not None:
+            return [x for x in [institutions.get(rid)
+                for rid in obj.researcher_ids] if x is not None]
         return [x for x in [r.institution_id
             for r in obj.researchers] if x is not None]
 
@@ -78,3 +127,13 @@ class PaperIndex(indexes.SearchIndex, indexes.Indexable):
         for r in obj.oairecords:
             if r.journal_id:
                 return r.journal_id
+
+    def prepare_api_json(self, obj):
+        result = obj.json()
+        # The policies of publishers change without the paper being
+        # reindexed, so only the publisher is stored: the policy is filled
+        # in when the results are served (see papers.api.search_results_json)
+        for record, record_json in zip(obj.oairecords, result.get('records', [])):
+            if record_json.pop('policy', None) is not None:
+                record_json['publisher_id'] = record.publisher_id
+        return json.dumps(result)
@@ -19,8 +19,13 @@
 #
 import pytest
 
+from haystack.models import SearchResult
+from mock import patch
+from mock import PropertyMock
+
 from papers.tests.test_ajax import JsonRenderingTest
-from papers.models import Paper, Researcher
+from papers.models import OaiRecord, Paper, Researcher
+from publishers.models import Publisher
 
 class PaperApiTest(JsonRenderingTest):
     maxDiff = None  # Full BibTeX diff output
@@ -213,3 +218,44 @@ class PaperApiTest(JsonRenderingTest):
             resp.content.decode('utf-8').strip(),
             bibtex_output.strip()
         )
+
+    @pytest.mark.usefixtures("rebuild_index", "mock_doi")
+    def test_search_from_index(self):
+        r1 = Researcher.create_by_name('John', 'Doe')
+        p1 = Paper.create_by_doi('10.1109/lics.2015.37')
+        p1.set_researcher(0, r1.id)
+        p1.update_index()  # Ensure index is updated
+
+        # The papers are not fetched from the database
+        with patch.object(SearchResult, 'object', new_callable=PropertyMock) as search_object:
+            resp = self.checkJson(self.getPage(
+                'api-paper-search',
+                getargs={'authors': 'amarilli'}
+            ))
+        self.assertFalse(search_object.called)
+        self.assertEqual(resp['nb_results'], 1)
+        self.assertEqual(resp['papers'], [Paper.objects.get(pk=p1.pk).json()])
+
+    @pytest.mark.usefixtures("rebuild_index", "mock_doi")
+    def test_search_from_index_policy(self):
+        """
+        The policies of the publishers are up to date, although the papers were indexed before
+        """
+        p1 = Paper.create_by_doi('10.1109/lics.2015.37')
+        publisher = Publisher.objects.create(
+            romeo_id='9999', name='Test Publisher',
+            preprint='can', postprint='can', pdfversion='cannot')
+        record = OaiRecord.objects.filter(about=p1).first()
+        record.publisher = publisher
+        record.save()
+        Paper.objects.get(pk=p1.pk).update_index()
+
+        publisher.pdfversion = 'can'
+        publisher.save()
+        resp = self.checkJson(self.getPage(
+            'api-paper-search',
+            getargs={'authors': 'amarilli'}
+        ))
+        record = resp['papers'][0]['records'][0]
+        self.assertEqual(record['policy'], publisher.json())
+        self.assertNotIn('publisher_id', record)
@@ -0,0 +1,156 @@
+import pytest
+
+from papers.doicache import DOICache
+from papers.doicache import doi_cache
+from papers.models import OaiRecord
+from papers.models import Paper
+
+
+class TestDOICache():
+    """
+    Tests the cache itself
+    """
+
+    def test_get_set(self):
+        cache = DOICache(maxsize=10)
+        assert cache.get('10.1/a') is None
+        cache.set('10.1/a', 1)
+        assert cache.get('10.1/a') == 1
+        assert cache.stats == {'hits' : 1, 'redis_hits' : 0, 'misses' : 1, 'size' : 1}
+
+    def test_lru(self):
+        cache = DOICache(maxsize=2)
+        cache.set('10.1/a', 1)
+        cache.set('10.1/b', 2)
+        # a is now the most recently used
+        cache.get('10.1/a')
+        cache.set('10.1/c', 3)
+        assert cache.get('10.1/b') is None
+        assert cache.get('10.1/a') == 1
+        assert cache.get('10.1/c') == 3
+
+    def test_invalidate(self):
+        cache = DOICache()
+        cache.set('10.1/a', 1)
+        cache.invalidate('10.1/a')
+        assert cache.get('10.1/a') is None
+
+    def test_invalidate_other_process(self):
+        """
+        With Redis, an invalidation in a process is seen by the in-memory cache of the others
+        """
+        cache = DOICache(use_redis=True)
+        other = DOICache(use_redis=True)
+        cache.set('10.1/a', 1)
+        other.set('10.1/a', 1)
+        cache.invalidate('10.1/a')
+        assert other.get('10.1/a') is None
+
+    def test_invalidate_redis(self):
+        cache = DOICache(use_redis=True)
+        other = DOICache(use_redis=True)
+        cache.set('10.1/a', 1)
+        assert other.get('10.1/a') == 1
+        assert other.stats['redis_hits'] == 1
+        cache.invalidate('10.1/a')
+        assert other.get('10.1/a') is None
+        assert DOICache(use_redis=True).get('10.1/a') is None
+
+    def test_no_redis(self, monkeypatch):
+        """
+        Without the Redis tier, Redis is never asked
+        """
+        monkeypatch.setattr('papers.doicache.redis_client', None)
+        cache = DOICache()
+        cache.set('10.1/a', 1)
+        assert cache.get('10.1/a') == 1
+        cache.invalidate('10.1/a')
+        assert cache.get('10.1/a') is None
+
+    def test_get_many(self):
+        cache = DOICache()
+        cache.set('10.1/a', 1)
+        cache.set('10.1/b', 2)
+        assert cache.get_many(['10.1/a', '10.1/b', '10.1/c']) == {'10.1/a' : 1, '10.1/b' : 2}
+        assert cache.stats['hits'] == 2
+        assert cache.stats['misses'] == 1
+
+    def test_set_no_doi(self):
+        cache = DOICache()
+        cache.set(None, 1)
+        cache.set('10.1/a', None)
+        assert cache.stats['size'] == 0
+
+
+@pytest.mark.usefixtures('db')
+class TestDOICacheModels():
+    """
+    Tests the use of the cache in the models
+    """
+
+    @pytest.fixture
+    def record(self, dummy_oairecord):
+        dummy_oairecord.doi = '10.1/a'
+        dummy_oairecord.splash_url = 'https://doi.org/10.1/a'
+        dummy_oairecord.save()
+        return dummy_oairecord
+
+    def test_save(self, record):
+        assert doi_cache.get('10.1/a') == record.about_id
+
+    def test_delete(self, record):
+        record.delete()
+        assert doi_cache.get('10.1/a') is None
+        assert Paper.get_by_doi('10.1/a') is None
+
+    def test_delete_changed_doi(self, record):
+        """
+        The DOI in the database is forgotten, even if it was changed on the instance
+        """
+        record = OaiRecord.objects.get(pk=record.pk)
+        record.doi = '10.1/b'
+        record.delete()
+        assert doi_cache.get('10.1/a') is None
+
+    def test_save_changed_doi(self, record):
+        record = OaiRecord.objects.get(pk=record.pk)
+        record.doi = '10.1/b'
+        record.save()
+        assert doi_cache.get('10.1/a') is None
+        assert doi_cache.get('10.1/b') == record.about_id
+        assert Paper.get_by_doi('10.1/a') is None
+
+    def test_get_by_doi(self, record, django_assert_num_queries):
+        with django_assert_num_queries(1):
+            assert Paper.get_by_doi('10.1/A') == record.about
+
+    def test_get_by_doi_stale(self, record):
+        """
+        If the paper does not exist anymore, we ask the database
+        """
+        doi_cache.set('10.1/a', record.about_id + 1000)
+        assert Paper.get_by_doi('10.1/a') == record.about
+        assert doi_cache.get('10.1/a') == record.about_id
+
+    def test_get_by_dois(self, record, django_assert_num_queries):
+        doi_cache.clear()
+        assert Paper.get_by_dois(['10.1/a', '10.1/b']) == {'10.1/a' : record.about}
+        with django_assert_num_queries(2):
+            assert Paper.get_by_dois(['10.1/a', '10.1/b']) == {'10.1/a' : record.about}
+
+    def test_get_id_by_doi(self, record, django_assert_num_queries):
+        with django_assert_num_queries(0):
+            assert Paper.get_id_by_doi('10.1/A') == record.about_id
+        doi_cache.clear()
+        with django_assert_num_queries(1):
+            assert Paper.get_id_by_doi('10.1/a') == record.about_id
+        assert doi_cache.get('10.1/a') == record.about_id
+        assert Paper.get_id_by_doi('10.1/b') is None
+
+    def test_merge(self, record):
+        other = Paper.objects.create(pubdate='2019-10-08')
+        other.merge(record.about)
+        # The DOI points to the paper its record was moved to
+        assert doi_cache.get('10.1/a') == other.pk
+        assert OaiRecord.objects.get(pk=record.pk).about_id == other.pk
+        assert Paper.get_by_doi('10.1/a') == other
@@ -1,5 +1,11 @@
+import pytest
+import time
+
 from unittest import TestCase
 from papers.fingerprint import create_paper_plain_fingerprint
+from papers.fingerprint import fingerprint_many
+from papers.fingerprint import hash_fingerprint
+from papers.fingerprint import last_name_fingerprint
 
 class FingerprintTest(TestCase):
     def test_plain_fingerprint(self):
@@ -12,4 +18,67 @@ class FingerprintTest(TestCase):
         self.assertEqual(create_paper_plain_fingerprint('Long titles are unambiguous enough to be unique by themselves, no need for authors', [('John','Doe')], 2015),
                          'long-titles-are-unambiguous-enough-to-be-unique-by-themselves-no-need-for-authors')
         self.assertEqual(create_paper_plain_fingerprint('Ambiguity', [('John','Doe')], 2014),
-                         'ambiguity-2014/doe')
\ No newline at end of file
+                         'ambiguity-2014/doe')
+
+    def test_last_name_fingerprint(self):
+        self.assertEqual(last_name_fingerprint('van der Waals'), 'waals')
+        self.assertEqual(last_name_fingerprint('Müller-Lüdenscheidt'), 'muller-ludenscheidt')
+
+    def test_last_name_fingerprint_cached(self):
+        last_name_fingerprint.cache_clear()
+        last_name_fingerprint('van der Waals')
+        last_name_fingerprint('van der Waals')
+        self.assertEqual(last_name_fingerprint.cache_info().hits, 1)
+
+    def test_fingerprint_many(self):
+        papers = [
+            ('Ambiguity', [('John', 'Doe')], 2014),
+            ('Les accents sont supprimés', [('John', 'Doe'), ('Jane', 'van Dam')], 2015),
+            ('Long titles are unambiguous enough to be unique by themselves, no need for authors',
+             [('John', 'Smith')], 2015),
+        ]
+        last_name_fingerprint.cache_clear()
+        self.assertEqual(
+            fingerprint_many(papers),
+            [hash_fingerprint(create_paper_plain_fingerprint(*paper)) for paper in papers])
+
+    def test_fingerprint_many_normalizes_once(self):
+        papers = [
+            ('Ambiguity', [('John', 'Doe'), ('Jane', 'van Dam')], 2014),
+            ('Another ambiguity', [('Jane', 'van Dam'), ('John', 'Doe')], 2015),
+            ('Long titles are unambiguous enough to be unique by themselves, no need for authors',
+             [('John', 'Smith')], 2015),
+        ]
+        last_name_fingerprint.cache_clear()
+        fingerprint_many(papers)
+        info = last_name_fingerprint.cache_info()
+        self.assertEqual((info.hits, info.misses), (0, 2))
+
+
+@pytest.mark.benchmark
+def test_benchmark_fingerprint():
+    """
+    Compares the throughput of fingerprints computed one by one without
+    the cache of last names, as it used to be done, with fingerprint_many.
+    """
+    last_names = ['van der Waals', 'Müller-Lüdenscheidt', 'de la Fontaine', 'Doe', 'Nguyễn', 'Smith']
+    papers = [
+        ('On the topic number {}'.format(i),
+         [('A.', '{} {}'.format(last_names[(i + j) % len(last_names)], j % 50)) for j in range(10)],
+         2000 + i % 20)
+        for i in range(5000)
+    ]
+
+    start = time.perf_counter()
+    for paper in papers:
+        last_name_fingerprint.cache_clear()
+        hash_fingerprint(create_paper_plain_fingerprint(*paper))
+    uncached = time.perf_counter() - start
+
+    last_name_fingerprint.cache_clear()
+    start = time.perf_counter()
+    fingerprint_many(papers)
+    batched = time.perf_counter() - start
+
+    print('One by one, uncached: {:.0f} papers/sec'.format(len(papers) / uncached))
+    print('fingerprint_many: {:.0f} papers/sec'.format(len(papers) / batched))
@@ -0,0 +1,59 @@
+import pytest
+import threading
+import time
+
+from papers.httppool import get_session
+from papers.httppool import make_session
+from papers.httppool import map_concurrently
+
+
+class TestMapConcurrently():
+
+    def test_order(self):
+        def slow_square(x):
+            # The first items finish last
+            time.sleep(0.01 * (5 - x))
+            return x * x
+        assert map_concurrently(slow_square, range(5), max_workers=5) == [0, 1, 4, 9, 16]
+
+    def test_max_workers(self):
+        running = []
+        max_running = []
+        lock = threading.Lock()
+
+        def track(x):
+            with lock:
+                running.append(x)
+                max_running.append(len(running))
+            time.sleep(0.01)
+            with lock:
+                running.remove(x)
+            return x
+
+        assert map_concurrently(track, range(10), max_workers=3) == list(range(10))
+        assert max(max_running) <= 3
+
+    def test_inline(self):
+        threads = map_concurrently(lambda x: threading.current_thread(), [1, 2], max_workers=1)
+        assert threads == [threading.current_thread()] * 2
+
+    def test_exception(self):
+        def fail(x):
+            if x == 2:
+                raise ValueError
+            return x
+        with pytest.raises(ValueError):
+            map_concurrently(fail, range(4), max_workers=2)
+
+    def test_empty(self):
+        assert map_concurrently(lambda x: x, []) == []
+
+
+def test_make_session():
+    adapter = make_session(3).get_adapter('https://pub.orcid.org/')
+    assert adapter._pool_maxsize == 3
+    assert adapter._pool_block
+
+
+def test_get_session():
+    assert get_session() is get_session()
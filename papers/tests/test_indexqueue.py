@@ -0,0 +1,75 @@
+import pytest
+
+from dissemin.settings import redis_client
+from papers import indexqueue
+from papers.models import Paper
+
+
+@pytest.fixture
+def index_queue():
+    """
+    Empties the queue before and after the test
+    """
+    redis_client.delete(indexqueue.QUEUE_KEY)
+    yield indexqueue
+    redis_client.delete(indexqueue.QUEUE_KEY)
+
+
+@pytest.fixture
+def indexed(monkeypatch):
+    """
+    Records the papers sent to the index
+    """
+    papers = []
+    def update_index_batch(batch, deferred=None):
+        assert deferred is False
+        papers.extend(batch)
+    monkeypatch.setattr(Paper, 'update_index_batch', update_index_batch)
+    return papers
+
+
+class TestIndexQueue():
+
+    def test_enqueue_deduplicates(self, index_queue):
+        index_queue.enqueue_papers([1, 2, 1])
+        index_queue.enqueue_papers([2, None])
+        assert index_queue.queue_length() == 2
+
+    def test_pop_batch(self, index_queue):
+        index_queue.enqueue_papers([1])
+        index_queue.enqueue_papers([2])
+        index_queue.enqueue_papers([3])
+        assert index_queue.pop_batch(2) == [1, 2]
+        assert index_queue.pop_batch(2) == [3]
+        assert index_queue.pop_batch(2) == []
+
+    def test_drain(self, index_queue, indexed, book_god_of_the_labyrinth, dummy_paper):
+        index_queue.enqueue_papers([book_god_of_the_labyrinth.pk, dummy_paper.pk])
+        assert index_queue.drain(batch_size=1) == 2
+        assert set(indexed) == {book_god_of_the_labyrinth, dummy_paper}
+        assert index_queue.queue_length() == 0
+
+    def test_drain_deleted_paper(self, index_queue, indexed, dummy_paper):
+        pk = dummy_paper.pk
+        dummy_paper.delete()
+        index_queue.enqueue_papers([pk])
+        assert index_queue.drain() == 0
+        assert index_queue.queue_length() == 0
+
+    def test_drain_error(self, index_queue, monkeypatch, dummy_paper):
+        """
+        If indexing fails, the papers stay in the queue
+        """
+        def update_index_batch(batch, deferred=None):
+            raise ConnectionError
+        monkeypatch.setattr(Paper, 'update_index_batch', update_index_batch)
+        index_queue.enqueue_papers([dummy_paper.pk])
+        with pytest.raises(ConnectionError):
+            index_queue.drain()
+        assert index_queue.queue_length() == 1
+
+    def test_update_index_deferred(self, index_queue, settings, dummy_paper):
+        settings.DEFERRED_INDEXING = True
+        dummy_paper.update_index()
+        Paper.update_index_batch([dummy_paper])
+        assert index_queue.pop_batch(10) == [dummy_paper.pk]
@@ -43,6 +43,7 @@ from papers.models import OaiSource
 from papers.models import Paper
 from papers.models import Researcher
 from papers.models import Institution
+from papers.tests.test_orcid import OrcidProfileStub
 from publishers.tests.test_romeo import RomeoAPIStub
 
 class TestPaper():
@@ -86,6 +87,106 @@ class TestPaper():
             book_god_of_the_labyrinth.todolist.add(user_isaac_newton)
         assert book_god_of_the_labyrinth.on_todolist(user_isaac_newton) == on_list
 
+    @staticmethod
+    def author_rep(first, last, researcher_id=None):
+        return {
+            'name': {'first': first, 'last': last, 'full': '{} {}'.format(first, last).lower()},
+            'orcid': None,
+            'affiliation': None,
+            'researcher_id': researcher_id,
+        }
+
+    def test_authors_cached(self):
+        paper = Paper(authors_list=[self.author_rep('John', 'Doe'), self.author_rep('Jane', 'Doe')])
+        authors = paper.authors
+        assert [str(a) for a in authors] == ['John Doe', 'Jane Doe']
+        assert paper.authors is not authors
+        assert all(a is b for a, b in zip(authors, paper.authors))
+        assert authors[0].name is paper.authors[0].name
+
+        # Changes to the representations are visible
+        paper.authors_list[0]['orcid'] = '0000-0002-8612-8827'
+        assert paper.authors[0].orcid == '0000-0002-8612-8827'
+
+        # Replaced representations are read again, the others are kept
+        paper.authors_list = [self.author_rep('John', 'Smith'), paper.authors_list[1]]
+        assert str(paper.authors[0]) == 'John Smith'
+        assert paper.authors[1] is authors[1]
+
+    def test_authors_no_dict(self):
+        paper = Paper(authors_list=[self.author_rep('John', 'Doe')])
+        author = paper.authors[0]
+        assert not hasattr(author, '__dict__')
+        assert author.json() == {'name': {'first': 'John', 'last': 'Doe'}}
+        author.check_mandatory_fields()
+
+    def test_authors_changed(self):
+        paper = Paper(authors_list=[self.author_rep('John', 'Doe')])
+        author = paper.authors[0]
+        author.name = BareName.create_bare('Jane', 'Doe')
+        author.orcid = '0000-0002-8612-8827'
+        assert author.serialize()['name']['first'] == 'Jane'
+        # The stored authors are left unchanged
+        assert paper.authors_list == [self.author_rep('John', 'Doe')]
+        assert str(paper.authors[0]) == 'John Doe'
+        assert paper.authors[0].orcid is None
+
+    @pytest.mark.usefixtures('db')
+    def test_authors_researcher(self, django_assert_num_queries):
+        researcher = Researcher.create_by_name('John', 'Doe')
+        paper = Paper(authors_list=[self.author_rep('John', 'Doe', researcher.pk), self.author_rep('Jane', 'Doe')])
+        with django_assert_num_queries(0):
+            authors = paper.authors
+        with django_assert_num_queries(1):
+            assert [a.researcher for a in authors] == [researcher, None]
+            assert [a.is_known for a in paper.authors] == [True, False]
+
+    def test_prefetch_for_display(self, dummy_oairecord, user_isaac_newton, django_assert_num_queries):
+        researcher = Researcher.create_by_name('Isaac', 'Newton', user=user_isaac_newton)
+        paper = dummy_oairecord.about
+        paper.authors_list = [self.author_rep('Isaac', 'Newton', researcher.pk), self.author_rep('John', 'Doe')]
+        paper.save()
+        paper.todolist.add(user_isaac_newton)
+        researcher_url = researcher.url
+        source_identifier = dummy_oairecord.source.identifier
+
+        paper = Paper.objects.get(pk=paper.pk)
+        # Records, researchers, deposits and to-do list
+        with django_assert_num_queries(4):
+            Paper.prefetch_for_display([paper, None], user_isaac_newton)
+        with django_assert_num_queries(0):
+            assert paper.owners == [user_isaac_newton]
+            assert paper.displayed_authors()[0].researcher.url == researcher_url
+            assert [r.source.identifier for r in paper.oairecords] == [source_identifier]
+            assert not paper.is_deposited
+            assert paper.on_todolist(user_isaac_newton)
+
+    def test_invalidate_cache(self, dummy_paper, django_assert_num_queries):
+        version = dummy_paper.cache_version
+        with django_assert_num_queries(1):
+            dummy_paper.invalidate_cache()
+        assert dummy_paper.cache_version > version
+        assert Paper.objects.get(pk=dummy_paper.pk).cache_version == dummy_paper.cache_version
+
+    def test_save_fields_changes_cache_version(self, dummy_paper):
+        version = dummy_paper.cache_version
+        dummy_paper.title = 'A new title'
+        dummy_paper.save(update_fields=['title'])
+        assert Paper.objects.get(pk=dummy_paper.pk).cache_version > version
+
+    def test_save_other_fields_keeps_cache_version(self, dummy_paper):
+        version = Paper.objects.get(pk=dummy_paper.pk).cache_version
+        dummy_paper.task = 'some-task-id'
+        dummy_paper.save(update_fields=['task'])
+        assert Paper.objects.get(pk=dummy_paper.pk).cache_version == version
+
+    def test_update_availability_changes_cache_version(self, dummy_paper, monkeypatch):
+        version = dummy_paper.cache_version
+        # Saving is enough, without a separate update
+        monkeypatch.setattr(Paper, 'invalidate_cache', None)
+        dummy_paper.update_availability()
+        assert Paper.objects.get(pk=dummy_paper.pk).cache_version > version
+
 
 @pytest.mark.usefixtures('db', 'mock_doi')
 class TestPaperDOIUsage():
@@ -101,6 +202,35 @@ class TestPaperDOIUsage():
         assert p.publications[0].doi == '10.1109/synasc.2010.88'
         print(p.publications[0].last_update)
 
+    def test_get_by_dois(self):
+        p = Paper.create_by_doi('10.1109/sYnAsc.2010.88')
+        papers = Paper.get_by_dois(['10.1109/SYNASC.2010.88', '10.1021/cen-v043n050.p033', 'not a doi'])
+        assert papers == {'10.1109/synasc.2010.88': p}
+
+    def test_prefetch_for_index(self, django_assert_num_queries):
+        from papers.search_indexes import PaperIndex
+        papers = [Paper.create_by_doi('10.1109/sYnAsc.2010.88'), Paper.create_by_doi('10.1007/BF02702259')]
+        papers = list(Paper.objects.filter(pk__in=[p.pk for p in papers]))
+        index = PaperIndex()
+        with django_assert_num_queries(2):
+            index.prefetch(papers)
+        with django_assert_num_queries(0):
+            docs = [index.full_prepare(p) for p in papers]
+        assert [doc['django_id'] for doc in docs] == [str(p.pk) for p in papers]
+
+    def test_prefetched_for_index(self, django_assert_num_queries):
+        from papers.search_indexes import PaperIndex
+        papers = [Paper.create_by_doi('10.1109/sYnAsc.2010.88'), Paper.create_by_doi('10.1007/BF02702259')]
+        papers = list(Paper.objects.filter(pk__in=[p.pk for p in papers]))
+        index = PaperIndex()
+        with index.prefetched(papers):
+            with django_assert_num_queries(0):
+                docs = [index.full_prepare(p) for p in papers]
+        assert [doc['django_id'] for doc in docs] == [str(p.pk) for p in papers]
+        # The prefetched data does not stay on the papers
+        for p in papers:
+            assert p.cached_oairecords is None
+            assert not hasattr(p, 'researcher_institutions')
 
     def test_create_by_doi_no_authors(self):
         p = Paper.create_by_doi('10.1021/cen-v043n050.p033')
@@ -290,6 +420,28 @@ class TestResearcher:
         assert r.institution.name == 'Ecole Normale Superieure'
 
 
+    def test_batch(self):
+        existing = Researcher.create_by_name('John', 'Doe', orcid='0000-0002-8612-8827')
+        profiles = [(orcid, OrcidProfileStub(orcid)) for orcid in
+            ['0000-0002-8612-8827', '0000-0002-6293-3231', '0000-0001-6723-6833']]
+        researchers = Researcher.get_or_create_by_orcid_batch(profiles, update=True)
+        assert researchers['0000-0002-8612-8827'].pk == existing.pk
+        assert Researcher.objects.get(pk=existing.pk).name.last == 'Delpeuch'
+        assert researchers['0000-0002-6293-3231'] == Researcher.objects.get(orcid='0000-0002-6293-3231')
+        assert researchers['0000-0001-6723-6833'].name.full == 'philipp boersch-supan'
+
+        # Without update, the researchers are returned as they are
+        Researcher.objects.filter(pk=existing.pk).update(homepage='https://dissem.in/')
+        researchers = Researcher.get_or_create_by_orcid_batch(profiles[:1])
+        assert researchers['0000-0002-8612-8827'].homepage == 'https://dissem.in/'
+
+    def test_name_batch(self):
+        existing = Name.lookup_name(('John', 'Doe'))
+        names = Name.get_or_create_batch([('John', 'Doe'), ('Jane', 'Doe'), None, ('', ''), ('Jane', 'Doe')])
+        assert names[0] == existing
+        assert names[1].pk is not None and names[1] == names[4]
+        assert names[2] is None and names[3] is None
+
     def test_name_conflict(self):
         # Both are called "John Doe"
         r1 = Researcher.get_or_create_by_orcid('0000-0002-3037-8851',
@@ -327,6 +479,74 @@ class OaiRecordTest(django.test.TestCase):
         OaiRecord.find_duplicate_records(
             paper, 'ftp://dissem.in/paper.pdf', None)
 
+    def create_record(self, paper, identifier, splash_url, pdf_url=None):
+        return OaiRecord.objects.create(
+            about=paper, source=self.source[0], identifier=identifier,
+            splash_url=splash_url, pdf_url=pdf_url)
+
+    def test_url_key(self):
+        self.assertEqual(OaiRecord.url_key('https://dissem.in/paper'), '://dissem.in/paper')
+        self.assertEqual(OaiRecord.url_key('http://dissem.in/paper'), '://dissem.in/paper')
+        self.assertEqual(OaiRecord.url_key('https://doi.org/10.1007/BF02702259'), '10.1007/bf02702259')
+        self.assertEqual(OaiRecord.url_key('ftp://dissem.in/paper.pdf'), None)
+        self.assertEqual(OaiRecord.url_key(None), None)
+
+    def test_find_duplicate_records(self):
+        paper = Paper.get_or_create('this is a title', [Name.lookup_name(('Jean', 'Saisrien'))],
+                                    datetime.date(year=2015, month=0o5, day=0o4))
+        other_paper = Paper.get_or_create('this is another title', [Name.lookup_name(('Jean', 'Saisrien'))],
+                                    datetime.date(year=2015, month=0o5, day=0o4))
+        record = self.create_record(paper, 'oai:1', 'http://dissem.in/1', 'http://dissem.in/1.pdf')
+        self.assertEqual(record.splash_key, '://dissem.in/1')
+        self.assertEqual(record.pdf_key, '://dissem.in/1.pdf')
+        # same splash url in https
+        self.assertEqual(OaiRecord.find_duplicate_records(paper, 'https://dissem.in/1', None), record)
+        # same pdf url
+        self.assertEqual(OaiRecord.find_duplicate_records(paper, 'http://dissem.in/2', 'https://dissem.in/1.pdf'), record)
+        # no match
+        self.assertEqual(OaiRecord.find_duplicate_records(paper, 'http://dissem.in/2', None), None)
+        # records of other papers are not duplicates
+        self.assertEqual(OaiRecord.find_duplicate_records(other_paper, 'http://dissem.in/1', None), None)
+
+    def test_find_duplicate_records_without_keys(self):
+        """
+        Records saved before the keys existed are found as well
+        """
+        paper = Paper.get_or_create('this is a title', [Name.lookup_name(('Jean', 'Saisrien'))],
+                                    datetime.date(year=2015, month=0o5, day=0o4))
+        record = self.create_record(paper, 'oai:1', 'http://dissem.in/1')
+        OaiRecord.objects.filter(pk=record.pk).update(splash_key=None, pdf_key=None)
+        self.assertEqual(OaiRecord.find_duplicate_records(paper, 'https://dissem.in/1', None), record)
+
+    def test_find_duplicate_records_without_keys_limit(self):
+        """
+        At most MAX_OAIRECORDS_PER_PAPER records without keys are considered
+        """
+        paper = Paper.get_or_create('this is a title', [Name.lookup_name(('Jean', 'Saisrien'))],
+                                    datetime.date(year=2015, month=0o5, day=0o4))
+        first = self.create_record(paper, 'oai:1', 'http://dissem.in/1')
+        second = self.create_record(paper, 'oai:2', 'http://dissem.in/2')
+        OaiRecord.objects.filter(pk__in=[first.pk, second.pk]).update(splash_key=None, pdf_key=None)
+        with patch('papers.models.MAX_OAIRECORDS_PER_PAPER', 1):
+            self.assertEqual(OaiRecord.find_duplicate_records(paper, 'https://dissem.in/1', None), first)
+            self.assertEqual(OaiRecord.find_duplicate_records(paper, 'https://dissem.in/2', None), None)
+
+    def test_find_duplicate_records_batch(self):
+        paper = Paper.get_or_create('this is a title', [Name.lookup_name(('Jean', 'Saisrien'))],
+                                    datetime.date(year=2015, month=0o5, day=0o4))
+        other_paper = Paper.get_or_create('this is another title', [Name.lookup_name(('Jean', 'Saisrien'))],
+                                    datetime.date(year=2015, month=0o5, day=0o4))
+        record = self.create_record(paper, 'oai:1', 'http://dissem.in/1')
+        other_record = self.create_record(other_paper, 'oai:2', 'http://dissem.in/2')
+        with self.assertNumQueries(1):
+            duplicates = OaiRecord.find_duplicate_records_batch([
+                (paper, 'https://dissem.in/1', None),
+                (other_paper, 'https://dissem.in/2', None),
+                (other_paper, 'https://dissem.in/1', None),
+                (None, 'https://dissem.in/1', None),
+            ])
+        self.assertEqual(duplicates, [record, other_record, None, None])
+
 
 def load_tests(loader, tests, ignore):
     tests.addTests(doctest.DocTestSuite(papers.doi))
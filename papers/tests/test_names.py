@@ -22,11 +22,16 @@
 
 
 import doctest
+import pytest
+import random
+import time
 import unittest
 
 import papers.name
 from papers.name import match_names
+from papers.name import NormalizedName
 from papers.name import name_similarity
+from papers.name import normalize_name
 from papers.name import name_unification
 from papers.name import normalize_name_words
 from papers.name import parse_comma_name
@@ -230,6 +235,10 @@ class NameSimilarityTest(unittest.TestCase):
         self.assertAlmostEqual(
                 name_similarity(('W. Timothy', 'Gowers'), ('Timothy', 'Gowers')), 0.7)
 
+    def test_transliterated(self):
+        self.assertAlmostEqual(
+                name_similarity(('伟', 'Smith'), ('Wei', 'Smith')), 0.8)
+
     def test_mismatch(self):
         self.assertAlmostEqual(
                 name_similarity(('Robin K.', 'Ryder'), ('Robin J.', 'Ryder')), 0)
@@ -512,6 +521,39 @@ class UnifyNameListsTest(unittest.TestCase):
             [('Clément', 'Pit-Claudel')])[0][1],
             (0,0))
 
+    def test_different_orders(self):
+        # the accented and unaccented last names used to be sorted apart
+        self.assertEqual(unify_name_lists(
+            [('R. J.', 'Muller'), ('Anne', 'Doe')],
+            [('J.', 'Müller'), ('A.', 'Doe')]),
+            [(('R. J.', 'Muller'), (0, 0)), (('Anne', 'Doe'), (1, 1))])
+        self.assertEqual(unify_name_lists(
+            [('John', 'Smith'), ('Jean-Pierre', 'Le Floch'), ('Marie', 'Curie')],
+            [('J.-P.', 'Le Floch-Émery'), ('M.', 'Curie'), ('J.', 'Smith'), ('Anne', 'Doe')]),
+            [(('John', 'Smith'), (0, 2)), (('Jean-Pierre', 'Le Floch'), (1, 0)),
+             (('Marie', 'Curie'), (2, 1)), (('Anne', 'Doe'), (None, 3))])
+
+    def test_most_similar_first(self):
+        self.assertEqual(unify_name_lists(
+            [('W.', 'Zhang'), ('Wei', 'Zhang'), ('Li', 'Wang')],
+            [('Wei', 'Zhang'), ('L.', 'Wang'), ('Hua', 'Zhang')]),
+            [(('W.', 'Zhang'), (0, None)), (('Wei', 'Zhang'), (1, 0)),
+             (('Li', 'Wang'), (2, 1)), (('Hua', 'Zhang'), (None, 2))])
+        self.assertEqual(unify_name_lists(
+            [('Robin J.', 'Ryder'), ('John', 'Ryder')],
+            [('R. J.', 'Ryder'), ('Jean-Pierre', 'Ryder')]),
+            [(('Robin J.', 'Ryder'), (0, 0)), (('John', 'Ryder'), (1, 1))])
+
+    def test_leftovers(self):
+        self.assertEqual(unify_name_lists(
+            [('Robin J.', 'Ryder'), ('Antonin', 'Delpeuch'), ('Jean', 'Dupont')],
+            [('R. J.', 'Ryder'), ('A.', 'Delpeuch')]),
+            [(('Robin J.', 'Ryder'), (0, 0)), (('Antonin', 'Delpeuch'), (1, 1)),
+             (('Jean', 'Dupont'), (2, None))])
+        self.assertEqual(unify_name_lists(
+            [], [('Jean', 'Dupont'), ('Marie', 'Dupont')]),
+            [(('Jean', 'Dupont'), (None, 0)), (('Marie', 'Dupont'), (None, 1))])
+
     def test_inverted(self):
         # in the wild:
         # https://doi.org/10.1371/journal.pone.0156198
@@ -528,6 +570,16 @@ class UnifyNameListsTest(unittest.TestCase):
             ]) if x[0] != None]),
             3)
 
+    def test_same_as_original(self):
+        # the unified lists are the same as with the original implementation
+        rng = random.Random(42)
+        for _ in range(300):
+            a = random_author_list(rng, rng.randint(0, 30))
+            b = [rng.choice(abbreviations)(name) for name in a if rng.random() < 0.8]
+            b += random_author_list(rng, rng.randint(0, 5))
+            rng.shuffle(b)
+            self.assertEqual(unify_name_lists(a, b), original_unify_name_lists(a, b))
+
     def test_match_first_names(self):
         self.assertTrue(match_first_names(('A','Amanda')))
         self.assertTrue(match_first_names(('Amanda','Amanda')))
@@ -537,6 +589,183 @@ class UnifyNameListsTest(unittest.TestCase):
         self.assertTrue(match_first_names(('Clément','Clement')))
 
 
+class NormalizedNameTest(unittest.TestCase):
+
+    def test_forms(self):
+        n = NormalizedName('Jp. Marie', 'Le Floch-Émery')
+        self.assertEqual(n.first_words, ('J', 'P', 'Marie'))
+        self.assertEqual(n.initials, ('J', 'P', 'M'))
+        self.assertEqual(n.unaccented_first_words, ('J', 'P', 'marie'))
+        self.assertEqual(n.unaccented_last, 'le floch-emery')
+        self.assertEqual(n.last_key, 'le floch emery')
+
+    def test_pair(self):
+        n = NormalizedName('John', 'Doe')
+        self.assertEqual(n, ('John', 'Doe'))
+        self.assertEqual(tuple(n), ('John', 'Doe'))
+        self.assertEqual(n[1], 'Doe')
+        self.assertEqual(NormalizedName.of(n), n)
+        self.assertEqual(hash(n), hash(NormalizedName.of(('John', 'Doe'))))
+
+    def test_immutable(self):
+        n = NormalizedName('John', 'Doe')
+        with self.assertRaises(AttributeError):
+            n.last = 'Smith'
+        with self.assertRaises(AttributeError):
+            n.middle = 'Z.'
+
+    def test_matching(self):
+        a = NormalizedName('Robin J.', 'Ryder')
+        b = ('R.', 'Ryder')
+        self.assertEqual(name_similarity(a, b), name_similarity(tuple(a), b))
+        self.assertEqual(shallower_name_similarity(a, b), shallower_name_similarity(tuple(a), b))
+        self.assertEqual(name_unification(a, b), ('Robin J.', 'Ryder'))
+        self.assertTrue(match_names(a, NormalizedName(*b)))
+        self.assertEqual(unify_name_lists([a], [b]), [(('Robin J.', 'Ryder'), (0, 0))])
+
+
+def original_unify_name_lists(a, b):
+    """
+    The implementation of :func:`unify_name_lists` before names were
+    normalized once, to check that the results do not change.
+    """
+    a = sorted(enumerate(a), key=lambda idx_first_last: (idx_first_last[1][1], idx_first_last[1][0]))
+    b = sorted(enumerate(b), key=lambda idx_first_last1: (idx_first_last1[1][1], idx_first_last1[1][0]))
+
+    iA = 0
+    iB = 0
+    lenA = float(len(a))
+    lenB = float(len(b))
+    result = []
+    while iA < len(a) or iB < len(b):
+        if iA == len(a):
+            idxB = b[iB][0]
+            rankB = (idxB+1)/lenB
+            result.append((b[iB][1], (rankB+1)/lenB, (None, idxB)))
+            iB += 1
+        elif iB == len(b):
+            idxA = a[iA][0]
+            rankA = (idxA+1)/lenA
+            result.append((a[iA][1], (rankA+1)/lenA, (idxA, None)))
+            iA += 1
+        else:
+            idxA = a[iA][0]
+            idxB = b[iB][0]
+            nameA = a[iA][1]
+            nameB = b[iB][1]
+            rankA = (idxA+1)/lenA
+            rankB = (idxB+1)/lenB
+
+            unified = name_unification(nameA, nameB)
+            if unified is not None:
+                result.append((unified, 0.5*(rankA+rankB), (idxA, idxB)))
+                iA += 1
+                iB += 1
+            elif shallower_name_similarity(nameA, nameB) > 0.:
+                result.append((nameA, rankA, (idxA, idxB)))
+                iA += 1
+                iB += 1
+            elif nameA[1] == nameB[1]:
+                result.append((nameA, rankA, (idxA, None)))
+                result.append((nameB, rankB, (None, idxB)))
+                iA += 1
+                iB += 1
+            elif nameA[1] < nameB[1]:
+                result.append((nameA, rankA, (idxA, None)))
+                iA += 1
+            else:
+                result.append((nameB, rankB, (None, idxB)))
+                iB += 1
+
+    result = [(name, idx) for name, _, idx in sorted(result, key=lambda x: x[1])]
+
+    def make_unique(lst):
+        seen = set()
+        for name, idx in lst:
+            first, last = name
+            [k1, k2] = sorted([first.lower(), last.lower()])
+            if (k1, k2) not in seen:
+                seen.add((k1, k2))
+                yield (name, idx)
+            else:
+                yield (None, idx)
+
+    return list(make_unique(result))
+
+
+#: Ways another source can spell the same author
+abbreviations = [
+    lambda name: name,
+    lambda name: (name[0][:1]+'.', name[1]),
+    lambda name: (name[0].upper(), name[1]),
+    lambda name: (name[0], name[1].replace('-', ' ')),
+    lambda name: (name[0], 'van der '+name[1]),
+    lambda name: (name[0].split(' ')[0], name[1]),
+]
+
+
+def random_author_list(rng, nb_authors):
+    """
+    A random author list, with shared last names, accents, hyphens and initials
+    """
+    lasts = ['Berg', 'van der Berg', 'Müller', 'Muller', 'Le Floch', 'Le Floch-Émery', 'Wang', 'Ryder', 'Pit-Claudel']
+    firsts = ['W.', 'Wei', 'Jean-Pierre', 'J.-P.', 'Robin J.', 'R.', 'Élodie', 'Anne', 'A. B.', 'John']
+    return [(rng.choice(firsts), rng.choice(lasts)) for _ in range(nb_authors)]
+
+
+def collaboration_authors(nb_authors):
+    """
+    A synthetic author list of a large collaboration, with many
+    shared last names.
+    """
+    syllables = ['ka', 'lo', 'mi', 'ran', 'te', 'sun', 'vo', 'zhe']
+    common = ['Wang', 'Li', 'Zhang', 'Müller', 'Smith', 'García']
+    firsts = ['Alice', 'Bruno', 'Chen', 'Dmitri', 'Élodie', 'Farid', 'Grace', 'Hiro']
+    authors = []
+    for i in range(nb_authors):
+        if i % 4 == 0:
+            last = common[i % len(common)]
+        else:
+            last = ''.join(syllables[(i // 8**k) % 8] for k in range(3)).capitalize()
+        first = '{} {}'.format(firsts[i % len(firsts)], 'ABCDEFGHJKLMNPRSTUVWZ'[i % 21])
+        authors.append((first, last))
+    return authors
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('authors', [
+    collaboration_authors(3000),
+    [(first, 'Wang') for first, _ in collaboration_authors(4000)],
+], ids=['3000 authors', '4000 authors with the same last name'])
+def test_benchmark_unify_name_lists(authors):
+    """
+    Unifies the author list of a large collaboration with the same list
+    where first names are abbreviated, as another source would give it,
+    and compares with the original implementation.
+    """
+    abbreviated = [(first[0]+'.', last) for first, last in authors]
+
+    start = time.perf_counter()
+    original = original_unify_name_lists(authors, abbreviated)
+    before = time.perf_counter() - start
+
+    normalize_name.cache_clear()
+    start = time.perf_counter()
+    unified = unify_name_lists(authors, abbreviated)
+    cold = time.perf_counter() - start
+
+    # Merging the same paper again, the names are normalized already
+    start = time.perf_counter()
+    unify_name_lists(authors, abbreviated)
+    warm = time.perf_counter() - start
+
+    print()
+    print('original implementation: {:.0f} authors/sec'.format(len(authors) / before))
+    print('unify_name_lists: {:.0f} authors/sec'.format(len(authors) / cold))
+    print('unify_name_lists, names normalized already: {:.0f} authors/sec'.format(len(authors) / warm))
+    assert unified == original
+
+
 def load_tests(loader, tests, ignore):
     tests.addTests(doctest.DocTestSuite(papers.name))
     return tests
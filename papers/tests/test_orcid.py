@@ -26,6 +26,8 @@ import json
 import requests
 import os
 
+from mock import patch
+
 from papers.orcid import OrcidProfile
 from papers.orcid import OrcidWorkSummary
 from papers.orcid import OrcidWork
@@ -283,6 +285,17 @@ class OrcidProfileTest(unittest.TestCase):
         pubtypes = [work.pubtype for work in works]
         self.assertTrue('journal-article' in pubtypes)
 
+    def test_works_offline(self):
+        profile = OrcidProfileStub('0000-0001-6723-6833')
+        bulk = profile.request_element('works/36115041')['bulk']
+        offline = OrcidProfile(orcid_id='0000-0001-6723-6833',
+            json=dict(profile.json, bulk=bulk), offline=True)
+        # No request is sent
+        with patch.object(OrcidProfile, 'request_element', side_effect=AssertionError):
+            self.assertEqual(len(offline.work_summaries), len(profile.work_summaries))
+            works = list(offline.fetch_works([36115041, 19176128]))
+        self.assertEqual([work.put_code for work in works], [36115041])
+
 
 class OrcidWorkTest(unittest.TestCase):
     @classmethod
@@ -25,6 +25,7 @@ from allauth.socialaccount.signals import pre_social_login
 from allauth.account.signals import user_logged_in
 from haystack.generic_views import SearchView
 
+from django.conf import settings
 from django.contrib.auth.decorators import user_passes_test
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.core.exceptions import ObjectDoesNotExist
@@ -142,6 +143,7 @@ class PaperSearchView(SearchView):
         We add some context data.
         """
         context = super().get_context_data(**kwargs)
+        self.load_results(context['object_list'])
         search_description = _('Papers')
         query_string = self.request.META.get('QUERY_STRING', '')
         context['breadcrumbs'] = [(search_description, '')]
@@ -178,6 +180,45 @@ class PaperSearchView(SearchView):
 
         return context
 
+    def paginate_queryset(self, queryset, page_size):
+        """
+        Fetches the requested page first: the search request also returns
+        the number of results and the statistics, so that paginating and
+        computing the statistics do not need other requests.
+        """
+        page = self.kwargs.get(self.page_kwarg) or self.request.GET.get(self.page_kwarg) or 1
+        try:
+            start = (int(page) - 1) * page_size
+        except ValueError:
+            # 'last' or an invalid page, handled by the paginator
+            start = -1
+        if start >= 0:
+            # Slicing runs the search request
+            queryset[start:start + page_size]
+        return super().paginate_queryset(queryset, page_size)
+
+    def load_results(self, results):
+        """
+        Loads the papers of a page of results, with what is needed to
+        display them, with a fixed number of queries.
+        """
+        papers = Paper.objects.in_bulk([int(result.pk) for result in results])
+        for result in results:
+            result.object = papers.get(int(result.pk))
+        Paper.prefetch_for_display(
+            [result.object for result in results], self.request.user)
+
+    def get_queryset(self):
+        """
+        Anonymous visitors request the same pages (researchers, statuses,
+        document types…) again and again: without full text query,
+        their results are cached for a short time.
+        """
+        queryset = super().get_queryset()
+        if not self.request.user.is_authenticated and not self.request.GET.get(self.search_field):
+            queryset = queryset.cached(settings.SEARCH_CACHE_TIMEOUT)
+        return queryset
+
     def get_form_kwargs(self):
         """
         We make sure the search is valid even if no parameter
@@ -351,7 +392,7 @@ def refetch_researcher(request, pk):
     if researcher.user != request.user and not (request.user.is_staff or request.user.is_superuser):
         return HttpResponseForbidden("Not authorized to update papers for this researcher.")
     from backend.tasks import fetch_everything_for_researcher
-    fetch_everything_for_researcher.delay(pk=pk)
+    fetch_everything_for_researcher.delay(pk=pk, incremental=False)
 
     view_args = {'researcher': researcher.id, 'slug': researcher.slug}
     return redirect(reverse('researcher', kwargs=view_args))
@@ -1,6 +1,10 @@
 """
 Custom Haystack backend to use the aggregations framework of Elasticsearch.
 """
+import hashlib
+import json
+
+from django.core.cache import cache
 from haystack.backends import SQ
 from haystack.backends.elasticsearch_backend import ElasticsearchSearchBackend
 from haystack.backends.elasticsearch_backend import ElasticsearchSearchEngine
@@ -23,6 +27,12 @@ class SearchBackend(ElasticsearchSearchBackend):
         # inspired by https://github.com/django-haystack/django-haystack/issues/621#issuecomment-10833143
         content_field_name, mapping = super(SearchBackend, self).build_schema(fields)
         for field_name, field_mapping in mapping.items():
+            if field_name == "api_json":
+                # only stored, to be served as it is: indexing it
+                # as a single term would fail for long documents
+                field_mapping["index"] = "no"
+                field_mapping.pop("analyzer", None)
+                continue
             if "analyzer" not in field_mapping.keys():
                 # no analyzer to change
                 continue
@@ -51,6 +61,7 @@ class SearchQuery(ElasticsearchSearchQuery):
         self.query_post_filter = None
         self.aggregations = None
         self._aggregation_results = None
+        self.cache_timeout = None
 
     def get_aggregation_results(self):
         if self._aggregation_results is None:
@@ -64,6 +75,9 @@ class SearchQuery(ElasticsearchSearchQuery):
     def set_aggregation_results(self, aggs):
         self.aggregations = aggs
 
+    def set_cache_timeout(self, timeout):
+        self.cache_timeout = timeout
+
     def build_params(self, *args, **kwargs):
         search_kwargs = super(SearchQuery, self).build_params(*args, **kwargs)
 
@@ -96,7 +110,15 @@ class SearchQuery(ElasticsearchSearchQuery):
         final_query = self.build_query()
         search_kwargs = self.build_params(*args, **kwargs)
 
-        results = self.backend.search(final_query, **search_kwargs)
+        results = None
+        if self.cache_timeout:
+            key = search_cache_key(
+                self.backend.index_name, final_query, search_kwargs)
+            results = cache.get(key)
+        if results is None:
+            results = self.backend.search(final_query, **search_kwargs)
+            if self.cache_timeout:
+                cache.set(key, results, self.cache_timeout)
         self._results = results.get('results', [])
         self._hit_count = results.get('hits', 0)
         self._facet_counts = self.post_process_facets(results)
@@ -107,9 +129,22 @@ class SearchQuery(ElasticsearchSearchQuery):
         clone = super(SearchQuery, self)._clone(**kwargs)
         clone.query_post_filter = self.query_post_filter
         clone.aggregations = self.aggregations
+        clone.cache_timeout = self.cache_timeout
         return clone
 
 
+def search_cache_key(*parts):
+    """
+    Cache key of the results of a search request
+    """
+    def serialize(value):
+        if isinstance(value, (set, frozenset)):
+            return sorted(map(str, value))
+        return str(value)
+    parts = json.dumps(parts, sort_keys=True, default=serialize)
+    return 'search:' + hashlib.md5(parts.encode('utf-8')).hexdigest()
+
+
 class SearchEngine(ElasticsearchSearchEngine):
     backend = SearchBackend
     query = SearchQuery
@@ -135,12 +170,23 @@ class SearchQuerySet(haystack.SearchQuerySet):
         """
         Sets the aggs field in the search request.
 
-        Specifies aggregations to be computed.
+        Specifies aggregations to be computed. If they are already
+        set, the results of this query are reused.
         """
+        if self.query.aggregations == aggs:
+            return self
         clone = self._clone()
         clone.query.set_aggregation_results(aggs)
         return clone
 
+    def cached(self, timeout):
+        """
+        Caches the results of the search request for `timeout` seconds.
+        """
+        clone = self._clone()
+        clone.query.set_cache_timeout(timeout)
+        return clone
+
     def get_aggregation_results(self):
         """
         Returns the aggregations field in the search results.
@@ -157,5 +203,8 @@ class EmptySearchQuerySet(haystack.EmptySearchQuerySet):
     def aggregations(self, aggs):
         return self
 
+    def cached(self, timeout):
+        return self
+
     def get_aggregation_results(self):
         return {}
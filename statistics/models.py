@@ -76,6 +76,11 @@ STATUS_QUERYSET_FILTER = {
     'closed': lambda q: q.filter(pdf_url__isnull=True, oa_status='NOK'),
     }
 
+#: Aggregation of the search results by combined status
+STATUS_AGGREGATIONS = {
+    "status": {"terms": {"field": "combined_status_exact"}},
+}
+
 STATUS_TO_COLOR = {
     'oa' : 'gold',
     'ok' : 'green',
@@ -164,9 +169,11 @@ class BareAccessStatistics(object):
 
     @classmethod
     def from_search_queryset(cls, qs):
-        qs = qs.aggregations({
-         "status": {"terms": {"field": "combined_status_exact"}},
-        })
+        """
+        :param qs: a search queryset of papers. If it was already run
+            with the status aggregations, no other request is made.
+        """
+        qs = qs.aggregations(STATUS_AGGREGATIONS)
         aggregations = qs.get_aggregation_results() or {}
         status = aggregations.get('status', {'buckets':[]})
         buckets = {
@@ -21,13 +21,18 @@ Tests statistics update and statistics consistency.
 """
 
 from statistics.models import BareAccessStatistics
+from statistics.models import STATUS_AGGREGATIONS
 from django.core.management import call_command
 import haystack
 import pytest
+import uuid
 from django.test import TestCase
+from mock import patch
 
 from papers.models import Paper
 from papers.models import PaperWorld
+from search import SearchBackend
+from search import SearchQuerySet
         
 @pytest.mark.usefixtures('fetch_crossref_profile')
 class StatisticsTest(TestCase):
@@ -74,5 +79,23 @@ class StatisticsTest(TestCase):
         pw.update_stats()
         self.validStats(pw.stats)
 
+    def test_from_search_queryset_after_search(self):
+        sqs = SearchQuerySet().models(Paper).aggregations(STATUS_AGGREGATIONS)
+        self.assertEqual(len(sqs[:2]), 2)
+        # The page of results came with the count and the statistics
+        with patch.object(SearchBackend, 'search') as search:
+            stats = BareAccessStatistics.from_search_queryset(sqs)
+            self.assertEqual(sqs.count(), stats.num_tot)
+        search.assert_not_called()
+        self.validStats(stats)
+
+    def test_cached_search(self):
+        # A query which has not been cached by other runs
+        sqs = SearchQuerySet().models(Paper).exclude(text=uuid.uuid4().hex)
+        count = sqs.cached(60).count()
+        with patch.object(SearchBackend, 'search') as search:
+            self.assertEqual(sqs.cached(60).count(), count)
+        search.assert_not_called()
+
 # TODO check journal and publisher stats
 # TODO check that (for instance) department stats add up to institution stats